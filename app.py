@@ -1,12 +1,30 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import (Flask, Response, render_template, request, jsonify, redirect, url_for, flash,
+                   g, has_request_context, session, stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_bcrypt import Bcrypt
 from datetime import datetime, timedelta
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import json
 import os
+import struct
+import time
 from config import get_config
+from cache import create_cache, create_ttl_cache, TTLCache
+from metrics import create_metrics, instrument
+from passwords import PasswordHasher, PasswordHasherBusy
+from queries import HotQueries, prepared_statement_options
+from replicas import RoutingSession, create_replica_router
+from write_buffer import WriteBuffer
 import random
-from sqlalchemy import func, case
+from sqlalchemy import func, case, cast, insert, and_, or_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.util import await_only
 
 # Create Flask app
 app = Flask(__name__)
@@ -16,11 +34,43 @@ env = os.environ.get('FLASK_ENV', 'development')
 app.config.from_object(get_config(env))
 
 # Initialize extensions
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession},
+                engine_options=prepared_statement_options(app.config['SQLALCHEMY_DATABASE_URI'],
+                                                          app.config.get('PREPARE_THRESHOLD')))
+replica_router = create_replica_router(app.config.get('REPLICA_DATABASE_URLS'),
+                                       app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+                                       app.config.get('REPLICA_CHECK_SECONDS', 5))
+if replica_router is not None:
+    replica_router.init_app(app)
 bcrypt = Bcrypt(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+dashboard_cache = create_cache(app.config.get('DASHBOARD_CACHE', 'memory'),
+                               app.config.get('DASHBOARD_CACHE_MAX_BYTES', 16 * 1024 * 1024),
+                               app.config.get('DASHBOARD_CACHE_TTL', 60))
+# Rendered class reports, keyed by class, month and data version
+report_cache = create_cache(app.config.get('REPORT_CACHE', 'memory'),
+                            app.config.get('REPORT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+# Requests of the async read path (asgi.py) carry a session of the async
+# engine; the view runs in a greenlet and its queries await the database
+ASYNC_SESSION_ENVIRON_KEY = 'tracker.async_session'
+
+def off_event_loop(function, *args):
+    """Call ``function``, on the async read path on a thread of the event loop.
+
+    The SQLite caches and metrics and a write buffer flush block; in the
+    greenlet of an async request they would hold up every request of the loop.
+    """
+    if has_request_context() and ASYNC_SESSION_ENVIRON_KEY in request.environ:
+        return await_only(asyncio.get_running_loop().run_in_executor(None, function, *args))
+    return function(*args)
+
+metrics = create_metrics(app.config.get('METRICS', 'memory'))
+instrument(app, metrics, app.config.get('SLOW_REQUEST_MS', 0), run=off_event_loop)
+password_hasher = PasswordHasher(app.config.get('BCRYPT_LOG_ROUNDS', 12),
+                                 app.config.get('PASSWORD_HASH_CONCURRENCY', 1),
+                                 metrics)
 
 # Models
 class User(UserMixin, db.Model):
@@ -36,19 +86,104 @@ class User(UserMixin, db.Model):
     is_active = db.Column(db.Boolean, default=True)
     activities = db.relationship('Activity', backref='user', lazy=True)
     activity_stats = db.relationship('ActivityStats', backref='user', lazy=True)
+    
+    # Admin listing filters and prefix search
+    __table_args__ = (
+        db.Index('idx_users_class_active', 'class_name', 'is_active'),
+        db.Index('idx_users_student_number', 'student_number',
+                 postgresql_ops={'student_number': 'text_pattern_ops'}),
+        db.Index('idx_users_username_lower', func.lower(username).label('username_lower'),
+                 postgresql_ops={'username_lower': 'text_pattern_ops'}),
+        db.Index('idx_users_full_name_lower', func.lower(full_name).label('full_name_lower'),
+                 postgresql_ops={'full_name_lower': 'text_pattern_ops'}),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'username': self.username,
+            'email': self.email,
+            'full_name': self.full_name,
+            'student_number': self.student_number,
+            'class_name': self.class_name,
+            'is_admin': self.is_admin,
+            'is_active': self.is_active
+        }
 
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.check(self.password_hash, password)
+
+class UserIdentity(UserMixin):
+    """Logged-in user built from cached ``User.to_dict()`` fields, without a query."""
+
+    def __init__(self, fields):
+        self._fields = fields
+
+    def __getattr__(self, name):
+        try:
+            return self._fields[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @property
+    def is_active(self):
+        return self._fields['is_active']
+
+# Activity catalog: (name, aliases, numeric) in display order. Aliases are
+# names earlier versions wrote for the same activity.
+DEFAULT_ACTIVITIES = (
+    ('Subuh', ('Sholat Subuh',), False),
+    ('Dzuhur', ('Sholat Dzuhur',), False),
+    ('Ashar', ('Sholat Ashar',), False),
+    ('Maghrib', ('Sholat Maghrib',), False),
+    ('Isya', ('Sholat Isya',), False),
+    ('Rowatib', (), True),
+    ('Qiyamulail', (), False),
+    ('Dhuha', (), False),
+    ('Tilawah Qur\'an', ('Membaca Al-Quran',), True),
+    ('Puasa', (), False),
+    ('Al-Ma\'tsurat Pagi', ('Dzikir Pagi',), False),
+    ('Al-Ma\'tsurat Sore', ('Dzikir Petang',), False),
+    ('Ar Rahman', (), False),
+    ('Al Waqiah', (), False),
+    ('Ad Dukhan', (), False),
+    ('As Sajadah', (), False),
+    ('Al Mulk', (), False),
+    ('Yaasin', (), False),
+    ('Al Kahfi', (), False),
+    ('Olahraga', (), False)
+)
+
+class ActivityDefinition(db.Model):
+    """An activity users can track, referenced by ``activities.activity_id``."""
+    __tablename__ = 'activity_catalog'
+    id = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    aliases = db.Column(db.JSON, nullable=False, default=list)
+    is_numeric = db.Column(db.Boolean, nullable=False, default=False)
+    display_order = db.Column(db.SmallInteger, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'aliases': list(self.aliases or []),
+            'is_numeric': self.is_numeric,
+            'display_order': self.display_order
+        }
+
+    def __repr__(self):
+        return f'<ActivityDefinition {self.id} {self.name}>'
 
 class Activity(db.Model):
     __tablename__ = 'activities'
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
-    name = db.Column(db.String(100), nullable=False, index=True)
+    activity_id = db.Column(db.SmallInteger, db.ForeignKey('activity_catalog.id'), nullable=False)
     date = db.Column(db.Date, nullable=False, index=True)
     completed = db.Column(db.Boolean, default=False, index=True)
     value = db.Column(db.Integer, nullable=True)  # For numeric activities like Rowatib and Tilawah
@@ -57,8 +192,13 @@ class Activity(db.Model):
     
     __table_args__ = (
         db.Index('idx_user_date', 'user_id', 'date'),
-        db.Index('idx_user_name_date', 'user_id', 'name', 'date')
+        # One row per user, activity and day; also the conflict target of upsert_activities()
+        db.Index('idx_user_activity_date', 'user_id', 'activity_id', 'date', unique=True)
     )
+
+    @property
+    def name(self):
+        return activity_catalog.name_of(self.activity_id)
     
     def to_dict(self):
         return {
@@ -75,21 +215,1121 @@ class Activity(db.Model):
     def __repr__(self):
         return f'<Activity {self.name} on {self.date}>'
 
+class ActivityCatalog:
+    """Activity definitions of the catalog table, loaded once per process.
+
+    Names and aliases resolve to the same definition. An unknown id or name
+    reloads the table, at most once per ``reload_interval`` seconds, so
+    definitions added by a migration or another worker are picked up.
+    """
+
+    def __init__(self, reload_interval=5):
+        self.reload_interval = reload_interval
+        self._by_id = None
+        self._by_name = None
+        self._loaded = None
+
+    def load(self):
+        definitions = [definition.to_dict() for definition in ActivityDefinition.query.order_by(
+            ActivityDefinition.display_order, ActivityDefinition.id)]
+        by_name = {}
+        for definition in definitions:
+            for alias in definition['aliases']:
+                by_name[alias] = definition
+        for definition in definitions:
+            by_name[definition['name']] = definition
+        self._by_id = {definition['id']: definition for definition in definitions}
+        self._by_name = by_name
+        self._loaded = time.monotonic()
+
+    def clear(self):
+        self._by_id = self._by_name = self._loaded = None
+
+    def _lookup(self, index, key):
+        if self._loaded is None:
+            self.load()
+        definition = getattr(self, index).get(key)
+        if definition is None and time.monotonic() - self._loaded >= self.reload_interval:
+            self.load()
+            definition = getattr(self, index).get(key)
+        return definition
+
+    def definitions(self):
+        if self._loaded is None:
+            self.load()
+        return list(self._by_id.values())
+
+    def get(self, name):
+        """Definition of a name or alias, None when it is not in the catalog."""
+        return self._lookup('_by_name', name)
+
+    def id_of(self, name):
+        definition = self.get(name)
+        if definition is None:
+            raise ValueError(f'Unknown activity: {name}')
+        return definition['id']
+
+    def name_of(self, activity_id):
+        definition = self._lookup('_by_id', activity_id)
+        if definition is None:
+            raise ValueError(f'Unknown activity id: {activity_id}')
+        return definition['name']
+
+activity_catalog = ActivityCatalog()
+
+def seed_activity_catalog():
+    """Add the DEFAULT_ACTIVITIES missing from the catalog; returns how many were added."""
+    existing = {name for (name,) in db.session.query(ActivityDefinition.name)}
+    next_id = (db.session.query(func.max(ActivityDefinition.id)).scalar() or 0) + 1
+    added = 0
+    for order, (name, aliases, numeric) in enumerate(DEFAULT_ACTIVITIES, 1):
+        if name in existing:
+            continue
+        db.session.add(ActivityDefinition(id=next_id, name=name, aliases=list(aliases),
+                                          is_numeric=numeric, display_order=order))
+        next_id += 1
+        added += 1
+    db.session.flush()
+    activity_catalog.clear()
+    return added
+
+# Activity name used in activity_stats and activity_rollups for all activities
+# of a day together, e.g. the whole-day streak shown on the home page.
+ALL_ACTIVITIES = '*'
+
+def streak_on(current_streak, last_date, day):
+    """Part of the run of ``current_streak`` days ending ``last_date`` that ends on ``day``."""
+    if last_date is None or last_date < day:
+        return 0
+    start = last_date - timedelta(days=current_streak - 1)
+    return (day - start).days + 1 if day >= start else 0
+
 class ActivityStats(db.Model):
+    """Streak store: current and best streak per user and activity.
+
+    Maintained incrementally by ``update_streaks()`` inside the
+    ``POST /api/stats`` transaction; ``rebuild_streaks.py`` rebuilds it from
+    the activities table.
+    """
     __tablename__ = 'activity_stats'  # Explicitly set table name
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     activity_name = db.Column(db.String(100), nullable=False)
-    date = db.Column(db.Date, nullable=False)
-    completed = db.Column(db.Boolean, default=False)
-    streak = db.Column(db.Integer, default=0)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)
+    best_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_date = db.Column(db.Date, nullable=True)  # Last completed day, i.e. end of the current streak
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'activity_name', name='unique_user_activity'),
+    )
+
+    def streak_on(self, day):
+        """Length of the streak still running on ``day``, 0 if ``day`` is not completed."""
+        return streak_on(self.current_streak, self.last_date, day)
+
+    def apply_day(self, day, completed):
+        """Fold one changed day into the stored streak.
+
+        Returns False when the change cannot be applied without rescanning
+        history (e.g. a past day that may join or split older runs).
+        """
+        last = self.last_date
+        if completed:
+            if last is None or day > last + timedelta(days=1):
+                self.current_streak = 1
+            elif day == last + timedelta(days=1):
+                self.current_streak += 1
+            else:
+                # Already inside the current run is a no-op, anything older needs a rescan
+                return day >= last - timedelta(days=self.current_streak - 1)
+            self.last_date = day
+            self.best_streak = max(self.best_streak or 0, self.current_streak)
+            return True
+
+        if last is None or day > last:
+            return True
+        start = last - timedelta(days=self.current_streak - 1)
+        if day < start:
+            # An older run got shorter, which only matters if it was the best one
+            return self.best_streak == self.current_streak
+        if self.best_streak == self.current_streak:
+            return False
+        if day == last:
+            if self.current_streak == 1:
+                return False
+            self.current_streak -= 1
+            self.last_date = day - timedelta(days=1)
+        else:
+            self.current_streak = (last - day).days
+        return True
+
+    def __repr__(self):
+        return f'<ActivityStats {self.activity_name} user={self.user_id} streak={self.current_streak}>'
+
+# Rollup periods from finest to coarsest, weeks are ISO weeks starting on Monday
+ROLLUP_PERIODS = ('day', 'week', 'month', 'year')
+
+def period_start(period, day):
+    """First day of the ``period`` bucket containing ``day``."""
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+class ActivityRollup(db.Model):
+    """Completed and total activity counts per user, activity and period bucket.
+
+    Kept up to date by ``update_rollups()``; ``rebuild_rollups.py`` backfills
+    and verifies it against the activities table.
+    """
+    __tablename__ = 'activity_rollups'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    period = db.Column(db.String(5), nullable=False)  # One of ROLLUP_PERIODS
+    bucket = db.Column(db.Date, nullable=False)  # First day of the period
+    activity_name = db.Column(db.String(100), nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
     __table_args__ = (
-        db.UniqueConstraint('user_id', 'activity_name', 'date', name='unique_user_activity_date'),
+        db.UniqueConstraint('user_id', 'period', 'bucket', 'activity_name', name='unique_user_period_bucket_activity'),
+        # Cohort reports read one period range across all users
+        db.Index('idx_rollup_period_bucket', 'period', 'bucket'),
+    )
+
+    def __repr__(self):
+        return f'<ActivityRollup {self.activity_name} {self.period} {self.bucket}>'
+
+# Packed numeric values of an activity_months row: one little-endian int16 per
+# day of the month, VALUE_UNSET where the day has no value
+MONTH_DAYS = 31
+VALUE_UNSET = -32768
+# Values both storages can hold
+VALUE_MAX = 32767
+VALUES_FORMAT = f'<{MONTH_DAYS}h'
+
+def _popcount(mask):
+    return bin(mask).count('1')
+
+class ActivityMonth(db.Model):
+    """One activity of one user for a whole month, used by ``MonthlyStorage``.
+
+    Bit ``d - 1`` of ``recorded`` is set when day ``d`` has an entry and the
+    same bit of ``completed`` when that entry is completed; numeric values
+    are packed in ``values`` (NULL while the month has none).
+    """
+    __tablename__ = 'activity_months'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    activity_name = db.Column(db.String(100), nullable=False)
+    month = db.Column(db.Date, nullable=False)  # First day of the month
+    recorded = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    values = db.Column(db.LargeBinary, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'activity_name', 'month', name='unique_user_activity_month'),
+    )
+
+    def get_values(self):
+        if self.values is None:
+            return [VALUE_UNSET] * MONTH_DAYS
+        return list(struct.unpack(VALUES_FORMAT, self.values))
+
+    def set_day(self, day, completed, value):
+        bit = 1 << (day.day - 1)
+        self.recorded = (self.recorded or 0) | bit
+        self.completed = ((self.completed or 0) | bit) if completed else ((self.completed or 0) & ~bit)
+        if value is not None or self.values is not None:
+            values = self.get_values()
+            values[day.day - 1] = VALUE_UNSET if value is None else value
+            self.values = struct.pack(VALUES_FORMAT, *values)
+
+    def entries(self, start_date=None, end_date=None):
+        """ActivityEntry for every recorded day, ascending, optionally limited to a range."""
+        values = self.get_values() if self.values is not None else None
+        mask = self.recorded
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            index = low.bit_length() - 1
+            day = self.month + timedelta(days=index)
+            if (start_date and day < start_date) or (end_date and day > end_date):
+                continue
+            value = values[index] if values is not None and values[index] != VALUE_UNSET else None
+            yield ActivityEntry(self.user_id, self.activity_name, day, bool(self.completed & low), value, self.updated_at)
+
+    def __repr__(self):
+        return f'<ActivityMonth {self.activity_name} {self.month} user={self.user_id}>'
+
+class ActivityEntry:
+    """One day of an activity read from ``activity_months``, shaped like ``Activity``."""
+    __slots__ = ('user_id', 'name', 'date', 'completed', 'value', 'updated_at')
+    id = None
+
+    def __init__(self, user_id, name, date, completed, value, updated_at):
+        self.user_id = user_id
+        self.name = name
+        self.date = date
+        self.completed = completed
+        self.value = value
+        self.updated_at = updated_at
+
+    def to_dict(self):
+        return {
+            'id': None,
+            'user_id': self.user_id,
+            'name': self.name,
+            'date': self.date.strftime('%Y-%m-%d'),
+            'completed': self.completed,
+            'value': self.value,
+            'created_at': None,
+            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
+        }
+
+class SyncReceipt(db.Model):
+    """Client generated id of a write accepted by ``POST /api/sync``.
+
+    Claimed in the transaction of the write itself, so a batch that is sent
+    again (lost response, offline queue replayed) is applied only once.
+    Receipts older than ``SYNC_RECEIPT_DAYS`` are dropped.
+    """
+    __tablename__ = 'sync_receipts'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    client_id = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'client_id', name='unique_user_client_id'),
+    )
+
+    def __repr__(self):
+        return f'<SyncReceipt {self.client_id} user={self.user_id}>'
+
+# Cached statements of the queries run on nearly every request, see queries.py
+hot_queries = HotQueries(User, Activity, ActivityMonth, ActivityStats, ActivityRollup, ActivityDefinition,
+                         ALL_ACTIVITIES)
+
+def _fold_streak(days):
+    """Fold ascending (date, completed) pairs into (current, best, last_date)."""
+    current, best, last = 0, 0, None
+    for day, completed in days:
+        if not completed:
+            continue
+        if last is not None and day == last + timedelta(days=1):
+            current += 1
+        else:
+            current = 1
+        last = day
+        best = max(best, current)
+    return current, best, last
+
+def _daily_completion_query(user_id):
+    """(date, completed) per day, a day being completed when all its activities are."""
+    return db.session.query(
+        Activity.date,
+        (func.count() == func.sum(func.cast(Activity.completed, db.Integer))).label('completed')
+    ).filter(
+        Activity.user_id == user_id
+    ).group_by(Activity.date)
+
+def _streak_history(user_id, activity_name):
+    if activity_name == ALL_ACTIVITIES:
+        query = _daily_completion_query(user_id).order_by(Activity.date)
+    else:
+        query = db.session.query(Activity.date, Activity.completed).filter(
+            Activity.user_id == user_id,
+            Activity.activity_id == activity_catalog.id_of(activity_name)
+        ).order_by(Activity.date)
+    return ((row.date, bool(row.completed)) for row in query.yield_per(1000))
+
+def update_streaks(user_id, changes):
+    """Apply saved activities to the streak store.
+
+    ``changes`` maps activity name -> {date: completed}. Runs inside the
+    caller's transaction, the caller commits.
+    """
+    if not changes:
+        return
+    db.session.flush()
+
+    touched_dates = set()
+    for days in changes.values():
+        touched_dates.update(days)
+    daily = dict.fromkeys(touched_dates, False)
+    daily.update(activity_storage.daily_completion(user_id, touched_dates))
+    changes = dict(changes)
+    changes[ALL_ACTIVITIES] = daily
+
+    stats = {
+        stat.activity_name: stat
+        for stat in ActivityStats.query.filter(
+            ActivityStats.user_id == user_id,
+            ActivityStats.activity_name.in_(list(changes))
+        )
+    }
+    for name, days in changes.items():
+        stat = stats.get(name)
+        if stat is None:
+            # No stored state yet, so the history has to be read once
+            stat = ActivityStats(user_id=user_id, activity_name=name)
+            db.session.add(stat)
+            incremental = False
+        else:
+            incremental = all(stat.apply_day(day, completed) for day, completed in sorted(days.items()))
+        if not incremental:
+            stat.current_streak, stat.best_streak, stat.last_date = _fold_streak(
+                activity_storage.streak_history(user_id, name))
+
+# Dialect specific INSERT constructs supporting ON CONFLICT DO UPDATE
+UPSERT_INSERTS = {
+    'postgresql': postgresql_insert,
+    'sqlite': sqlite_insert,
+}
+UPSERT_BATCH_SIZE = 1000
+
+def _upsert_insert():
+    insert = UPSERT_INSERTS.get(db.engine.dialect.name)
+    if insert is None:
+        raise RuntimeError(f'Upsert is not supported on {db.engine.dialect.name}')
+    return insert
+
+def upsert_activities(user_id, items):
+    """Insert or update a batch of activities of one user.
+
+    ``items`` are dicts with name, date, completed and value. Each chunk is
+    written with a single ``INSERT ... ON CONFLICT DO UPDATE ... RETURNING``
+    on the (user_id, activity_id, date) key. Returns the saved Activity rows.
+    """
+    # A statement may not touch the same row twice, the last item wins
+    rows = {}
+    now = datetime.now()
+    for item in items:
+        activity_id = activity_catalog.id_of(item['name'])
+        rows[(activity_id, item['date'])] = {
+            'user_id': user_id,
+            'activity_id': activity_id,
+            'date': item['date'],
+            'completed': item['completed'],
+            'value': item['value'],
+            'created_at': now,
+            'updated_at': now
+        }
+    rows = list(rows.values())
+
+    insert = _upsert_insert()
+    saved = []
+    for i in range(0, len(rows), UPSERT_BATCH_SIZE):
+        stmt = insert(Activity).values(rows[i:i + UPSERT_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'activity_id', 'date'],
+            set_={
+                'completed': stmt.excluded.completed,
+                'value': stmt.excluded.value,
+                'updated_at': stmt.excluded.updated_at
+            }
+        ).returning(Activity)
+        saved.extend(db.session.scalars(stmt, execution_options={'populate_existing': True}))
+    return saved
+
+def stored_completion(user_id, items):
+    """Completed flag (0/1) currently stored for each (name, date) of ``items``.
+
+    Read with one query before an upsert so rollups can be moved by deltas.
+    """
+    activity_ids = {activity_catalog.id_of(item['name']) for item in items}
+    dates = {item['date'] for item in items}
+    rows = db.session.execute(hot_queries.stored_completion(user_id, activity_ids, dates))
+    return {(activity_catalog.name_of(row.activity_id), row.date): int(bool(row.completed)) for row in rows}
+
+def rollup_deltas(previous, saved):
+    """(name, date) -> (total delta, completed delta) for saved activities."""
+    deltas = {}
+    for activity in saved:
+        key = (activity.name, activity.date)
+        completed = int(bool(activity.completed))
+        if key in previous:
+            deltas[key] = (0, completed - previous[key])
+        else:
+            deltas[key] = (1, completed)
+    return deltas
+
+def _rollup_totals(deltas):
+    """Spread (name, date) deltas over every period bucket, per activity and for ALL_ACTIVITIES."""
+    totals = {}
+    for (name, day), (total, completed) in deltas:
+        if not total and not completed:
+            continue
+        for period in ROLLUP_PERIODS:
+            bucket = period_start(period, day)
+            for key in (name, ALL_ACTIVITIES):
+                entry = totals.setdefault((period, bucket, key), [0, 0])
+                entry[0] += total
+                entry[1] += completed
+    return totals
+
+def update_rollups(user_id, deltas):
+    """Add ``rollup_deltas()`` output to the rollup tables.
+
+    Runs inside the caller's transaction, the caller commits.
+    """
+    rows = [{
+        'user_id': user_id,
+        'period': period,
+        'bucket': bucket,
+        'activity_name': name,
+        'total': total,
+        'completed': completed
+    } for (period, bucket, name), (total, completed) in _rollup_totals(deltas.items()).items() if total or completed]
+
+    insert = _upsert_insert()
+    for i in range(0, len(rows), UPSERT_BATCH_SIZE):
+        stmt = insert(ActivityRollup).values(rows[i:i + UPSERT_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'period', 'bucket', 'activity_name'],
+            set_={
+                'total': ActivityRollup.total + stmt.excluded.total,
+                'completed': ActivityRollup.completed + stmt.excluded.completed
+            }
+        )
+        db.session.execute(stmt)
+
+def expected_rollups(user_id):
+    """Rollups recomputed from the stored activities, keyed like ``_rollup_totals()``."""
+    return _rollup_totals(
+        ((entry.name, entry.date), (1, int(bool(entry.completed)))) for entry in activity_storage.entries(user_id)
     )
 
+def rebuild_rollups(user_id):
+    """Recompute every rollup of a user from the stored activities."""
+    ActivityRollup.query.filter_by(user_id=user_id).delete()
+    db.session.bulk_insert_mappings(ActivityRollup, [{
+        'user_id': user_id,
+        'period': period,
+        'bucket': bucket,
+        'activity_name': name,
+        'total': total,
+        'completed': completed
+    } for (period, bucket, name), (total, completed) in expected_rollups(user_id).items()])
+
+def rebuild_streaks(user_id):
+    """Recompute every streak of a user from the stored activities."""
+    ActivityStats.query.filter_by(user_id=user_id).delete()
+
+    for name, days in activity_storage.streak_histories(user_id).items():
+        current, best, last = _fold_streak(days)
+        db.session.add(ActivityStats(
+            user_id=user_id,
+            activity_name=name,
+            current_streak=current,
+            best_streak=best,
+            last_date=last
+        ))
+
+def _rollup_period(start_date, end_date):
+    """Coarsest rollup period whose buckets exactly tile [start_date, end_date]."""
+    after_end = end_date + timedelta(days=1)
+    for period in reversed(ROLLUP_PERIODS):
+        if period_start(period, start_date) == start_date and period_start(period, after_end) == after_end:
+            return period
+    return 'day'
+
+def activity_range_etag(user_id, start_date, end_date, response_format='json'):
+    """Validator for a user's activities in a date range.
+
+    Built from one aggregate query (row count, highest id, latest update) so a
+    matching If-None-Match can be answered without loading any rows.
+    """
+    count, max_id, last_update = db.session.execute(hot_queries.range_version(user_id, start_date, end_date)).one()
+    version = f'{response_format}:{user_id}:{start_date}:{end_date}:{count}:{max_id}:{last_update}'
+    return hashlib.sha1(version.encode()).hexdigest()
+
+# Longest range served by GET /api/stats?format=grid, one bit per day
+GRID_MAX_DAYS = 31
+
+def activity_grid(user_id, start_date, end_date):
+    """Compact encoding of a user's activities in a range of at most GRID_MAX_DAYS.
+
+    Activity names are listed once; ``completed`` holds one bitmask per name
+    (bit i set when day ``start + i`` is completed) and ``values`` a packed
+    per-day array for every activity that has numeric values (0 when unset).
+    """
+    days = (end_date - start_date).days + 1
+    rows = db.session.execute(hot_queries.grid_rows(user_id, start_date, end_date))
+    masks = {}
+    values = {}
+    for row in rows:
+        name = activity_catalog.name_of(row.activity_id)
+        day = (row.date - start_date).days
+        masks[name] = masks.get(name, 0) | (1 << day if row.completed else 0)
+        if row.value is not None:
+            values.setdefault(name, [0] * days)[day] = row.value
+
+    names = sorted(masks)
+    return {
+        'start': start_date.strftime('%Y-%m-%d'),
+        'days': days,
+        'names': names,
+        'completed': [masks[name] for name in names],
+        'values': values
+    }
+
+def _supports_window_functions():
+    dialect = db.engine.dialect
+    if dialect.name == 'sqlite':
+        return dialect.dbapi.sqlite_version_info >= (3, 25, 0)
+    return True
+
+def dashboard_analytics(user_id, start_date, end_date):
+    """Completion, longest streak and heatmap cells for a date range.
+
+    Returns ``(activity_stats, activity_streaks, heatmap)`` where
+    ``activity_stats`` maps name -> {'total', 'completed'}, ``activity_streaks``
+    maps name -> longest run of completed rows and ``heatmap`` is a date
+    ordered list of (date, total, completed). Everything comes from one
+    statement: completion and heatmap from the coarsest rollup buckets
+    covering the range, streaks from gaps-and-islands over window functions
+    on the activity rows.
+    """
+    if not _supports_window_functions():
+        return _dashboard_analytics_streaming(user_id, start_date, end_date)
+
+    period = _rollup_period(start_date, end_date)
+    statement = hot_queries.dashboard_analytics(user_id, start_date, end_date, period)
+
+    activity_stats = {}
+    activity_streaks = {}
+    heatmap = []
+    for row in db.session.execute(statement):
+        if row.kind == 'activity':
+            activity_stats[row.name] = {'total': row.total, 'completed': row.completed or 0}
+        elif row.kind == 'streak':
+            activity_streaks[row.name] = row.total
+        else:
+            heatmap.append((row.date, row.total, row.completed or 0))
+
+    # Activities never completed in the range still get a streak entry
+    for name in activity_stats:
+        activity_streaks.setdefault(name, 0)
+    heatmap.sort()
+    return activity_stats, activity_streaks, heatmap
+
+def _dashboard_analytics_streaming(user_id, start_date, end_date):
+    """Single ordered scan for SQLite builds without window functions."""
+    rows = db.session.query(
+        Activity.activity_id,
+        Activity.date,
+        Activity.completed
+    ).filter(
+        Activity.user_id == user_id,
+        Activity.date >= start_date,
+        Activity.date <= end_date
+    ).order_by(Activity.activity_id, Activity.date).yield_per(1000)
+
+    activity_stats = {}
+    activity_streaks = {}
+    days = {}
+    current_activity = None
+    current_streak = 0
+    for row in rows:
+        name = activity_catalog.name_of(row.activity_id)
+        if current_activity != name:
+            current_activity = name
+            current_streak = 0
+            activity_stats[name] = {'total': 0, 'completed': 0}
+            activity_streaks[name] = 0
+
+        day = days.setdefault(row.date, [0, 0])
+        day[0] += 1
+        activity_stats[name]['total'] += 1
+        if row.completed:
+            day[1] += 1
+            activity_stats[name]['completed'] += 1
+            current_streak += 1
+            activity_streaks[name] = max(activity_streaks[name], current_streak)
+        else:
+            current_streak = 0
+
+    heatmap = [(date, total, completed) for date, (total, completed) in sorted(days.items())]
+    return activity_stats, activity_streaks, heatmap
+
+def _shift(mask, offset):
+    return mask << offset if offset >= 0 else mask >> -offset
+
+def _longest_completed_run(recorded, completed):
+    """Longest run of completed entries in order, days without an entry are skipped."""
+    best = current = 0
+    while recorded:
+        low = recorded & -recorded
+        recorded ^= low
+        current = current + 1 if completed & low else 0
+        best = max(best, current)
+    return best
+
+class RowStorage:
+    """Activities stored as one ``activities`` row per user, activity and day."""
+    name = 'rows'
+
+    def stored_completion(self, user_id, items):
+        return stored_completion(user_id, items)
+
+    def save(self, user_id, items):
+        return upsert_activities(user_id, items)
+
+    def bulk_insert(self, user_id, items):
+        """Insert items known not to exist yet, e.g. right after ``delete_range()``."""
+        self.seed_users([user_id], items)
+
+    def seed_users(self, user_ids, items):
+        """Insert the same items for each of ``user_ids``, none of them stored yet."""
+        now = datetime.now()
+        rows = [{
+            'user_id': user_id,
+            'activity_id': activity_catalog.id_of(item['name']),
+            'date': item['date'],
+            'completed': item['completed'],
+            'value': item['value'],
+            'created_at': now,
+            'updated_at': now
+        } for user_id in user_ids for item in items]
+        for i in range(0, len(rows), UPSERT_BATCH_SIZE):
+            db.session.bulk_insert_mappings(Activity, rows[i:i + UPSERT_BATCH_SIZE])
+
+    def delete_range(self, user_id, start_date, end_date):
+        db.session.query(Activity).filter(
+            Activity.user_id == user_id,
+            Activity.date >= start_date,
+            Activity.date <= end_date
+        ).delete(synchronize_session=False)
+
+    def entries(self, user_id, start_date=None, end_date=None):
+        activities = db.session.scalars(hot_queries.activities(user_id, start_date, end_date)).all()
+        activities.sort(key=lambda activity: (activity.date, activity.name))
+        return activities
+
+    def count_on(self, day):
+        return db.session.execute(hot_queries.count_on(day)).scalar()
+
+    def daily_completion(self, user_id, dates):
+        rows = db.session.execute(hot_queries.daily_completion(user_id, dates))
+        return {row.date: bool(row.completed) for row in rows}
+
+    def streak_history(self, user_id, activity_name):
+        return _streak_history(user_id, activity_name)
+
+    def streak_histories(self, user_id):
+        rows = db.session.query(Activity.activity_id, Activity.date, Activity.completed).filter(
+            Activity.user_id == user_id
+        ).order_by(Activity.activity_id, Activity.date).yield_per(1000)
+        history = {}
+        for row in rows:
+            history.setdefault(activity_catalog.name_of(row.activity_id), []).append((row.date, bool(row.completed)))
+        history[ALL_ACTIVITIES] = _streak_history(user_id, ALL_ACTIVITIES)
+        return history
+
+    def range_etag(self, user_id, start_date, end_date, response_format='json'):
+        return activity_range_etag(user_id, start_date, end_date, response_format)
+
+    def grid(self, user_id, start_date, end_date):
+        return activity_grid(user_id, start_date, end_date)
+
+    def analytics(self, user_id, start_date, end_date):
+        return dashboard_analytics(user_id, start_date, end_date)
+
+    def changes(self, user_id, start_date, end_date, after, limit):
+        """(position, entries) of the range written after ``after``, oldest first.
+
+        The position of a row is its (updated_at, id) keyset.
+        """
+        query = Activity.query.filter(
+            Activity.user_id == user_id,
+            Activity.date >= start_date,
+            Activity.date <= end_date
+        )
+        if after is not None:
+            updated_at, row_id = after
+            query = query.filter(or_(
+                Activity.updated_at > updated_at,
+                and_(Activity.updated_at == updated_at, Activity.id > row_id)
+            ))
+        rows = query.order_by(Activity.updated_at, Activity.id).limit(limit)
+        return [((row.updated_at, row.id), [row]) for row in rows]
+
+    def range_version(self, start_date, end_date, user_filters=()):
+        """Changes whenever an activity of the matching users in the range is written."""
+        count, max_id, last_update = db.session.query(
+            func.count(),
+            func.max(Activity.id),
+            func.max(Activity.updated_at)
+        ).join(
+            User, User.id == Activity.user_id
+        ).filter(
+            Activity.date >= start_date,
+            Activity.date <= end_date,
+            *user_filters
+        ).one()
+        return f'{self.name}:{count}:{max_id}:{last_update}'
+
+    def export(self, start_date, end_date, user_filters=()):
+        """(user, activity name, date, completed, value) per activity, by user and day."""
+        rows = db.session.query(
+            User.id, User.username, User.student_number, User.class_name,
+            Activity.activity_id, Activity.date, Activity.completed, Activity.value
+        ).join(
+            User, User.id == Activity.user_id
+        ).filter(
+            Activity.date >= start_date,
+            Activity.date <= end_date,
+            *user_filters
+        ).order_by(Activity.user_id, Activity.date, Activity.activity_id).yield_per(EXPORT_BATCH_SIZE)
+        for row in rows:
+            yield row, activity_catalog.name_of(row.activity_id), row.date, bool(row.completed), row.value
+
+class MonthlyStorage:
+    """Activities packed as one ``activity_months`` row per user, activity and month.
+
+    Completion counts are popcounts of the masks and streaks are read from
+    the bits, so the dashboard needs neither the activity rows nor rollups.
+    """
+    name = 'monthly'
+
+    def _months(self, user_id, start_date=None, end_date=None, names=None):
+        query = ActivityMonth.query.filter(ActivityMonth.user_id == user_id)
+        if start_date is not None:
+            query = query.filter(ActivityMonth.month >= start_date.replace(day=1))
+        if end_date is not None:
+            query = query.filter(ActivityMonth.month <= end_date)
+        if names is not None:
+            query = query.filter(ActivityMonth.activity_name.in_(names))
+        return query.order_by(ActivityMonth.month, ActivityMonth.activity_name)
+
+    def _month_rows(self, user_id, start_date=None, end_date=None, names=None):
+        """Rows of ``_months()`` through the cached statement, for reads that add nothing to the query."""
+        start_month = start_date.replace(day=1) if start_date is not None else None
+        return db.session.scalars(hot_queries.months(user_id, start_month, end_date, names))
+
+    def stored_completion(self, user_id, items):
+        wanted = {(item['name'], item['date']) for item in items}
+        months = self._month_rows(user_id, min(day for _, day in wanted), max(day for _, day in wanted),
+                                  {name for name, _ in wanted})
+        return {
+            (entry.name, entry.date): int(entry.completed)
+            for month in months for entry in month.entries()
+            if (entry.name, entry.date) in wanted
+        }
+
+    def save(self, user_id, items):
+        """Set the bits of a batch of items, returning them as ActivityEntry."""
+        days = {}
+        for item in items:
+            value = item['value']
+            if value is not None and value != '':
+                value = int(value)
+                if not VALUE_UNSET < value <= VALUE_MAX:
+                    raise ValueError(f"Value out of range for {item['name']}: {value}")
+            else:
+                value = None
+            name = activity_catalog.name_of(activity_catalog.id_of(item['name']))
+            days[(name, item['date'])] = (bool(item['completed']), value)
+        keys = {(name, day.replace(day=1)) for name, day in days}
+
+        # Create missing months first so every row can be locked and updated
+        insert = _upsert_insert()
+        db.session.execute(insert(ActivityMonth).values([{
+            'user_id': user_id,
+            'activity_name': name,
+            'month': month,
+            'recorded': 0,
+            'completed': 0,
+            'updated_at': datetime.now()
+        } for name, month in keys]).on_conflict_do_nothing(index_elements=['user_id', 'activity_name', 'month']))
+        months = {
+            (row.activity_name, row.month): row
+            for row in self._months(user_id, min(month for _, month in keys), max(month for _, month in keys),
+                                    {name for name, _ in keys}).with_for_update()
+            if (row.activity_name, row.month) in keys
+        }
+
+        now = datetime.now()
+        saved = []
+        for (name, day), (completed, value) in days.items():
+            months[(name, day.replace(day=1))].set_day(day, completed, value)
+            saved.append(ActivityEntry(user_id, name, day, completed, value, now))
+        for month in months.values():
+            month.updated_at = now
+        db.session.flush()
+        return saved
+
+    def bulk_insert(self, user_id, items):
+        if items:
+            self.save(user_id, items)
+
+    def seed_users(self, user_ids, items):
+        # New users have no months yet, so they are built here and inserted together
+        now = datetime.now()
+        for user_id in user_ids:
+            months = {}
+            for item in items:
+                name = activity_catalog.name_of(activity_catalog.id_of(item['name']))
+                key = (name, item['date'].replace(day=1))
+                if key not in months:
+                    months[key] = ActivityMonth(user_id=user_id, activity_name=name, month=key[1],
+                                                recorded=0, completed=0, updated_at=now)
+                value = int(item['value']) if item['value'] not in (None, '') else None
+                months[key].set_day(item['date'], bool(item['completed']), value)
+            db.session.add_all(months.values())
+        db.session.flush()
+
+    def delete_range(self, user_id, start_date, end_date):
+        for month in self._months(user_id, start_date, end_date).with_for_update():
+            for entry in list(month.entries(start_date, end_date)):
+                bit = 1 << (entry.date.day - 1)
+                month.recorded &= ~bit
+                month.completed &= ~bit
+                if month.values is not None:
+                    values = month.get_values()
+                    values[entry.date.day - 1] = VALUE_UNSET
+                    month.values = struct.pack(VALUES_FORMAT, *values)
+            if not month.recorded:
+                db.session.delete(month)
+        db.session.flush()
+
+    def entries(self, user_id, start_date=None, end_date=None):
+        entries = [entry for month in self._month_rows(user_id, start_date, end_date)
+                   for entry in month.entries(start_date, end_date)]
+        entries.sort(key=lambda entry: (entry.date, entry.name))
+        return entries
+
+    def count_on(self, day):
+        bit = 1 << (day.day - 1)
+        return db.session.query(func.count()).filter(
+            ActivityMonth.month == day.replace(day=1),
+            ActivityMonth.recorded.op('&')(bit) != 0
+        ).scalar()
+
+    def _daily_masks(self, months):
+        """Month -> (days with an entry, days with every entry completed)."""
+        daily = {}
+        for month in months:
+            recorded, incomplete = daily.get(month.month, (0, 0))
+            daily[month.month] = (recorded | month.recorded, incomplete | (month.recorded & ~month.completed))
+        return {month: (recorded, recorded & ~incomplete) for month, (recorded, incomplete) in daily.items()}
+
+    def daily_completion(self, user_id, dates):
+        daily = self._daily_masks(self._month_rows(user_id, min(dates), max(dates)))
+        completion = {}
+        for day in dates:
+            recorded, completed = daily.get(day.replace(day=1), (0, 0))
+            bit = 1 << (day.day - 1)
+            if recorded & bit:
+                completion[day] = bool(completed & bit)
+        return completion
+
+    def _history(self, month, recorded, completed):
+        while recorded:
+            low = recorded & -recorded
+            recorded ^= low
+            yield month + timedelta(days=low.bit_length() - 1), bool(completed & low)
+
+    def streak_history(self, user_id, activity_name):
+        if activity_name == ALL_ACTIVITIES:
+            daily = self._daily_masks(self._months(user_id))
+            return [day for month, masks in sorted(daily.items()) for day in self._history(month, *masks)]
+        return [day for month in self._months(user_id, names=[activity_name])
+                for day in self._history(month.month, month.recorded, month.completed)]
+
+    def streak_histories(self, user_id):
+        months = self._months(user_id).all()
+        history = {}
+        for month in months:
+            history.setdefault(month.activity_name, []).extend(
+                self._history(month.month, month.recorded, month.completed))
+        daily = self._daily_masks(months)
+        history[ALL_ACTIVITIES] = [day for month, masks in sorted(daily.items()) for day in self._history(month, *masks)]
+        return history
+
+    def range_etag(self, user_id, start_date, end_date, response_format='json'):
+        count, max_id, last_update = db.session.query(
+            func.count(),
+            func.max(ActivityMonth.id),
+            func.max(ActivityMonth.updated_at)
+        ).filter(
+            ActivityMonth.user_id == user_id,
+            ActivityMonth.month >= start_date.replace(day=1),
+            ActivityMonth.month <= end_date
+        ).one()
+        version = f'{self.name}:{response_format}:{user_id}:{start_date}:{end_date}:{count}:{max_id}:{last_update}'
+        return hashlib.sha1(version.encode()).hexdigest()
+
+    def _range_masks(self, user_id, start_date, end_date):
+        """Name -> (recorded, completed, values) with bit i meaning day ``start + i``."""
+        window = (1 << ((end_date - start_date).days + 1)) - 1
+        masks = {}
+        for month in self._month_rows(user_id, start_date, end_date):
+            offset = (month.month - start_date).days
+            recorded, completed, values = masks.get(month.activity_name, (0, 0, None))
+            recorded |= _shift(month.recorded, offset) & window
+            completed |= _shift(month.completed, offset) & window
+            if month.values is not None:
+                values = values or {}
+                for index, value in enumerate(month.get_values()):
+                    if value != VALUE_UNSET:
+                        values[offset + index] = value
+            masks[month.activity_name] = (recorded, completed, values)
+        return {name: masks for name, masks in masks.items() if masks[0]}
+
+    def grid(self, user_id, start_date, end_date):
+        days = (end_date - start_date).days + 1
+        masks = self._range_masks(user_id, start_date, end_date)
+        names = sorted(masks)
+        values = {}
+        for name, (_, _, day_values) in masks.items():
+            in_range = {index: value for index, value in (day_values or {}).items() if 0 <= index < days}
+            if in_range:
+                values[name] = [in_range.get(index, 0) for index in range(days)]
+        return {
+            'start': start_date.strftime('%Y-%m-%d'),
+            'days': days,
+            'names': names,
+            'completed': [masks[name][1] for name in names],
+            'values': values
+        }
+
+    def analytics(self, user_id, start_date, end_date):
+        masks = self._range_masks(user_id, start_date, end_date)
+        activity_stats = {}
+        activity_streaks = {}
+        days = {}
+        for name, (recorded, completed, _) in masks.items():
+            activity_stats[name] = {'total': _popcount(recorded), 'completed': _popcount(completed)}
+            activity_streaks[name] = _longest_completed_run(recorded, completed)
+            while recorded:
+                low = recorded & -recorded
+                recorded ^= low
+                day = days.setdefault(low.bit_length() - 1, [0, 0])
+                day[0] += 1
+                day[1] += 1 if completed & low else 0
+        heatmap = [(start_date + timedelta(days=index), total, completed)
+                   for index, (total, completed) in sorted(days.items())]
+        return activity_stats, activity_streaks, heatmap
+
+    def changes(self, user_id, start_date, end_date, after, limit):
+        # A written month sends all of its days in the range
+        query = self._months(user_id, start_date, end_date).order_by(None)
+        if after is not None:
+            updated_at, row_id = after
+            query = query.filter(or_(
+                ActivityMonth.updated_at > updated_at,
+                and_(ActivityMonth.updated_at == updated_at, ActivityMonth.id > row_id)
+            ))
+        months = query.order_by(ActivityMonth.updated_at, ActivityMonth.id).limit(limit)
+        return [((month.updated_at, month.id), list(month.entries(start_date, end_date))) for month in months]
+
+    def range_version(self, start_date, end_date, user_filters=()):
+        count, max_id, last_update = db.session.query(
+            func.count(),
+            func.max(ActivityMonth.id),
+            func.max(ActivityMonth.updated_at)
+        ).join(
+            User, User.id == ActivityMonth.user_id
+        ).filter(
+            ActivityMonth.month >= start_date.replace(day=1),
+            ActivityMonth.month <= end_date,
+            *user_filters
+        ).one()
+        return f'{self.name}:{count}:{max_id}:{last_update}'
+
+    def export(self, start_date, end_date, user_filters=()):
+        rows = db.session.query(
+            User.id, User.username, User.student_number, User.class_name, ActivityMonth
+        ).join(
+            User, User.id == ActivityMonth.user_id
+        ).filter(
+            ActivityMonth.month >= start_date.replace(day=1),
+            ActivityMonth.month <= end_date,
+            *user_filters
+        ).order_by(ActivityMonth.user_id, ActivityMonth.month).yield_per(EXPORT_BATCH_SIZE)
+        # Entries of one user and month are buffered to put them in day order
+        key = None
+        entries = []
+        for row in rows:
+            month = row.ActivityMonth
+            if (month.user_id, month.month) != key:
+                yield from self._export_order(entries)
+                key = (month.user_id, month.month)
+                entries = []
+            entries.extend((row, entry) for entry in month.entries(start_date, end_date))
+        yield from self._export_order(entries)
+
+    def _export_order(self, entries):
+        entries.sort(key=lambda item: (item[1].date, activity_catalog.id_of(item[1].name)))
+        for user, entry in entries:
+            yield user, entry.name, entry.date, entry.completed, entry.value
+
+ACTIVITY_STORAGES = {
+    'rows': RowStorage,
+    'monthly': MonthlyStorage,
+}
+activity_storage = ACTIVITY_STORAGES[app.config.get('ACTIVITY_STORAGE', 'rows')]()
+
+# Identity fields of logged-in users, so authenticated requests skip the
+# users lookup. edit_user() and toggle_user() drop the entry; with the shared
+# SQLite backend every worker sees that on its next request, with 'memory'
+# only the worker that served the admin.
+user_identity_cache = create_ttl_cache(app.config.get('USER_CACHE', 'memory'),
+                                       app.config.get('USER_CACHE_MAX_ENTRIES', 4096),
+                                       app.config.get('USER_CACHE_TTL', 30))
+
+def cache_identity(user):
+    fields = user.to_dict()
+    off_event_loop(user_identity_cache.set, user.id, fields)
+    return UserIdentity(fields)
+
+@app.context_processor
+def inject_activity_catalog():
+    # Lets static/script.js tell numeric activities from boolean ones
+    return {'numeric_activities': [
+        definition['name'] for definition in activity_catalog.definitions() if definition['is_numeric']
+    ]}
+
+@app.before_request
+def use_async_session():
+    async_session = request.environ.get(ASYNC_SESSION_ENVIRON_KEY)
+    if async_session is not None:
+        db.session.registry.set(async_session)
+
+# Read-only views whose GET requests may be served by a read replica
+REPLICA_ENDPOINTS = ('get_dashboard_stats', 'handle_stats', 'sync_activities', 'admin_users',
+                     'api_admin_users', 'admin_export', 'class_reports', 'admin_cohorts')
+
+@app.before_request
+def use_replica():
+    # Until the sticky window of the user's last write ends, read it back from the primary
+    if replica_router is not None and request.method in ('GET', 'HEAD') \
+            and request.endpoint in REPLICA_ENDPOINTS and session.get('primary_until', 0) < time.time():
+        g.use_replica = True
+
+@app.after_request
+def stick_to_primary(response):
+    if replica_router is not None and request.method not in ('GET', 'HEAD', 'OPTIONS') \
+            and response.status_code < 400 and current_user.is_authenticated:
+        session['primary_until'] = time.time() + app.config.get('REPLICA_STICKY_SECONDS', 10)
+    return response
+
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    fields = off_event_loop(user_identity_cache.get, int(user_id))
+    if fields is not None:
+        identity = UserIdentity(fields)
+    else:
+        user = db.session.get(User, int(user_id))
+        if user is None:
+            return None
+        identity = cache_identity(user)
+    # A deactivated account is logged out on its next request
+    return identity if identity.is_active else None
 
 # Routes
 @app.route('/')
@@ -103,9 +1343,7 @@ def index():
         total_users = User.query.count()
         active_users = User.query.filter_by(is_active=True).count()
         today = datetime.now().date()
-        total_activities_today = Activity.query.filter(
-            Activity.date == today
-        ).count()
+        total_activities_today = activity_storage.count_on(today)
         
         return render_template('index.html',
                              total_users=total_users,
@@ -114,28 +1352,16 @@ def index():
     else:
         # Get user dashboard data
         today = datetime.now().date()
-        user_activities = Activity.query.filter_by(
-            user_id=current_user.id,
-            date=today
-        ).all()
+        user_activities = activity_storage.entries(current_user.id, today, today)
         
         # Calculate completion rate
         total_activities = len(user_activities)
         completed_activities = sum(1 for activity in user_activities if activity.completed)
         completion_rate = (completed_activities / total_activities * 100) if total_activities > 0 else 0
         
-        # Calculate current streak
-        current_streak = 0
-        date = today
-        while True:
-            day_activities = Activity.query.filter_by(
-                user_id=current_user.id,
-                date=date
-            ).all()
-            if not day_activities or not all(activity.completed for activity in day_activities):
-                break
-            current_streak += 1
-            date = date - timedelta(days=1)
+        # Current streak comes from the streak store
+        daily_streak = db.session.scalars(hot_queries.streak(current_user.id, ALL_ACTIVITIES)).first()
+        current_streak = daily_streak.streak_on(today) if daily_streak else 0
         
         current_date = datetime.now()
         current_month = current_date.strftime('%B')  # Full month name
@@ -173,14 +1399,22 @@ def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
-        user = User.query.filter_by(username=username).first()
+        user = db.session.scalars(hot_queries.user_by_username(username)).first()
         
-        if user and user.check_password(password):
-            login_user(user)
-            next_page = request.args.get('next')
-            return redirect(next_page or url_for('index'))
-        else:
-            flash('Invalid username or password', 'error')
+        try:
+            if user and user.check_password(password):
+                # Hashes of an older bcrypt cost are upgraded at login
+                if password_hasher.needs_rehash(user.password_hash):
+                    user.set_password(password)
+                    db.session.commit()
+                login_user(cache_identity(user))
+                next_page = request.args.get('next')
+                return redirect(next_page or url_for('index'))
+            else:
+                flash('Invalid username or password', 'error')
+        except PasswordHasherBusy:
+            flash('Too many logins at the moment, please try again in a few seconds', 'error')
+            return render_template('login.html'), 503
     
     return render_template('login.html')
 
@@ -224,6 +1458,7 @@ def dashboard():
 @login_required
 def get_dashboard_stats():
     try:
+        read_your_writes(current_user.id)
         view_type = request.args.get('view_type', 'daily')
         month = int(request.args.get('month', datetime.now().month))
         year = int(request.args.get('year', datetime.now().year))
@@ -250,19 +1485,16 @@ def get_dashboard_stats():
             end_date = datetime(year, 12, 31).date()
             period_label = f"{year}'s"
         
-        # Efficient query using SQL aggregation
-        stats_query = db.session.query(
-            Activity.name,
-            func.count().label('total'),
-            func.sum(func.cast(Activity.completed, db.Integer)).label('completed')
-        ).filter(
-            Activity.user_id == current_user.id,
-            Activity.date >= start_date,
-            Activity.date <= end_date
-        ).group_by(Activity.name)
+        # Serve repeated views from the cache, writes drop the affected periods
+        cache_key = f'{current_user.id}:{view_type}:{start_date.isoformat()}:{end_date.isoformat()}'
+        cached = off_event_loop(dashboard_cache.get, cache_key)
+        if cached is not None:
+            return app.response_class(cached, mimetype='application/json')
+        # Taken before the read, a write committed meanwhile refuses the entry
+        generation = off_event_loop(dashboard_cache.generation, current_user.id)
         
-        # Execute query once and store results
-        activity_stats = {row.name: {'total': row.total, 'completed': row.completed or 0} for row in stats_query.all()}
+        # Completion, streaks and heatmap in one round trip
+        activity_stats, activity_streaks, heatmap_rows = activity_storage.analytics(current_user.id, start_date, end_date)
         
         # Calculate overall stats
         total_activities = sum(stats['total'] for stats in activity_stats.values())
@@ -274,61 +1506,16 @@ def get_dashboard_stats():
             rate = round((stats['completed'] / stats['total'] * 100) if stats['total'] > 0 else 0, 1)
             activity_completion[name] = rate
         
-        # Calculate streaks efficiently
-        streaks_query = db.session.query(
-            Activity.name,
-            Activity.date,
-            Activity.completed
-        ).filter(
-            Activity.user_id == current_user.id,
-            Activity.date >= start_date,
-            Activity.date <= end_date
-        ).order_by(Activity.name, Activity.date).all()
-        
-        # Process streaks in memory
-        activity_streaks = {}
-        current_activity = None
-        current_streak = 0
-        max_streak = 0
-        
-        for row in streaks_query:
-            if current_activity != row.name:
-                if current_activity is not None:
-                    activity_streaks[current_activity] = max_streak
-                current_activity = row.name
-                current_streak = 0
-                max_streak = 0
-            
-            if row.completed:
-                current_streak += 1
-                max_streak = max(max_streak, current_streak)
-            else:
-                current_streak = 0
-        
-        if current_activity is not None:
-            activity_streaks[current_activity] = max_streak
-        
         # Get top activity
         top_activity = max(activity_completion.items(), key=lambda x: x[1])[0] if activity_completion else "-"
         best_streak = max(activity_streaks.values()) if activity_streaks else 0
         
-        # Prepare heatmap data efficiently
-        heatmap_query = db.session.query(
-            Activity.date,
-            func.count().label('total'),
-            func.sum(func.cast(Activity.completed, db.Integer)).label('completed')
-        ).filter(
-            Activity.user_id == current_user.id,
-            Activity.date >= start_date,
-            Activity.date <= end_date
-        ).group_by(Activity.date).all()
-        
         heatmap_data = [{
-            'date': row.date.strftime('%Y-%m-%d'),
-            'value': round((row.completed / row.total * 100) if row.total > 0 else 0, 1)
-        } for row in heatmap_query]
+            'date': date.strftime('%Y-%m-%d'),
+            'value': round((completed / total * 100) if total > 0 else 0, 1)
+        } for date, total, completed in heatmap_rows]
         
-        return jsonify({
+        body = app.json.dumps({
             'success': True,
             'stats': {
                 'completion_rate': round((total_completed / total_activities * 100) if total_activities > 0 else 0, 1),
@@ -341,6 +1528,8 @@ def get_dashboard_stats():
                 'heatmap_data': heatmap_data
             }
         })
+        off_event_loop(dashboard_cache.set, cache_key, current_user.id, start_date, end_date, body, generation)
+        return app.response_class(body, mimetype='application/json')
         
     except Exception as e:
         print(f"Error getting dashboard stats: {str(e)}")
@@ -349,6 +1538,153 @@ def get_dashboard_stats():
             'message': f'Error getting dashboard stats: {str(e)}'
         }), 500
 
+def parse_activity_item(activity_data):
+    """Validate one posted activity into a save item, ValueError names the problem."""
+    name = activity_data.get('name')
+    date_str = activity_data.get('date')
+    completed = activity_data.get('completed', False)
+    value = activity_data.get('value')  # Get the numeric value if present
+    
+    if not name or not date_str:
+        raise ValueError('Each activity must have name and date')
+    
+    try:
+        activity_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid date format for {name}: {date_str}. Use YYYY-MM-DD')
+    
+    # Aliases are stored under the catalog name
+    definition = activity_catalog.get(name)
+    if definition is None:
+        raise ValueError(f'Unknown activity: {name}')
+    
+    if value is not None and value != '':
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid value for {name}: {value}')
+        # Checked here, a buffered write is stored only after the response
+        if not VALUE_UNSET < number <= VALUE_MAX:
+            raise ValueError(f'Value out of range for {name}: {value}')
+    
+    # Milliseconds since the epoch on the client, orders buffered writes
+    client_time = activity_data.get('client_time')
+    if client_time is None:
+        client_time = time.time() * 1000
+    elif isinstance(client_time, bool) or not isinstance(client_time, (int, float)):
+        raise ValueError(f'Invalid client_time for {name}: {client_time}')
+    
+    return {
+        'name': definition['name'],
+        'date': activity_date,
+        'completed': completed,
+        'value': value,
+        'client_time': client_time
+    }
+
+def lock_user_writes(user_id):
+    """Hold back other saves of the user until the current transaction ends.
+
+    The rollups move by the difference to the stored completed flags; two
+    saves of the same cell reading them at once would both count the
+    change, and a row lock cannot cover a cell that is not stored yet.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        # No row locks: a write takes the database write lock, reads after it see every committed save
+        User.query.filter(User.id == user_id).update({User.id: User.id}, synchronize_session=False)
+    else:
+        db.session.query(User.id).filter(User.id == user_id).with_for_update(key_share=True).one()
+
+def write_activities(user_id, items):
+    """Save validated items of one user in the current transaction."""
+    lock_user_writes(user_id)
+    # Write the whole batch at once instead of a lookup per item
+    previous = activity_storage.stored_completion(user_id, items)
+    saved = activity_storage.save(user_id, items)
+    
+    changes = {}
+    for activity in saved:
+        changes.setdefault(activity.name, {})[activity.date] = bool(activity.completed)
+    
+    # Keep the streak store and rollups in the same transaction
+    update_streaks(user_id, changes)
+    update_rollups(user_id, rollup_deltas(previous, saved))
+    return saved
+
+def save_activities(user_id, items):
+    """Save validated items of one user and commit, returning the saved activities."""
+    saved = write_activities(user_id, items)
+    db.session.commit()
+    dashboard_cache.invalidate(user_id, {activity.date for activity in saved})
+    return saved
+
+def claim_sync_receipts(user_id, client_ids):
+    """Claim client ids of ``POST /api/sync`` in the current transaction, returning the newly claimed ones."""
+    now = datetime.now()
+    insert = _upsert_insert()
+    claimed = set(db.session.scalars(insert(SyncReceipt).values([
+        {'user_id': user_id, 'client_id': client_id, 'created_at': now} for client_id in client_ids
+    ]).on_conflict_do_nothing(index_elements=['user_id', 'client_id']).returning(SyncReceipt.client_id)))
+    db.session.query(SyncReceipt).filter(
+        SyncReceipt.user_id == user_id,
+        SyncReceipt.created_at < now - timedelta(days=SYNC_RECEIPT_DAYS)
+    ).delete(synchronize_session=False)
+    return claimed
+
+def flush_activity_writes(writes):
+    """Write the coalesced {user_id: items} of the write buffer in one transaction.
+
+    Synced items carry the ``client_ids`` they were pushed with; they are
+    claimed here with the write, and an item whose ids were all claimed
+    before (the same retry buffered by another worker) is skipped.
+    """
+    with app.app_context():
+        try:
+            dates = {}
+            # Users in id order, so two flushes never wait on each other's locks
+            for user_id, items in sorted(writes.items()):
+                client_ids = list(dict.fromkeys(
+                    client_id for item in items for client_id in item.get('client_ids', ())
+                ))
+                if client_ids:
+                    claimed = claim_sync_receipts(user_id, client_ids)
+                    items = [item for item in items
+                             if not item.get('client_ids') or claimed.intersection(item['client_ids'])]
+                if items:
+                    dates[user_id] = {activity.date for activity in write_activities(user_id, items)}
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    for user_id, user_dates in dates.items():
+        dashboard_cache.invalidate(user_id, user_dates)
+
+# Opt-in write-behind stage for saves, see write_buffer.py
+write_buffer = WriteBuffer(
+    flush_activity_writes,
+    app.config.get('WRITE_BUFFER_MAX_ITEMS', 500),
+    app.config['WRITE_BUFFER_SECONDS']
+) if app.config.get('WRITE_BUFFER_SECONDS') else None
+
+def store_activities(user_id, items):
+    """Save items, or with the write buffer on commit the caller's transaction and buffer them."""
+    if write_buffer is None:
+        return save_activities(user_id, items)
+    db.session.commit()
+    write_buffer.add(user_id, items)
+    now = datetime.now()
+    return [ActivityEntry(user_id, item['name'], item['date'], bool(item['completed']), item['value'], now)
+            for item in items]
+
+def read_your_writes(user_id):
+    """Flush the user's buffered writes of this worker before reading from the database."""
+    if write_buffer is not None:
+        try:
+            off_event_loop(write_buffer.flush, user_id)
+        except Exception as e:
+            # The writes stay buffered, the read answers with what is stored
+            print(f"Error flushing buffered writes of user {user_id}: {str(e)}")
+
 @app.route('/api/stats', methods=['GET', 'POST'])
 @login_required
 def handle_stats():
@@ -380,53 +1716,18 @@ def handle_stats():
                     'message': 'Activities must be a non-empty array'
                 }), 400
             
-            results = []
+            items = []
             for activity_data in activities:
-                name = activity_data.get('name')
-                date_str = activity_data.get('date')
-                completed = activity_data.get('completed', False)
-                value = activity_data.get('value')  # Get the numeric value if present
-                
-                if not name or not date_str:
-                    return jsonify({
-                        'success': False,
-                        'message': 'Each activity must have name and date'
-                    }), 400
-                
                 try:
-                    activity_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                except ValueError:
+                    items.append(parse_activity_item(activity_data))
+                except ValueError as e:
                     return jsonify({
                         'success': False,
-                        'message': f'Invalid date format for {name}: {date_str}. Use YYYY-MM-DD'
+                        'message': str(e)
                     }), 400
-                
-                # Check if activity already exists for this date
-                existing_activity = Activity.query.filter_by(
-                    user_id=current_user.id,
-                    name=name,
-                    date=activity_date
-                ).first()
-                
-                if existing_activity:
-                    # Update existing activity
-                    existing_activity.completed = completed
-                    existing_activity.value = value  # Update the value
-                    existing_activity.updated_at = datetime.now()
-                    results.append(existing_activity.to_dict())
-                else:
-                    # Create new activity
-                    activity = Activity(
-                        user_id=current_user.id,
-                        name=name,
-                        date=activity_date,
-                        completed=completed,
-                        value=value  # Set the value for new activities
-                    )
-                    db.session.add(activity)
-                    results.append(activity.to_dict())
             
-            db.session.commit()
+            saved = store_activities(current_user.id, items)
+            results = [activity.to_dict() for activity in saved]
             return jsonify({
                 'success': True,
                 'message': 'Activities saved successfully',
@@ -454,16 +1755,45 @@ def handle_stats():
             start = datetime.strptime(start_date, '%Y-%m-%d').date()
             end = datetime.strptime(end_date, '%Y-%m-%d').date()
             
-            activities = Activity.query.filter(
-                Activity.user_id == current_user.id,
-                Activity.date >= start,
-                Activity.date <= end
-            ).all()
+            # 'grid' is the compact month encoding, see activity_grid()
+            response_format = request.args.get('format', 'json')
+            if response_format not in ('json', 'grid'):
+                return jsonify({
+                    'success': False,
+                    'message': 'Format must be json or grid'
+                }), 400
+            if response_format == 'grid' and (end - start).days + 1 > GRID_MAX_DAYS:
+                return jsonify({
+                    'success': False,
+                    'message': f'Grid format covers at most {GRID_MAX_DAYS} days'
+                }), 400
             
-            return jsonify({
-                'success': True,
-                'activities': [activity.to_dict() for activity in activities]
-            })
+            read_your_writes(current_user.id)
+            # Taken before the read, so /api/sync can continue from this load
+            cursor = settled_sync_cursor(start, end)
+            
+            # Unchanged range: answer 304 before loading any rows
+            etag = activity_storage.range_etag(current_user.id, start, end, response_format)
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            elif response_format == 'grid':
+                response = jsonify({
+                    'success': True,
+                    'format': 'grid',
+                    'cursor': cursor,
+                    **activity_storage.grid(current_user.id, start, end)
+                })
+            else:
+                activities = activity_storage.entries(current_user.id, start, end)
+                
+                response = jsonify({
+                    'success': True,
+                    'cursor': cursor,
+                    'activities': [activity.to_dict() for activity in activities]
+                })
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
             
         except ValueError:
             return jsonify({
@@ -477,14 +1807,589 @@ def handle_stats():
                 'message': f'Error fetching activities: {str(e)}'
             }), 500
 
+# Delta sync of the activity grid, see sync_activities()
+SYNC_PAGE_SIZE = 1000
+SYNC_MAX_CHANGES = 500
+# Cursors stay this far behind the newest write, so a transaction that
+# commits late with an older updated_at is still picked up by the next sync
+SYNC_SETTLE_SECONDS = 5
+SYNC_RECEIPT_DAYS = 30
+
+def encode_sync_cursor(start_date, end_date, updated_at, row_id):
+    position = f'{activity_storage.name}|{start_date}|{end_date}|{updated_at.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+def decode_sync_cursor(cursor, start_date, end_date):
+    """(updated_at, id) of a cursor, None if it was issued for another range or storage."""
+    try:
+        position = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        storage, start, end, updated_at, row_id = position.split('|')
+        after = (datetime.fromisoformat(updated_at), int(row_id))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid sync cursor')
+    if (storage, start, end) != (activity_storage.name, str(start_date), str(end_date)):
+        return None
+    return after
+
+def settled_sync_cursor(start_date, end_date):
+    """Cursor covering every write a read made now can have missed."""
+    return encode_sync_cursor(start_date, end_date, datetime.now() - timedelta(seconds=SYNC_SETTLE_SECONDS), 0)
+
+def sync_pull(user_id, start_date, end_date, cursor=None):
+    """Activities of the range written since ``cursor``, and the cursor to send next.
+
+    Without a usable cursor every activity of the range is returned and
+    ``full`` tells the client to clear the range first. Deletions are not
+    tracked: after delete_range() (dummy data, table reset) clients need a
+    full load.
+    """
+    settled = (datetime.now() - timedelta(seconds=SYNC_SETTLE_SECONDS), 0)
+    after = decode_sync_cursor(cursor, start_date, end_date) if cursor else None
+    pages = activity_storage.changes(user_id, start_date, end_date, after, SYNC_PAGE_SIZE + 1)
+    has_more = len(pages) > SYNC_PAGE_SIZE
+    pages = pages[:SYNC_PAGE_SIZE]
+
+    position = pages[-1][0] if pages else after
+    if not has_more:
+        # Recent writes are sent again next time rather than risk skipping one
+        position = min(position, settled) if position else settled
+    activities = [{
+        'name': entry.name,
+        'date': entry.date.strftime('%Y-%m-%d'),
+        'completed': bool(entry.completed),
+        'value': entry.value
+    } for _, entries in pages for entry in entries]
+    if write_buffer is not None:
+        # Buffered writes go last so they win over the stored rows; once
+        # flushed they are newer than the cursor and are sent again
+        activities.extend({
+            'name': item['name'],
+            'date': item['date'].strftime('%Y-%m-%d'),
+            'completed': bool(item['completed']),
+            'value': item['value']
+        } for item in write_buffer.pending(user_id, start_date, end_date))
+    return {
+        'full': after is None,
+        'activities': activities,
+        'cursor': encode_sync_cursor(start_date, end_date, *position),
+        'has_more': has_more
+    }
+
+def sync_push(user_id, changes):
+    """Apply client writes, each client id at most once.
+
+    ``changes`` are activity dicts with a client generated ``id``. The ids
+    are claimed in ``sync_receipts`` in the transaction of the writes, so a
+    batch sent again is not applied twice. Returns the applied ids, the ids
+    seen before and {id: message} of changes that can never be applied.
+
+    With the write buffer on, the changes are buffered with their ids and
+    the receipts are claimed when the buffer writes them; ids already
+    claimed or still buffered in this worker count as seen before.
+    """
+    items = {}
+    rejected = {}
+    for change in changes:
+        try:
+            items.setdefault(change['id'], parse_activity_item(change))
+        except ValueError as e:
+            rejected[change['id']] = str(e)
+    if not items:
+        return [], [], rejected
+
+    if write_buffer is not None:
+        seen = {client_id for (client_id,) in db.session.query(SyncReceipt.client_id).filter(
+            SyncReceipt.user_id == user_id,
+            SyncReceipt.client_id.in_(list(items))
+        )}
+        seen.update(client_id for item in write_buffer.pending(user_id) for client_id in item.get('client_ids', ()))
+        applied = [client_id for client_id in items if client_id not in seen]
+        write_buffer.add(user_id, [dict(items[client_id], client_ids=[client_id]) for client_id in applied])
+        return applied, [client_id for client_id in items if client_id in seen], rejected
+
+    claimed = claim_sync_receipts(user_id, items)
+    applied = [client_id for client_id in items if client_id in claimed]
+    duplicates = [client_id for client_id in items if client_id not in claimed]
+    if applied:
+        save_activities(user_id, [items[client_id] for client_id in applied])
+    else:
+        db.session.commit()
+    return applied, duplicates, rejected
+
+@app.route('/api/sync', methods=['GET', 'POST'])
+@login_required
+def sync_activities():
+    """Delta sync of one date range of the activity grid.
+
+    GET ?start=&end=&cursor= returns the activities written since the
+    cursor. POST takes {"start", "end", "cursor", "changes": [{"id", "name",
+    "date", "completed", "value"}]}, applies the changes and answers the same.
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({
+                'success': False,
+                'message': 'Request must be a JSON object'
+            }), 400
+        changes = data.get('changes') or []
+        if not isinstance(changes, list) or len(changes) > SYNC_MAX_CHANGES:
+            return jsonify({
+                'success': False,
+                'message': f'Changes must be an array of at most {SYNC_MAX_CHANGES} items'
+            }), 400
+        for change in changes:
+            client_id = change.get('id') if isinstance(change, dict) else None
+            if not isinstance(client_id, str) or not 0 < len(client_id) <= 64:
+                return jsonify({
+                    'success': False,
+                    'message': 'Each change must have an id of at most 64 characters'
+                }), 400
+    else:
+        data = request.args
+        changes = []
+
+    try:
+        start = datetime.strptime(data.get('start') or '', '%Y-%m-%d').date()
+        end = datetime.strptime(data.get('end') or '', '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'message': 'Start and end dates are required, use YYYY-MM-DD'
+        }), 400
+    cursor = data.get('cursor')
+    try:
+        if cursor:
+            decode_sync_cursor(cursor, start, end)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
+    try:
+        applied, duplicates, rejected = sync_push(current_user.id, changes) if changes else ([], [], {})
+        response = jsonify({
+            'success': True,
+            'applied': applied,
+            'duplicates': duplicates,
+            'rejected': rejected,
+            **sync_pull(current_user.id, start, end, cursor)
+        })
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error syncing activities: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Error syncing activities: {str(e)}'
+        }), 500
+
+# Admin user listing: keyset pagination on a unique column
+USER_SORTS = {'id': User.id, 'username': User.username}
+ADMIN_USERS_PAGE_SIZE = 50
+ADMIN_USERS_MAX_PAGE_SIZE = 200
+# Totals per filter combination, shared by all pages of a listing
+user_count_cache = TTLCache(max_entries=256, ttl=60)
+
+def user_list_args(args):
+    """Listing options from query arguments, raises ValueError on bad input."""
+    sort = args.get('sort', 'id')
+    if sort not in USER_SORTS:
+        raise ValueError('Sort must be id or username')
+    after = args.get('after') or None
+    if after is not None and sort == 'id':
+        after = int(after)
+    limit = min(int(args.get('limit', ADMIN_USERS_PAGE_SIZE)), ADMIN_USERS_MAX_PAGE_SIZE)
+    if limit < 1:
+        raise ValueError('Limit must be positive')
+    active = args.get('active') or None
+    if active is not None and active not in ('true', 'false'):
+        raise ValueError('Active must be true or false')
+    return {
+        'sort': sort,
+        'after': after,
+        'limit': limit,
+        'class_name': args.get('class_name') or None,
+        'active': active,
+        'q': (args.get('q') or '').strip() or None
+    }
+
+def search_users(sort='id', after=None, limit=ADMIN_USERS_PAGE_SIZE, class_name=None, active=None, q=None):
+    """One page of users ordered by ``sort``, starting after the ``after`` cursor.
+
+    ``q`` is a case-insensitive prefix of the username, full name or student
+    number. Returns ``(users, next_cursor, total)``; ``total`` is cached per
+    filter combination for a short time.
+    """
+    query = User.query
+    if class_name:
+        query = query.filter(User.class_name == class_name)
+    if active is not None:
+        query = query.filter(User.is_active == (active == 'true'))
+    if q:
+        prefix = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        query = query.filter(or_(
+            func.lower(User.username).like(prefix.lower(), escape='\\'),
+            func.lower(User.full_name).like(prefix.lower(), escape='\\'),
+            User.student_number.like(prefix, escape='\\')
+        ))
+
+    count_key = (class_name, active, q)
+    total = user_count_cache.get(count_key)
+    if total is None:
+        total = query.count()
+        user_count_cache.set(count_key, total)
+
+    column = USER_SORTS[sort]
+    if after is not None:
+        query = query.filter(column > after)
+    users = query.order_by(column).limit(limit + 1).all()
+    next_cursor = getattr(users[limit - 1], sort) if len(users) > limit else None
+    return users[:limit], next_cursor, total
+
 @app.route('/admin/users')
 @login_required
 def admin_users():
     if not current_user.is_admin:
         flash('Access denied. Admin privileges required.', 'danger')
         return redirect(url_for('index'))
-    users = User.query.all()
-    return render_template('admin_users.html', users=users)
+    try:
+        filters = user_list_args(request.args)
+    except ValueError as e:
+        flash(f'Invalid filter: {str(e)}', 'danger')
+        return redirect(url_for('admin_users'))
+    users, next_cursor, total = search_users(**filters)
+    return render_template('admin_users.html',
+                         users=users,
+                         next_cursor=next_cursor,
+                         total=total,
+                         filters=filters)
+
+@app.route('/api/admin/users')
+@login_required
+def api_admin_users():
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    try:
+        filters = user_list_args(request.args)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid filter: {str(e)}'
+        }), 400
+    users, next_cursor, total = search_users(**filters)
+    return jsonify({
+        'success': True,
+        'users': [user.to_dict() for user in users],
+        'next_cursor': next_cursor,
+        'total': total
+    })
+
+# Current streak buckets for cohort reports: (label, lowest, highest)
+STREAK_BUCKETS = (
+    ('0', 0, 0),
+    ('1-6', 1, 6),
+    ('7-29', 7, 29),
+    ('30+', 30, None),
+)
+
+def cohort_stats(start_date, end_date, class_name=None):
+    """Per-class completion, per-activity rates and current streak distribution.
+
+    Completion covers start_date..end_date and comes from one grouped query
+    over the rollups of every student. The streak store only keeps streaks
+    as of today, so the distribution is of current streaks whatever the
+    range, from one query over that store.
+    """
+    period = _rollup_period(start_date, end_date)
+    rollups = db.session.query(
+        User.class_name,
+        ActivityRollup.activity_name,
+        func.sum(ActivityRollup.total).label('total'),
+        func.sum(ActivityRollup.completed).label('completed')
+    ).join(
+        ActivityRollup, ActivityRollup.user_id == User.id
+    ).filter(
+        User.is_admin == False,
+        ActivityRollup.period == period,
+        ActivityRollup.bucket >= start_date,
+        ActivityRollup.bucket <= end_date
+    ).group_by(User.class_name, ActivityRollup.activity_name)
+
+    streaks = db.session.query(
+        User.class_name,
+        ActivityStats.current_streak,
+        ActivityStats.last_date
+    ).outerjoin(
+        ActivityStats,
+        (ActivityStats.user_id == User.id) & (ActivityStats.activity_name == ALL_ACTIVITIES)
+    ).filter(
+        User.is_admin == False
+    )
+
+    if class_name:
+        rollups = rollups.filter(User.class_name == class_name)
+        streaks = streaks.filter(User.class_name == class_name)
+
+    def new_cohort(name):
+        return {
+            'class_name': name,
+            'students': 0,
+            'completion_rate': 0,
+            'activities_count': '0/0',
+            'activity_completion': {},
+            'current_streak_distribution': {label: 0 for label, _, _ in STREAK_BUCKETS}
+        }
+
+    cohorts = {}
+    for row in rollups:
+        cohort = cohorts.setdefault(row.class_name, new_cohort(row.class_name))
+        completed = row.completed or 0
+        rate = round((completed / row.total * 100) if row.total else 0, 1)
+        if row.activity_name == ALL_ACTIVITIES:
+            cohort['completion_rate'] = rate
+            cohort['activities_count'] = f"{completed}/{row.total}"
+        else:
+            cohort['activity_completion'][row.activity_name] = rate
+
+    today = datetime.now().date()
+    for row in streaks:
+        cohort = cohorts.setdefault(row.class_name, new_cohort(row.class_name))
+        cohort['students'] += 1
+        streak = streak_on(row.current_streak, row.last_date, today) if row.last_date else 0
+        for label, lowest, highest in STREAK_BUCKETS:
+            if streak >= lowest and (highest is None or streak <= highest):
+                cohort['current_streak_distribution'][label] += 1
+                break
+
+    return [cohorts[name] for name in sorted(cohorts)]
+
+# Columns of GET /api/admin/export and export_data.py
+EXPORT_FIELDS = ('username', 'student_number', 'class_name', 'activity', 'date', 'completed', 'value')
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+# Rows fetched per round trip of the server-side cursor and written per chunk
+EXPORT_BATCH_SIZE = 1000
+
+def export_activities(response_format, start_date, end_date, class_name=None, user_ids=None):
+    """Activities of a date range as CSV or NDJSON text, in chunks.
+
+    Rows are read from a server-side cursor and written out every
+    EXPORT_BATCH_SIZE rows, so memory stays flat however large the export.
+    """
+    user_filters = []
+    if class_name:
+        user_filters.append(User.class_name == class_name)
+    if user_ids:
+        user_filters.append(User.id.in_(user_ids))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if response_format == 'csv':
+        writer.writerow(EXPORT_FIELDS)
+    rows = activity_storage.export(start_date, end_date, user_filters)
+    for count, (user, name, date, completed, value) in enumerate(rows, 1):
+        if response_format == 'csv':
+            writer.writerow((user.username, user.student_number, user.class_name, name,
+                             date.isoformat(), int(completed), '' if value is None else value))
+        else:
+            buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, (
+                user.username, user.student_number, user.class_name, name, date.isoformat(), completed, value
+            ))), ensure_ascii=False))
+            buffer.write('\n')
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.route('/api/admin/export')
+@login_required
+def admin_export():
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    response_format = request.args.get('format', 'csv')
+    if response_format not in EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'message': 'Format must be csv or ndjson'
+        }), 400
+    
+    try:
+        start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+        end = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+        # user_id may be repeated or comma separated
+        user_ids = [int(user_id) for value in request.args.getlist('user_id')
+                    for user_id in value.split(',') if user_id]
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'start and end must be YYYY-MM-DD dates, user_id a list of ids'
+        }), 400
+    
+    if start > end:
+        return jsonify({
+            'success': False,
+            'message': 'Start date must not be after end date'
+        }), 400
+    
+    # Rows are produced while the response is sent, in the request's app context
+    chunks = export_activities(response_format, start, end, request.args.get('class_name'), user_ids)
+    filename = f'activities_{start}_{end}.{response_format}'
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[response_format], headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        # Let nginx pass chunks on instead of buffering the whole export
+        'X-Accel-Buffering': 'no'
+    })
+
+# Rows of the monthly report, (group, activities) in print order as in
+# printReport() of static/script.js
+REPORT_GROUPS = (
+    ('Sholat Wajib', ('Subuh', 'Dzuhur', 'Ashar', 'Maghrib', 'Isya')),
+    ('Sholat Sunnah', ('Rowatib', 'Qiyamulail', 'Dhuha')),
+    ('Tilawah Qur\'an', ('Tilawah Qur\'an',)),
+    ('Puasa', ('Puasa',)),
+    ('Al-Ma\'tsurat', ('Al-Ma\'tsurat Pagi', 'Al-Ma\'tsurat Sore')),
+    ('Wirid Qur\'an', ('Ar Rahman', 'Al Waqiah', 'Ad Dukhan', 'As Sajadah', 'Al Mulk', 'Yaasin', 'Al Kahfi')),
+    ('Olahraga', ('Olahraga',))
+)
+REPORT_MONTHS = ('Januari', 'Februari', 'Maret', 'April', 'Mei', 'Juni', 'Juli',
+                 'Agustus', 'September', 'Oktober', 'November', 'Desember')
+
+def class_students(class_name):
+    return User.query.filter(
+        User.class_name == class_name,
+        User.is_admin == False,
+        User.is_active == True
+    ).order_by(User.full_name, User.id).all()
+
+def class_report_key(class_name, students, start_date, end_date):
+    """Cache key of a class report, changing with the students and their activities."""
+    roster = repr([(student.id, student.full_name, student.student_number) for student in students])
+    data = activity_storage.range_version(start_date, end_date, [User.class_name == class_name])
+    version = hashlib.sha1(f'{roster}:{data}'.encode()).hexdigest()
+    return f'report:{class_name}:{start_date:%Y-%m}:{version}'
+
+def class_report_cells(class_name, start_date, end_date):
+    """user id -> activity name -> day of month -> (completed, value), from one query."""
+    cells = {}
+    for user, name, day, completed, value in activity_storage.export(
+            start_date, end_date, [User.class_name == class_name]):
+        cells.setdefault(user.id, {}).setdefault(name, {})[day.day] = (completed, value)
+    return cells
+
+def render_class_report(class_name, month_start, students):
+    """Printable monthly report of every student of a class, one page each."""
+    month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    key = class_report_key(class_name, students, month_start, month_end)
+    body = report_cache.get(key)
+    if body is None:
+        numeric = {definition['name'] for definition in activity_catalog.definitions() if definition['is_numeric']}
+        body = render_template(
+            'class_report.html',
+            class_name=class_name,
+            month_label=f'{REPORT_MONTHS[month_start.month - 1]} {month_start.year}',
+            days=month_end.day,
+            groups=REPORT_GROUPS,
+            numeric=numeric,
+            students=students,
+            cells=class_report_cells(class_name, month_start, month_end)
+        )
+        # Keys carry the data version, so entries are never invalidated (user 0)
+        report_cache.set(key, 0, month_start, month_end, body)
+    return body
+
+@app.route('/admin/reports')
+@login_required
+def class_reports():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    class_name = request.args.get('class_name')
+    month = request.args.get('month')
+    if not class_name or not month:
+        classes = [name for (name,) in db.session.query(User.class_name).filter(
+            User.is_admin == False
+        ).distinct().order_by(User.class_name)]
+        return render_template('class_reports.html', classes=classes,
+                               month=datetime.now().strftime('%Y-%m'))
+    
+    try:
+        month_start = datetime.strptime(month, '%Y-%m').date()
+    except ValueError:
+        flash('Month must be given as YYYY-MM.', 'danger')
+        return redirect(url_for('class_reports'))
+    
+    students = class_students(class_name)
+    if not students:
+        flash(f'No active students in class {class_name}.', 'warning')
+        return redirect(url_for('class_reports'))
+    return render_class_report(class_name, month_start, students)
+
+@app.route('/api/admin/cohorts')
+@login_required
+def admin_cohorts():
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    try:
+        # Defaults to the current month
+        today = datetime.now().date()
+        start_date = request.args.get('start')
+        end_date = request.args.get('end')
+        start = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else today.replace(day=1)
+        end = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else today
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid date format. Use YYYY-MM-DD'
+        }), 400
+    
+    if start > end:
+        return jsonify({
+            'success': False,
+            'message': 'Start date must not be after end date'
+        }), 400
+    
+    try:
+        return jsonify({
+            'success': True,
+            'start': start.strftime('%Y-%m-%d'),
+            'end': end.strftime('%Y-%m-%d'),
+            # current_streak_distribution is as of this date, not of start..end
+            'current_streaks_on': today.strftime('%Y-%m-%d'),
+            'cohorts': cohort_stats(start, end, request.args.get('class_name'))
+        })
+    except Exception as e:
+        print(f"Error getting cohort stats: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Error getting cohort stats: {str(e)}'
+        }), 500
+
+@app.route('/api/admin/cache')
+@login_required
+def dashboard_cache_stats():
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    return jsonify({
+        'success': True,
+        'cache': dashboard_cache.stats(),
+        'write_buffer': write_buffer.stats() if write_buffer is not None else None,
+        'replicas': replica_router.stats() if replica_router is not None else None
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Unauthenticated for the Prometheus scraper, nginx only allows it from localhost
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/admin/users/<int:user_id>')
 @login_required
@@ -493,16 +2398,7 @@ def get_user(user_id):
         return jsonify({'status': 'error', 'message': 'Access denied'}), 403
     
     user = User.query.get_or_404(user_id)
-    return jsonify({
-        'id': user.id,
-        'username': user.username,
-        'email': user.email,
-        'full_name': user.full_name,
-        'student_number': user.student_number,
-        'class_name': user.class_name,
-        'is_admin': user.is_admin,
-        'is_active': user.is_active
-    })
+    return jsonify(user.to_dict())
 
 @app.route('/admin/users/<int:user_id>/edit', methods=['POST'])
 @login_required
@@ -524,6 +2420,8 @@ def edit_user(user_id):
             user.set_password(new_password)
         
         db.session.commit()
+        user_count_cache.clear()
+        user_identity_cache.pop(user_id)
         return jsonify({'status': 'success'})
     except Exception as e:
         db.session.rollback()
@@ -542,11 +2440,174 @@ def toggle_user(user_id):
     try:
         user.is_active = not user.is_active
         db.session.commit()
+        user_count_cache.clear()
+        user_identity_cache.pop(user_id)
         return jsonify({'status': 'success'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# Activities every new account starts with: today, not completed
+DEFAULT_USER_ACTIVITIES = (
+    'Subuh',
+    'Dzuhur',
+    'Ashar',
+    'Maghrib',
+    'Isya',
+    'Tilawah Qur\'an',
+    'Al-Ma\'tsurat Pagi',
+    'Al-Ma\'tsurat Sore'
+)
+
+def add_default_activities(user_ids):
+    """DEFAULT_USER_ACTIVITIES and their rollups for freshly created users.
+
+    The users have nothing stored yet, so activities and rollups of all of
+    them go out as batched plain INSERTs. The caller commits.
+    """
+    today = datetime.now().date()
+    items = [{'name': name, 'date': today, 'completed': False, 'value': None} for name in DEFAULT_USER_ACTIVITIES]
+    activity_storage.seed_users(user_ids, items)
+
+    totals = _rollup_totals(((item['name'], item['date']), (1, 0)) for item in items)
+    rows = [{
+        'user_id': user_id,
+        'period': period,
+        'bucket': bucket,
+        'activity_name': name,
+        'total': total,
+        'completed': completed
+    } for user_id in user_ids for (period, bucket, name), (total, completed) in totals.items()]
+    for i in range(0, len(rows), UPSERT_BATCH_SIZE):
+        db.session.bulk_insert_mappings(ActivityRollup, rows[i:i + UPSERT_BATCH_SIZE])
+
+# Columns of a user import CSV, see import_users()
+IMPORT_FIELDS = ('username', 'email', 'password', 'full_name', 'student_number', 'class_name')
+IMPORT_MAX_LENGTHS = {
+    'username': 80,
+    'email': 120,
+    'full_name': 120,
+    'student_number': 20,
+    'class_name': 20
+}
+
+def import_users(stream, dry_run=False, hash_workers=None):
+    """Create the students listed in a CSV file.
+
+    Every line is checked first: required columns, lengths, duplicates
+    within the file and, with one query, against existing usernames and
+    emails. Passwords of the valid lines are then hashed in parallel and
+    the users and their default activities inserted in batches, in the
+    caller's transaction. Imported accounts are never admins.
+
+    Returns ``(created, report)`` with one report entry per line: line
+    number, username, status ('created', 'valid' on a dry run, or 'error')
+    and the errors found. Raises ValueError when columns are missing.
+    """
+    reader = csv.DictReader(stream)
+    reader.fieldnames = [(field or '').strip().lower() for field in reader.fieldnames or []]
+    missing = [field for field in IMPORT_FIELDS if field not in reader.fieldnames]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    entries = []
+    seen = {'username': set(), 'email': set()}
+    for row in reader:
+        values = {field: (row.get(field) or '').strip() for field in IMPORT_FIELDS}
+        errors = [f'{field} is required' for field in IMPORT_FIELDS if not values[field]]
+        errors += [f'{field} is longer than {length} characters'
+                   for field, length in IMPORT_MAX_LENGTHS.items() if len(values[field]) > length]
+        if values['email'] and '@' not in values['email']:
+            errors.append('email is not valid')
+        for field in ('username', 'email'):
+            if values[field] in seen[field]:
+                errors.append(f'{field} appears more than once in the file')
+            seen[field].add(values[field])
+        entries.append({'line': reader.line_num, 'values': values, 'errors': errors})
+
+    existing = db.session.query(User.username, User.email).filter(or_(
+        User.username.in_(seen['username']),
+        User.email.in_(seen['email'])
+    )).all() if entries else []
+    taken_usernames = {row.username for row in existing}
+    taken_emails = {row.email for row in existing}
+    for entry in entries:
+        if entry['values']['username'] in taken_usernames:
+            entry['errors'].append('username already exists')
+        if entry['values']['email'] in taken_emails:
+            entry['errors'].append('email already exists')
+
+    valid = [entry for entry in entries if not entry['errors']]
+    if valid and not dry_run:
+        hashes = password_hasher.hash_many([entry['values']['password'] for entry in valid], hash_workers)
+        rows = [{
+            'username': entry['values']['username'],
+            'email': entry['values']['email'],
+            'password_hash': password_hash,
+            'full_name': entry['values']['full_name'],
+            'student_number': entry['values']['student_number'],
+            'class_name': entry['values']['class_name'],
+            'is_admin': False,
+            'is_active': True
+        } for entry, password_hash in zip(valid, hashes)]
+        # RETURNING rows may come back in any order, so ids are matched by username
+        user_ids = {}
+        for i in range(0, len(rows), UPSERT_BATCH_SIZE):
+            user_ids.update((row.username, row.id) for row in db.session.execute(
+                insert(User).returning(User.id, User.username), rows[i:i + UPSERT_BATCH_SIZE]
+            ))
+        add_default_activities([user_ids[row['username']] for row in rows])
+
+    status = 'valid' if dry_run else 'created'
+    report = [{
+        'line': entry['line'],
+        'username': entry['values']['username'],
+        'status': 'error' if entry['errors'] else status,
+        'errors': entry['errors']
+    } for entry in entries]
+    return (0 if dry_run else len(valid)), report
+
+@app.route('/admin/users/import', methods=['GET', 'POST'])
+@login_required
+def import_users_page():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('index'))
+    
+    if request.method == 'GET':
+        return render_template('import_users.html', fields=IMPORT_FIELDS)
+    
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        flash('Choose a CSV file to import.', 'danger')
+        return redirect(url_for('import_users_page'))
+    
+    dry_run = bool(request.form.get('dry_run'))
+    try:
+        # utf-8-sig drops the byte order mark spreadsheet programs write
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        created, report = import_users(stream, dry_run=dry_run,
+                                       hash_workers=app.config.get('IMPORT_HASH_WORKERS') or None)
+        db.session.commit()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        flash(f'Could not read the CSV file: {str(e)}', 'danger')
+        return redirect(url_for('import_users_page'))
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error importing users: {str(e)}")
+        flash(f'Error importing users: {str(e)}', 'danger')
+        return redirect(url_for('import_users_page'))
+    
+    if created:
+        user_count_cache.clear()
+    failed = sum(1 for entry in report if entry['errors'])
+    if dry_run:
+        flash(f'{len(report) - failed} lines are valid, {failed} have errors. Nothing was imported.', 'info')
+    else:
+        flash(f'Imported {created} users, {failed} lines skipped.', 'success' if not failed else 'warning')
+    return render_template('import_users.html', fields=IMPORT_FIELDS, report=report)
+
 @app.route('/create_user', methods=['GET', 'POST'])
 @login_required
 def create_user():
@@ -583,24 +2644,12 @@ def create_user():
             )
             user.set_password(password)
             
-            # Create default activities for the new user
-            today = datetime.now().date()
-            activities = [
-                Activity(user=user, name='Sholat Subuh', date=today),
-                Activity(user=user, name='Sholat Dzuhur', date=today),
-                Activity(user=user, name='Sholat Ashar', date=today),
-                Activity(user=user, name='Sholat Maghrib', date=today),
-                Activity(user=user, name='Sholat Isya', date=today),
-                Activity(user=user, name='Membaca Al-Quran', date=today),
-                Activity(user=user, name='Dzikir Pagi', date=today),
-                Activity(user=user, name='Dzikir Petang', date=today)
-            ]
-            
             db.session.add(user)
-            for activity in activities:
-                db.session.add(activity)
-            
+            db.session.flush()
+            # Create default activities for the new user
+            add_default_activities([user.id])
             db.session.commit()
+            user_count_cache.clear()
             flash('User created successfully.', 'success')
             return redirect(url_for('admin_users'))
             
@@ -611,6 +2660,33 @@ def create_user():
     
     return render_template('create_user.html')
 
+# Behavioural model of generated data, shared with generate_data.py: base
+# completion rate and weekend penalty per activity
+DUMMY_ACTIVITY_PROFILES = {
+    'Subuh': {'base_rate': 0.95, 'weekend_penalty': 0.15},
+    'Dzuhur': {'base_rate': 0.95, 'weekend_penalty': 0.15},
+    'Ashar': {'base_rate': 0.95, 'weekend_penalty': 0.15},
+    'Maghrib': {'base_rate': 0.95, 'weekend_penalty': 0.15},
+    'Isya': {'base_rate': 0.95, 'weekend_penalty': 0.15},
+    'Rowatib': {'base_rate': 0.8, 'weekend_penalty': 0.2},
+    'Qiyamulail': {'base_rate': 0.6, 'weekend_penalty': 0.2},
+    'Dhuha': {'base_rate': 0.6, 'weekend_penalty': 0.2},
+    'Tilawah Qur\'an': {'base_rate': 0.8, 'weekend_penalty': 0.2},
+    'Puasa': {'base_rate': 0.6, 'weekend_penalty': 0.2},
+    'Al-Ma\'tsurat Pagi': {'base_rate': 0.8, 'weekend_penalty': 0.2},
+    'Al-Ma\'tsurat Sore': {'base_rate': 0.8, 'weekend_penalty': 0.2}
+}
+# Extra Puasa chance on Monday and Thursday
+PUASA_BOOST = 0.2
+PUASA_BOOST_WEEKDAYS = (0, 3)
+
+def dummy_season_factor(month):
+    if month in [6, 7, 8]:  # Summer vacation
+        return 0.9
+    if month in [1, 12]:  # Winter holidays
+        return 0.85
+    return 1.0
+
 @app.route('/generate-dummy-data')
 @login_required
 def generate_dummy_data():
@@ -624,20 +2700,7 @@ def generate_dummy_data():
         print("Starting to generate dummy data...")
         
         # List of activities with their base completion rates
-        activities = {
-            'Subuh': {'base_rate': 0.95, 'weekend_penalty': 0.15},
-            'Dzuhur': {'base_rate': 0.95, 'weekend_penalty': 0.15},
-            'Ashar': {'base_rate': 0.95, 'weekend_penalty': 0.15},
-            'Maghrib': {'base_rate': 0.95, 'weekend_penalty': 0.15},
-            'Isya': {'base_rate': 0.95, 'weekend_penalty': 0.15},
-            'Rowatib': {'base_rate': 0.8, 'weekend_penalty': 0.2},
-            'Qiyamulail': {'base_rate': 0.6, 'weekend_penalty': 0.2},
-            'Dhuha': {'base_rate': 0.6, 'weekend_penalty': 0.2},
-            'Tilawah Qur\'an': {'base_rate': 0.8, 'weekend_penalty': 0.2},
-            'Puasa': {'base_rate': 0.6, 'weekend_penalty': 0.2},
-            'Al-Ma\'tsurat Pagi': {'base_rate': 0.8, 'weekend_penalty': 0.2},
-            'Al-Ma\'tsurat Sore': {'base_rate': 0.8, 'weekend_penalty': 0.2}
-        }
+        activities = DUMMY_ACTIVITY_PROFILES
         
         # Get all non-admin users (limit to 20 users)
         users = User.query.filter_by(is_admin=False).limit(20).all()
@@ -650,7 +2713,6 @@ def generate_dummy_data():
         # Generate data for the last year
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=365)  # 1 year
-        current_time = datetime.now()
         total_records = 0
         
         print(f"Generating data from {start_date} to {end_date}")
@@ -660,11 +2722,7 @@ def generate_dummy_data():
             
             try:
                 # Delete existing dummy data for this user
-                db.session.query(Activity).filter(
-                    Activity.user_id == user.id,
-                    Activity.date >= start_date,
-                    Activity.date <= end_date
-                ).delete(synchronize_session=False)
+                activity_storage.delete_range(user.id, start_date, end_date)
                 db.session.commit()
                 
                 # Prepare bulk insert data
@@ -679,12 +2737,7 @@ def generate_dummy_data():
                     is_ramadan = False  # TODO: Add Ramadan date check if needed
                     
                     # Add seasonal variations
-                    season_factor = 1.0
-                    month = current_date.month
-                    if month in [6, 7, 8]:  # Summer vacation
-                        season_factor = 0.9
-                    elif month in [1, 12]:  # Winter holidays
-                        season_factor = 0.85
+                    season_factor = dummy_season_factor(current_date.month)
                     
                     for activity_name, activity_info in activities.items():
                         base_rate = activity_info['base_rate']
@@ -700,8 +2753,8 @@ def generate_dummy_data():
                             completion_chance = 0.95  # Higher chance during Ramadan
                             
                         # Special cases
-                        if activity_name == 'Puasa' and current_date.weekday() in [0, 3]:  # Monday and Thursday
-                            completion_chance += 0.2
+                        if activity_name == 'Puasa' and current_date.weekday() in PUASA_BOOST_WEEKDAYS:
+                            completion_chance += PUASA_BOOST
                             
                         # Add some randomness but maintain the pattern
                         random_factor = random.uniform(0.9, 1.1)
@@ -711,22 +2764,22 @@ def generate_dummy_data():
                         completion_chance = max(0.1, min(0.99, completion_chance))
                         
                         activities_to_insert.append({
-                            'user_id': user.id,
                             'name': activity_name,
                             'date': current_date,
                             'completed': random.random() < completion_chance,
-                            'created_at': current_time,
-                            'updated_at': current_time
+                            'value': None
                         })
                     
                     current_date += timedelta(days=1)
                 
                 # Bulk insert in batches of 1000
-                batch_size = 1000
-                for i in range(0, len(activities_to_insert), batch_size):
-                    batch = activities_to_insert[i:i + batch_size]
-                    db.session.bulk_insert_mappings(Activity, batch)
-                    db.session.commit()
+                activity_storage.bulk_insert(user.id, activities_to_insert)
+                db.session.commit()
+                
+                rebuild_streaks(user.id)
+                rebuild_rollups(user.id)
+                db.session.commit()
+                dashboard_cache.invalidate(user.id)
                 
                 total_records += len(activities_to_insert)
                 print(f"Successfully inserted {len(activities_to_insert)} records for user {user.username}")
@@ -764,6 +2817,13 @@ def reset_activities_table():
         db.session.commit()
         print("Created new activities table")
         
+        # Streaks and rollups were derived from the dropped rows
+        ActivityMonth.query.delete()
+        ActivityStats.query.delete()
+        ActivityRollup.query.delete()
+        db.session.commit()
+        dashboard_cache.clear()
+        
         return jsonify({
             'success': True,
             'message': 'Activities table reset successfully'
@@ -786,6 +2846,7 @@ def init_db():
             # Create all tables
             print("Creating all tables...")
             db.create_all()
+            seed_activity_catalog()
             
             # Create admin user
             print("Creating admin user...")
@@ -0,0 +1,176 @@
+"""ASGI entry point with an async read path.
+
+    gunicorn -k uvicorn.workers.UvicornWorker --workers 2 asgi:application
+
+Under gthread workers every request holds a thread while it waits on the
+database, so 2 workers x 2 threads serve four requests at once and a slow
+yearly dashboard holds up everything behind it. Here the read-only JSON
+endpoints in ``ASYNC_ROUTES`` run on the event loop instead: the unchanged
+Flask view runs in a greenlet and its queries go through an async
+SQLAlchemy engine (asyncpg on PostgreSQL, aiosqlite on SQLite), so a
+request waiting on the database holds a suspended greenlet, not a thread.
+The other blocking calls of these views (write buffer flush, SQLite caches
+and metrics) go through ``app.off_event_loop()`` to a thread.
+
+Every other request, the writes included, is served by the WSGI app on a
+pool of ``ASYNC_WSGI_THREADS`` threads; streamed responses (exports) are
+passed on chunk by chunk.
+"""
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app import app, ASYNC_SESSION_ENVIRON_KEY, write_buffer
+
+# GET endpoints served on the event loop
+ASYNC_ROUTES = ('/api/stats', '/api/dashboard/stats')
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_database_url(url):
+    """``url`` with the async driver of its dialect."""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f'No async driver for {url.get_backend_name()}')
+    return url.set(drivername=driver)
+
+
+# Same pool settings as the sync engine, sized for the concurrent reads
+_database_url = make_url(app.config.get('ASYNC_DATABASE_URL') or async_database_url(app.config['SQLALCHEMY_DATABASE_URI']))
+_engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+_engine_options['pool_size'] = app.config.get('ASYNC_POOL_SIZE', 20)
+if _database_url.get_backend_name() == 'sqlite':
+    # aiosqlite defaults to NullPool, whose first connect takes a thread lock
+    # that deadlocks greenlets connecting concurrently on the event loop
+    _engine_options['poolclass'] = AsyncAdaptedQueuePool
+async_engine = create_async_engine(_database_url, **_engine_options)
+_threads = ThreadPoolExecutor(app.config.get('ASYNC_WSGI_THREADS', 4), thread_name_prefix='wsgi')
+
+
+def _environ(scope, body):
+    """WSGI environ of an ASGI HTTP request."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    # The body is read in full, chunked requests included
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+def _start_message(status, headers):
+    return {
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+    }
+
+
+async def _read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+def _call_async(session, environ):
+    # Runs in a greenlet: Flask blocks as usual while the queries await the database
+    environ[ASYNC_SESSION_ENVIRON_KEY] = session
+    started = []
+    iterable = app(environ, lambda status, headers, exc_info=None: started.append((status, headers)))
+    try:
+        body = b''.join(iterable)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    return _start_message(*started[-1]), body
+
+
+def _call_wsgi(environ, loop, send):
+    # Runs on a pool thread, the messages are sent by the event loop
+    started = []
+
+    def emit(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    iterable = app(environ, lambda status, headers, exc_info=None: started.append((status, headers)))
+    try:
+        for chunk in iterable:
+            if chunk:
+                if started:
+                    emit(_start_message(*started.pop()))
+                emit({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    if started:
+        emit(_start_message(*started.pop()))
+    emit({'type': 'http.response.body', 'body': b''})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if write_buffer is not None:
+                await asyncio.get_running_loop().run_in_executor(_threads, write_buffer.flush)
+            await async_engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        raise ValueError(f"Unsupported ASGI scope: {scope['type']}")
+
+    environ = _environ(scope, await _read_body(receive))
+    if scope['method'] in ('GET', 'HEAD') and scope['path'] in ASYNC_ROUTES:
+        async with AsyncSession(async_engine) as session:
+            start, body = await session.run_sync(_call_async, environ)
+        await send(start)
+        await send({'type': 'http.response.body', 'body': body})
+    else:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_threads, _call_wsgi, environ, loop, send)
@@ -0,0 +1,275 @@
+from app import app, db, User, DUMMY_ACTIVITY_PROFILES
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+import numpy as np
+from config import get_config
+
+# Relative frequency of each user action, roughly what a student session does
+USER_MIX = {
+    'GET /': 10,
+    'GET /api/stats (month)': 25,
+    'POST /api/stats (grid save)': 20,
+    'GET /api/dashboard/stats (daily)': 10,
+    'GET /api/dashboard/stats (weekly)': 10,
+    'GET /api/dashboard/stats (monthly)': 10,
+    'GET /api/dashboard/stats (yearly)': 5
+}
+ADMIN_MIX = {
+    'GET /admin/users': 3,
+    'GET /api/admin/users': 3,
+    'GET /api/admin/cohorts': 2
+}
+ACTIVITY_NAMES = list(DUMMY_ACTIVITY_PROFILES)
+
+class TestClientSession:
+    """Drives the app in process through the Flask test client."""
+
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method, path, params=None, form=None, json_body=None):
+        response = self.client.open(path, method=method, query_string=params, data=form, json=json_body)
+        return response.status_code, len(response.get_data())
+
+class NoRedirect(HTTPRedirectHandler):
+    # Report redirects like the test client does: a 302 to /login is a failed request
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class HTTPSession:
+    """Drives a running server (e.g. a local gunicorn) over HTTP with its own cookies."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), NoRedirect)
+
+    def request(self, method, path, params=None, form=None, json_body=None):
+        url = self.base_url + path
+        if params:
+            url += '?' + urlencode(params)
+        data, headers = None, {}
+        if form is not None:
+            data = urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        try:
+            with self.opener.open(Request(url, data=data, headers=headers, method=method)) as response:
+                return response.status, len(response.read())
+        except HTTPError as e:
+            return e.code, len(e.read())
+
+def month_range(day):
+    start = day.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+def user_action(rng, name, today):
+    """(method, path, params, json body) for one action of the user mix."""
+    if name == 'GET /':
+        return 'GET', '/', None, None
+    if name == 'GET /api/stats (month)':
+        start, end = month_range(today - timedelta(days=rng.randrange(365)))
+        return 'GET', '/api/stats', {'start': start.isoformat(), 'end': end.isoformat(), 'format': 'grid'}, None
+    if name == 'POST /api/stats (grid save)':
+        start, _ = month_range(today)
+        cells = [{
+            'name': rng.choice(ACTIVITY_NAMES),
+            'date': (start + timedelta(days=rng.randrange(today.day))).isoformat(),
+            'completed': rng.random() < 0.8,
+            'value': None
+        } for _ in range(rng.randint(1, 12))]
+        return 'POST', '/api/stats', None, {'activities': cells}
+    view_type = name[name.index('(') + 1:-1]
+    return 'GET', '/api/dashboard/stats', {
+        'view_type': view_type, 'month': today.month, 'year': today.year
+    }, None
+
+def admin_action(rng, name):
+    if name == 'GET /admin/users':
+        return 'GET', '/admin/users', None, None
+    if name == 'GET /api/admin/users':
+        return 'GET', '/api/admin/users', {'sort': rng.choice(['id', 'username'])}, None
+    return 'GET', '/api/admin/cohorts', None, None
+
+def seed_database(users, years, seed):
+    from generate_data import generate
+    with app.app_context():
+        db.create_all()
+        generate(users, years * 365, seed, classes=10, prefix='loadtest', password='loadtest123',
+                 chunk_size=200, derived=True)
+
+def benchmark_users(limit):
+    with app.app_context():
+        return [row.username for row in db.session.query(User.username).filter(
+            User.username.like('loadtest%')
+        ).order_by(User.username).limit(limit)]
+
+def plan(rng, usernames, count, admin_share):
+    """Seeded list of (session name, action name), so runs are comparable."""
+    user_names, user_weights = zip(*USER_MIX.items())
+    admin_names, admin_weights = zip(*ADMIN_MIX.items())
+    actions = []
+    for _ in range(count):
+        if rng.random() < admin_share:
+            actions.append((None, rng.choices(admin_names, admin_weights)[0]))
+        else:
+            actions.append((rng.choice(usernames), rng.choices(user_names, user_weights)[0]))
+    return actions
+
+def run(actions, new_session, admin, concurrency, seed):
+    """Replay ``actions`` and return {endpoint: [(latency_ms, ok), ...]} and the wall time."""
+    samples = {}
+    lock = threading.Lock()
+    today = datetime.now().date()
+
+    def record(name, latency, ok):
+        with lock:
+            samples.setdefault(name, []).append((latency, ok))
+
+    def timed(name, session, method, path, params=None, form=None, json_body=None, expected=(200, 304)):
+        started = time.perf_counter()
+        status, _ = session.request(method, path, params=params, form=form, json_body=json_body)
+        record(name, (time.perf_counter() - started) * 1000, status in expected)
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        sessions = {}
+        for username, name in actions[index::concurrency]:
+            key = username or admin[0]
+            session = sessions.get(key)
+            if session is None:
+                # First request of a session logs in; bcrypt makes this a separate cost
+                session = sessions[key] = new_session()
+                password = admin[1] if username is None else 'loadtest123'
+                timed('POST /login', session, 'POST', '/login',
+                      form={'username': key, 'password': password}, expected=(302,))
+            if username is None:
+                method, path, params, body = admin_action(rng, name)
+            else:
+                method, path, params, body = user_action(rng, name, today)
+            timed(name, session, method, path, params=params, json_body=body)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    return samples, time.perf_counter() - started
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    for name, values in sorted(samples.items()):
+        latencies = np.array([latency for latency, _ in values])
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        endpoints[name] = {
+            'count': len(values),
+            'errors': sum(1 for _, ok in values if not ok),
+            'throughput_rps': round(len(values) / elapsed, 2),
+            'mean_ms': round(float(latencies.mean()), 3),
+            'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3),
+            'max_ms': round(float(latencies.max()), 3)
+        }
+    total = sum(endpoint['count'] for endpoint in endpoints.values())
+    return {
+        'requests': total,
+        'errors': sum(endpoint['errors'] for endpoint in endpoints.values()),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 2),
+        'endpoints': endpoints
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report, baseline):
+    """Print the p50/p95 change of every endpoint against an earlier report."""
+    print(f"{'endpoint':40} {'p50 ms':>18} {'p95 ms':>18}")
+    for name, current in report['endpoints'].items():
+        previous = baseline['endpoints'].get(name)
+        if previous is None:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms'):
+            change = (current[key] - previous[key]) / previous[key] * 100 if previous[key] else 0
+            cells.append(f"{previous[key]:.1f} -> {current[key]:.1f} ({change:+.0f}%)")
+        print(f"{name:40} {cells[0]:>18} {cells[1]:>18}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the main endpoints and report latency percentiles')
+    parser.add_argument('--seed-users', type=int, default=0,
+                        help='generate this many loadtest users first (see generate_data.py)')
+    parser.add_argument('--years', type=int, default=1, help='years of history for generated users')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for the dataset and request mix')
+    parser.add_argument('--requests', type=int, default=2000, help='number of requests after login')
+    parser.add_argument('--users', type=int, default=50, help='number of loadtest users taking part')
+    parser.add_argument('--admin-share', type=float, default=0.05, help='fraction of admin requests')
+    parser.add_argument('--admin', default='admin:admin123', help='admin credentials as username:password')
+    parser.add_argument('--url', help='benchmark a running server (e.g. http://127.0.0.1:8000) instead of the test client')
+    parser.add_argument('--concurrency', type=int, default=1, help='parallel sessions')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--compare', help='earlier JSON report to compare against')
+    args = parser.parse_args()
+
+    # Load configuration based on environment
+    env = os.environ.get('FLASK_ENV', 'development')
+    app.config.from_object(get_config(env))
+
+    # Keep stdout for the report, the app logs with print()
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.seed_users:
+            seed_database(args.seed_users, args.years, args.seed)
+        usernames = benchmark_users(args.users)
+        if not usernames:
+            sys.exit('No loadtest users found, run with --seed-users or generate_data.py first')
+
+        if args.url:
+            new_session = lambda: HTTPSession(args.url)
+        else:
+            new_session = TestClientSession
+        actions = plan(random.Random(args.seed), usernames, args.requests, args.admin_share)
+        samples, elapsed = run(actions, new_session, args.admin.split(':', 1), args.concurrency, args.seed)
+    with app.app_context():
+        database = db.engine.dialect.name
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'database': database if not args.url else None,
+            'target': args.url or 'test_client',
+            'users': len(usernames),
+            'seed': args.seed,
+            'concurrency': args.concurrency
+        },
+        **summarize(samples, elapsed)
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
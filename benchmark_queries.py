@@ -0,0 +1,122 @@
+from app import (app, db, hot_queries, User, Activity, ActivityStats, ActivityRollup, ActivityDefinition,
+                 ALL_ACTIVITIES, DUMMY_ACTIVITY_PROFILES, activity_catalog, _rollup_period)
+from queries import dashboard_analytics_statement
+import argparse
+import contextlib
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, cast
+from config import get_config
+
+# Hot queries each route runs, for the per-request totals
+ROUTE_QUERIES = {
+    'POST /login': ['user by username'],
+    'GET /': ['streak', 'activities (day)'],
+    'GET /api/stats': ['range version', 'activities (month)'],
+    'POST /api/stats': ['stored completion', 'daily completion'],
+    'GET /api/dashboard/stats': ['dashboard analytics']
+}
+
+def month_range(day):
+    start = day.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+def query_pairs(user, today):
+    """name -> (Model.query form as before, cached statement), each returning all rows."""
+    start, end = month_range(today)
+    year_start, year_end = today.replace(month=1, day=1), today.replace(month=12, day=31)
+    activity_ids = [activity_catalog.id_of(name) for name in list(DUMMY_ACTIVITY_PROFILES)[:3]]
+    dates = [today - timedelta(days=offset) for offset in range(3)]
+    period = _rollup_period(year_start, year_end)
+    return {
+        'user by username': (
+            lambda: User.query.filter_by(username=user.username).first(),
+            lambda: db.session.scalars(hot_queries.user_by_username(user.username)).first()
+        ),
+        'streak': (
+            lambda: ActivityStats.query.filter_by(user_id=user.id, activity_name=ALL_ACTIVITIES).first(),
+            lambda: db.session.scalars(hot_queries.streak(user.id, ALL_ACTIVITIES)).first()
+        ),
+        'activities (day)': (
+            lambda: Activity.query.filter(Activity.user_id == user.id, Activity.date >= today,
+                                          Activity.date <= today).order_by(Activity.date).all(),
+            lambda: db.session.scalars(hot_queries.activities(user.id, today, today)).all()
+        ),
+        'range version': (
+            lambda: db.session.query(func.count(), func.max(Activity.id), func.max(Activity.updated_at)).filter(
+                Activity.user_id == user.id, Activity.date >= start, Activity.date <= end).one(),
+            lambda: db.session.execute(hot_queries.range_version(user.id, start, end)).one()
+        ),
+        'activities (month)': (
+            lambda: Activity.query.filter(Activity.user_id == user.id, Activity.date >= start,
+                                          Activity.date <= end).order_by(Activity.date).all(),
+            lambda: db.session.scalars(hot_queries.activities(user.id, start, end)).all()
+        ),
+        'stored completion': (
+            lambda: db.session.query(Activity.activity_id, Activity.date, Activity.completed).filter(
+                Activity.user_id == user.id, Activity.activity_id.in_(activity_ids), Activity.date.in_(dates)).all(),
+            lambda: db.session.execute(hot_queries.stored_completion(user.id, activity_ids, dates)).all()
+        ),
+        'daily completion': (
+            lambda: db.session.query(
+                Activity.date, (func.count() == func.sum(cast(Activity.completed, db.Integer))).label('completed')
+            ).filter(Activity.user_id == user.id, Activity.date.in_(dates)).group_by(Activity.date).all(),
+            lambda: db.session.execute(hot_queries.daily_completion(user.id, dates)).all()
+        ),
+        'dashboard analytics': (
+            lambda: db.session.execute(dashboard_analytics_statement(
+                Activity, ActivityRollup, ActivityDefinition, ALL_ACTIVITIES, user.id, year_start, year_end, period
+            )).all(),
+            lambda: db.session.execute(hot_queries.dashboard_analytics(user.id, year_start, year_end, period)).all()
+        )
+    }
+
+def per_call_us(function, iterations):
+    function()  # Compile and fill the caches first
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+def run(username, iterations):
+    with app.app_context():
+        query = User.query.filter_by(is_admin=False)
+        user = (query.filter_by(username=username) if username else query.order_by(User.id)).first()
+        if user is None:
+            sys.exit('No such student, create users with generate_data.py first')
+
+        results = {}
+        for name, (legacy, hot) in query_pairs(user, datetime.now().date()).items():
+            if legacy() != hot():
+                sys.exit(f'{name}: the cached statement returns other rows than the query')
+            results[name] = (per_call_us(legacy, iterations), per_call_us(hot, iterations))
+            db.session.rollback()
+        return user.username, db.engine.dialect.name, results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the hot queries as Model.query and as cached lambda statements')
+    parser.add_argument('--user', help='student whose data is queried (default: the first one)')
+    parser.add_argument('--iterations', type=int, default=2000, help='calls per query and form')
+    args = parser.parse_args()
+
+    # Load configuration based on environment
+    env = os.environ.get('FLASK_ENV', 'development')
+    app.config.from_object(get_config(env))
+
+    # Keep stdout for the table, the app logs with print()
+    with contextlib.redirect_stdout(sys.stderr):
+        username, database, results = run(args.user, args.iterations)
+
+    print(f"{database}, user {username}, {args.iterations} calls each, microseconds per call")
+    print(f"{'query':28} {'Model.query':>12} {'cached':>12} {'saved':>12}")
+    for name, (legacy, hot) in results.items():
+        print(f"{name:28} {legacy:12.1f} {hot:12.1f} {legacy - hot:12.1f}")
+    print()
+    print(f"{'route':28} {'Model.query':>12} {'cached':>12} {'saved':>12}")
+    for route, names in ROUTE_QUERIES.items():
+        legacy = sum(results[name][0] for name in names)
+        hot = sum(results[name][1] for name in names)
+        print(f"{route:28} {legacy:12.1f} {hot:12.1f} {legacy - hot:12.1f}")
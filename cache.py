@@ -0,0 +1,409 @@
+"""Response cache for dashboard statistics.
+
+Entries are keyed by (user_id, view_type, period) and remember the date range
+they were computed from, so a write only drops the entries whose range
+contains one of the written dates. Entries also expire ``ttl`` seconds after
+they were stored (0 keeps them until dropped), which bounds how stale an
+entry can get when its invalidation does not reach it: a write served by
+another worker of the memory backend, or a read from a lagging replica.
+
+A request that read the activities before a write committed must not store
+its stale payload after the write's invalidation ran. Readers take the
+user's ``generation()`` before reading, ``invalidate()`` bumps it, and
+``set()`` with an older generation is refused.
+Two backends are available:
+
+* ``MemoryCache``: LRU in the worker process, bounded by payload bytes.
+* ``SQLiteCache``: LRU in a SQLite file shared by all gunicorn workers,
+  e.g. ``sqlite:////dev/shm/tracker_muslim_cache.db``.
+
+``create_cache()`` picks one from the ``DASHBOARD_CACHE`` setting.
+
+``TTLCache`` and ``SQLiteTTLCache`` are plain expiring key/value caches,
+per process and shared by the workers; ``create_ttl_cache()`` picks one.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class DashboardCache:
+    """Interface shared by the cache backends."""
+    backend = 'none'
+
+    def __init__(self, max_bytes=0, ttl=0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def _expires(self):
+        """Expiry time of an entry stored now, None when entries do not expire."""
+        return time.time() + self.ttl if self.ttl else None
+
+    def get(self, key):
+        """Cached payload for ``key`` or None."""
+        return None
+
+    def generation(self, user_id):
+        """Counter of the user's invalidations, taken before reading what ``set()`` stores."""
+        return 0
+
+    def set(self, key, user_id, start_date, end_date, value, generation=None):
+        """Store a payload computed from the activities between the two dates.
+
+        Refused when ``generation`` is given and the user was invalidated since.
+        """
+
+    def invalidate(self, user_id, dates=None):
+        """Drop the entries of a user covering any of ``dates`` (all of them if None)."""
+
+    def clear(self):
+        """Drop every entry."""
+
+    def stats(self):
+        return {
+            'backend': self.backend,
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'refused': 0,
+            'entries': 0,
+            'bytes': 0,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl
+        }
+
+
+class MemoryCache(DashboardCache):
+    """In-process LRU cache, only coherent with a single worker."""
+    backend = 'memory'
+
+    def __init__(self, max_bytes, ttl=0):
+        super().__init__(max_bytes, ttl)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (user_id, start, end, value, expires)
+        self._by_user = {}
+        self._bytes = 0
+        self._generations = {}  # user_id -> invalidations, 0 -> clear() calls
+        self._counters = dict.fromkeys(('hits', 'misses', 'evictions', 'invalidations', 'refused'), 0)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[4] is not None and entry[4] < time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return entry[3]
+
+    def generation(self, user_id):
+        with self._lock:
+            return self._generations.get(user_id, 0) + self._generations.get(0, 0)
+
+    def set(self, key, user_id, start_date, end_date, value, generation=None):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and \
+                    generation != self._generations.get(user_id, 0) + self._generations.get(0, 0):
+                self._counters['refused'] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (user_id, start_date, end_date, value, self._expires())
+            self._by_user.setdefault(user_id, set()).add(key)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counters['evictions'] += 1
+
+    def invalidate(self, user_id, dates=None):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for key in list(self._by_user.get(user_id, ())):
+                _, start_date, end_date, _, _ = self._entries[key]
+                if dates is None or any(start_date <= date <= end_date for date in dates):
+                    self._remove(key)
+                    self._counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self._bytes = 0
+            self._generations[0] = self._generations.get(0, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            stats = super().stats()
+            stats.update(self._counters)
+            stats.update(entries=len(self._entries), bytes=self._bytes)
+            return stats
+
+    def _remove(self, key):
+        user_id, _, _, value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+        keys = self._by_user[user_id]
+        keys.discard(key)
+        if not keys:
+            del self._by_user[user_id]
+
+
+# Generation of a user: their invalidations plus the clear() calls
+GENERATION_SQL = 'SELECT COALESCE(SUM(generation), 0) FROM generations WHERE user_id IN (?, 0)'
+
+
+class SQLiteCache(DashboardCache):
+    """LRU cache in a SQLite file, shared by every worker on the host."""
+    backend = 'sqlite'
+
+    def __init__(self, path, max_bytes, ttl=0):
+        super().__init__(max_bytes, ttl)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(entries)')]
+            if columns and 'expires' not in columns:
+                # Cache file of an earlier version, its entries can simply go
+                conn.execute('DROP TABLE entries')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, user_id INTEGER NOT NULL, '
+                'start_date TEXT NOT NULL, end_date TEXT NOT NULL, '
+                'value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL, expires REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_user ON entries (user_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed)')
+            # Invalidations per user, user 0 counts clear() calls
+            conn.execute('CREATE TABLE IF NOT EXISTS generations (user_id INTEGER PRIMARY KEY, generation INTEGER NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            conn.executemany(
+                'INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)',
+                [('hits',), ('misses',), ('evictions',), ('invalidations',), ('refused',)]
+            )
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT value FROM entries WHERE key = ? AND (expires IS NULL OR expires >= ?)', (key, time.time())
+            ).fetchone()
+            if row is None:
+                self._count(conn, 'misses')
+                return None
+            conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (time.time(), key))
+            self._count(conn, 'hits')
+            return row[0]
+
+    def generation(self, user_id):
+        return self._connect().execute(GENERATION_SQL, (user_id,)).fetchone()[0]
+
+    def set(self, key, user_id, start_date, end_date, value, generation=None):
+        if len(value) > self.max_bytes:
+            return
+        with self._connect() as conn:
+            # One statement, so an invalidate() of another worker cannot come between check and insert
+            stored = conn.execute(
+                'INSERT OR REPLACE INTO entries (key, user_id, start_date, end_date, value, size, accessed, expires) '
+                f'SELECT ?, ?, ?, ?, ?, ?, ?, ? WHERE ? IS NULL OR ({GENERATION_SQL}) = ?',
+                (key, user_id, start_date.isoformat(), end_date.isoformat(), value, len(value), time.time(),
+                 self._expires(), generation, user_id, generation)
+            ).rowcount
+            if not stored:
+                self._count(conn, 'refused')
+                return
+            conn.execute('DELETE FROM entries WHERE expires < ?', (time.time(),))
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            evicted = []
+            for old_key, size in conn.execute('SELECT key, size FROM entries ORDER BY accessed'):
+                if total <= self.max_bytes:
+                    break
+                evicted.append((old_key,))
+                total -= size
+            conn.executemany('DELETE FROM entries WHERE key = ?', evicted)
+            self._count(conn, 'evictions', len(evicted))
+
+    def invalidate(self, user_id, dates=None):
+        with self._connect() as conn:
+            self._bump(conn, user_id)
+            if dates is None:
+                removed = conn.execute('DELETE FROM entries WHERE user_id = ?', (user_id,)).rowcount
+            else:
+                removed = 0
+                for date in set(dates):
+                    removed += conn.execute(
+                        'DELETE FROM entries WHERE user_id = ? AND start_date <= ? AND end_date >= ?',
+                        (user_id, date.isoformat(), date.isoformat())
+                    ).rowcount
+            self._count(conn, 'invalidations', removed)
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM entries')
+            self._bump(conn, 0)
+
+    def stats(self):
+        stats = super().stats()
+        conn = self._connect()
+        stats.update(conn.execute('SELECT name, value FROM counters').fetchall())
+        entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        stats.update(entries=entries, bytes=size)
+        return stats
+
+    def _connect(self):
+        # sqlite3 connections must stay on the thread (and process) that opened them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, conn, name, amount=1):
+        if amount:
+            conn.execute('UPDATE counters SET value = value + ? WHERE name = ?', (amount, name))
+
+    def _bump(self, conn, user_id):
+        conn.execute(
+            'INSERT INTO generations (user_id, generation) VALUES (?, 1) '
+            'ON CONFLICT (user_id) DO UPDATE SET generation = generation + 1',
+            (user_id,)
+        )
+
+
+class TTLCache:
+    """Small thread-safe cache whose entries expire after ``ttl`` seconds.
+
+    Bounded to ``max_entries``, dropping the oldest entry first. Used for
+    values that may be slightly stale, such as admin listing counts.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires, value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[1] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteTTLCache:
+    """``TTLCache`` in a SQLite file shared by every worker on the host.
+
+    Values must be JSON serializable. A ``pop()`` in one worker is seen by
+    all of them on their next ``get()``.
+    """
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ttl_entries ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ttl_entries_expires ON ttl_entries (expires)')
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value FROM ttl_entries WHERE key = ? AND expires >= ?', (str(key), time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO ttl_entries (key, value, expires) VALUES (?, ?, ?)',
+                (str(key), json.dumps(value), now + self.ttl)
+            )
+            conn.execute('DELETE FROM ttl_entries WHERE expires < ?', (now,))
+            excess = conn.execute('SELECT COUNT(*) FROM ttl_entries').fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    'DELETE FROM ttl_entries WHERE key IN (SELECT key FROM ttl_entries ORDER BY expires LIMIT ?)',
+                    (excess,)
+                )
+
+    def pop(self, key):
+        with self._connect() as conn:
+            row = conn.execute('SELECT value FROM ttl_entries WHERE key = ?', (str(key),)).fetchone()
+            conn.execute('DELETE FROM ttl_entries WHERE key = ?', (str(key),))
+        return json.loads(row[0]) if row else None
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM ttl_entries')
+
+    def _connect(self):
+        # sqlite3 connections must stay on the thread (and process) that opened them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+def _sqlite_path(url):
+    path = url[len('sqlite:///'):]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return path
+
+
+def create_ttl_cache(url, max_entries, ttl):
+    """Build the backend named by ``url``: 'memory' or 'sqlite:///<path>'."""
+    if not url or url == 'memory':
+        return TTLCache(max_entries, ttl)
+    if url.startswith('sqlite:///'):
+        return SQLiteTTLCache(_sqlite_path(url), max_entries, ttl)
+    raise ValueError(f'Unknown TTL cache backend: {url}')
+
+
+def create_cache(url, max_bytes, ttl=0):
+    """Build the backend named by ``url``: 'memory', 'none' or 'sqlite:///<path>'."""
+    if not url or url == 'none':
+        return DashboardCache(max_bytes, ttl)
+    if url == 'memory':
+        return MemoryCache(max_bytes, ttl)
+    if url.startswith('sqlite:///'):
+        return SQLiteCache(_sqlite_path(url), max_bytes, ttl)
+    raise ValueError(f'Unknown dashboard cache backend: {url}')
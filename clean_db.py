@@ -18,9 +18,6 @@ def clean_database():
             db.session.execute(text('DROP TABLE IF EXISTS "user"'))
             print('Dropped user table')
             
-            db.session.execute(text('DROP TABLE IF EXISTS activity_stats'))
-            print('Dropped activity_stats table')
-            
             db.session.commit()
             print("Database cleaned successfully")
             
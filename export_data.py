@@ -0,0 +1,46 @@
+from app import app, User, EXPORT_FORMATS, export_activities
+import argparse
+import os
+import sys
+from datetime import datetime
+from config import get_config
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def export_data(response_format, start_date, end_date, class_name, usernames, output):
+    with app.app_context():
+        user_ids = None
+        if usernames:
+            users = dict(User.query.with_entities(User.username, User.id).filter(User.username.in_(usernames)))
+            missing = sorted(set(usernames) - set(users))
+            if missing:
+                raise SystemExit(f"Unknown users: {', '.join(missing)}")
+            user_ids = list(users.values())
+
+        written = 0
+        for chunk in export_activities(response_format, start_date, end_date, class_name, user_ids):
+            output.write(chunk)
+            written += len(chunk)
+        output.flush()
+        print(f"Exported {written} characters of {response_format} from {start_date} to {end_date}", file=sys.stderr)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export activities of a date range as CSV or NDJSON')
+    parser.add_argument('--start', type=parse_date, required=True, help='first day, YYYY-MM-DD')
+    parser.add_argument('--end', type=parse_date, required=True, help='last day, YYYY-MM-DD')
+    parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv', help='output format')
+    parser.add_argument('--class-name', help='only students of this class')
+    parser.add_argument('--user', action='append', dest='usernames', help='only this username (repeatable)')
+    parser.add_argument('--output', default='-', help='file to write, - for stdout')
+    args = parser.parse_args()
+
+    # Load configuration based on environment
+    env = os.environ.get('FLASK_ENV', 'development')
+    app.config.from_object(get_config(env))
+
+    if args.output == '-':
+        export_data(args.format, args.start, args.end, args.class_name, args.usernames, sys.stdout)
+    else:
+        with open(args.output, 'w', encoding='utf-8', newline='') as output:
+            export_data(args.format, args.start, args.end, args.class_name, args.usernames, output)
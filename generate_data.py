@@ -0,0 +1,227 @@
+from app import (app, db, bcrypt, User, Activity, ActivityMonth, DUMMY_ACTIVITY_PROFILES, PUASA_BOOST,
+                 PUASA_BOOST_WEEKDAYS, VALUE_UNSET, VALUES_FORMAT, activity_catalog, activity_storage,
+                 seed_activity_catalog, rebuild_streaks, rebuild_rollups, dashboard_cache)
+import argparse
+import io
+import os
+import struct
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import insert
+from config import get_config
+
+ACTIVITY_NAMES = list(DUMMY_ACTIVITY_PROFILES)
+BASE_RATES = np.array([DUMMY_ACTIVITY_PROFILES[name]['base_rate'] for name in ACTIVITY_NAMES])
+WEEKEND_PENALTIES = np.array([DUMMY_ACTIVITY_PROFILES[name]['weekend_penalty'] for name in ACTIVITY_NAMES])
+PUASA_INDEX = ACTIVITY_NAMES.index('Puasa')
+
+def season_factors(months):
+    # Vectorized dummy_season_factor()
+    return np.select([np.isin(months, [6, 7, 8]), np.isin(months, [1, 12])], [0.9, 0.85], 1.0)
+
+def completion_matrix(rng, user_count, days):
+    """Completed flags shaped (users, days, activities), same model as generate_dummy_data()."""
+    days = np.asarray(days, dtype='datetime64[D]')
+    weekdays = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    months = days.astype('datetime64[M]').astype(np.int64) % 12 + 1
+
+    bias = rng.uniform(0.9, 1.1, size=(user_count, 1, 1))
+    chance = BASE_RATES * bias * season_factors(months)[None, :, None]
+    chance -= (weekdays >= 5)[None, :, None] * WEEKEND_PENALTIES
+    chance[:, :, PUASA_INDEX] += np.isin(weekdays, PUASA_BOOST_WEEKDAYS) * PUASA_BOOST
+    chance *= rng.uniform(0.9, 1.1, size=chance.shape)
+    np.clip(chance, 0.1, 0.99, out=chance)
+    return rng.random(chance.shape) < chance
+
+def ensure_users(count, classes, prefix, password):
+    """Ids of the ``count`` generated users, creating the missing ones in bulk."""
+    usernames = [f'{prefix}{i:06d}' for i in range(count)]
+    existing = {
+        row.username for row in db.session.query(User.username).filter(User.username.like(f'{prefix}%'))
+    }
+    # Hash once: bcrypt would otherwise dominate the run time
+    password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+    missing = [{
+        'username': username,
+        'password_hash': password_hash,
+        'email': f'{username}@example.com',
+        'full_name': f'Load Test {i:06d}',
+        'student_number': f'{prefix[:4]}{i:06d}',
+        'class_name': f'LT-{i % classes + 1:02d}',
+        'is_admin': False,
+        'is_active': True
+    } for i, username in enumerate(usernames) if username not in existing]
+    if missing:
+        db.session.execute(insert(User), missing)
+        db.session.commit()
+    print(f"Created {len(missing)} users, reusing {count - len(missing)}")
+
+    ids = dict(db.session.query(User.username, User.id).filter(User.username.like(f'{prefix}%')))
+    return [ids[username] for username in usernames]
+
+ACTIVITY_COLUMNS = 'user_id, activity_id, date, completed, created_at, updated_at'
+
+def activity_rows(chunk, activity_ids, dates, completed):
+    """Activity rows of a completion matrix as a record array, in its (user, day, activity) order."""
+    users, days, activities = completed.shape
+    return np.rec.fromarrays([
+        np.repeat(np.asarray(chunk), days * activities),
+        np.tile(np.asarray(activity_ids), users * days),
+        np.tile(np.repeat(dates.astype(str), activities), users),
+        completed.ravel().astype(np.int8)
+    ], names='user_id,activity_id,date,completed')
+
+def copy_rows(rows, created):
+    """Stream activity rows with COPY on PostgreSQL (psycopg2 or psycopg 3), executemany on SQLite."""
+    connection = db.session.connection()
+    cursor = connection.connection.cursor()
+    if connection.dialect.name == 'postgresql':
+        # COPY text format, written from the arrays; 1 and 0 are valid booleans
+        buffer = io.StringIO()
+        np.savetxt(buffer, rows, fmt=f'%d\t%d\t%s\t%d\t{created}\t{created}')
+        sql = f'COPY activities ({ACTIVITY_COLUMNS}) FROM STDIN'
+        if connection.dialect.driver == 'psycopg':
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+    else:
+        cursor.executemany(
+            f"INSERT INTO activities ({ACTIVITY_COLUMNS}) VALUES (?, ?, ?, ?, '{created}', '{created}')",
+            rows.tolist()
+        )
+
+def pack_months(completed, dates):
+    """First days of the months and the recorded and completed day masks, shaped (users, months, activities)."""
+    months = dates.astype('datetime64[M]')
+    bits = np.left_shift(1, (dates - months.astype('datetime64[D]')).astype(np.int64))[None, :, None]
+    starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+    recorded = np.add.reduceat(np.broadcast_to(bits, completed.shape), starts, axis=1)
+    return months[starts].astype('datetime64[D]').tolist(), recorded, np.add.reduceat(completed * bits, starts, axis=1)
+
+def range_mask(month, start_date, end_date):
+    """Bits of the days of ``month`` between start_date and end_date."""
+    first = start_date.day if start_date.replace(day=1) == month else 1
+    last = end_date.day if end_date.replace(day=1) == month else 31
+    return ((1 << last) - 1) & ~((1 << (first - 1)) - 1)
+
+def write_months(chunk, completed, dates, start_date, end_date, updated_at):
+    """Replace the chunk's activity_months of the range with the packed completion matrix.
+
+    Days of the first and last month outside the range are kept, like the
+    activities rows outside it in the rows storage.
+    """
+    first_month, last_month = start_date.replace(day=1), end_date.replace(day=1)
+    kept = {}
+    for month in ActivityMonth.query.filter(ActivityMonth.user_id.in_(chunk),
+                                            ActivityMonth.month.in_([first_month, last_month])):
+        recorded = month.recorded & ~range_mask(month.month, start_date, end_date)
+        if not recorded:
+            continue
+        values = None
+        if month.values is not None:
+            day_values = [value if recorded >> index & 1 else VALUE_UNSET
+                          for index, value in enumerate(month.get_values())]
+            if any(value != VALUE_UNSET for value in day_values):
+                values = struct.pack(VALUES_FORMAT, *day_values)
+        kept[(month.user_id, month.activity_name, month.month)] = (recorded, month.completed & recorded, values)
+    ActivityMonth.query.filter(
+        ActivityMonth.user_id.in_(chunk),
+        ActivityMonth.month >= first_month,
+        ActivityMonth.month <= last_month
+    ).delete(synchronize_session=False)
+
+    months, recorded, completed = pack_months(completed, dates)
+    recorded, completed = recorded.tolist(), completed.tolist()
+    rows = []
+    for u, user_id in enumerate(chunk):
+        for m, month in enumerate(months):
+            for a, name in enumerate(ACTIVITY_NAMES):
+                kept_recorded, kept_completed, values = kept.pop((user_id, name, month), (0, 0, None))
+                rows.append({
+                    'user_id': user_id,
+                    'activity_name': name,
+                    'month': month,
+                    'recorded': recorded[u][m][a] | kept_recorded,
+                    'completed': completed[u][m][a] | kept_completed,
+                    'values': values,
+                    'updated_at': updated_at
+                })
+    # Activities the generator does not write, with days outside the range
+    rows.extend({
+        'user_id': user_id,
+        'activity_name': name,
+        'month': month,
+        'recorded': kept_recorded,
+        'completed': kept_completed,
+        'values': values,
+        'updated_at': updated_at
+    } for (user_id, name, month), (kept_recorded, kept_completed, values) in kept.items())
+    db.session.execute(insert(ActivityMonth), rows)
+
+def generate(users, days, seed, classes, prefix, password, chunk_size, derived):
+    rng = np.random.default_rng(seed)
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=days - 1)
+    dates = np.arange(np.datetime64(start_date), np.datetime64(end_date) + 1)
+    created = datetime.now().isoformat(sep=' ')
+    started = time.perf_counter()
+
+    user_ids = ensure_users(users, classes, prefix, password)
+    activity_ids = [activity_catalog.id_of(name) for name in ACTIVITY_NAMES]
+    print(f"Generating {days} days of data from {start_date} to {end_date} ({activity_storage.name} storage)")
+
+    total_records = 0
+    for offset in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[offset:offset + chunk_size]
+        completed = completion_matrix(rng, len(chunk), dates)
+        if activity_storage.name == 'monthly':
+            write_months(chunk, completed, dates, start_date, end_date, datetime.fromisoformat(created))
+        else:
+            db.session.query(Activity).filter(
+                Activity.user_id.in_(chunk),
+                Activity.date >= start_date,
+                Activity.date <= end_date
+            ).delete(synchronize_session=False)
+
+            copy_rows(activity_rows(chunk, activity_ids, dates, completed), created)
+        db.session.commit()
+        total_records += completed.size
+        print(f"Inserted {total_records} records for {offset + len(chunk)} users")
+
+    elapsed = time.perf_counter() - started
+    print(f"Generated {total_records} records in {elapsed:.1f}s ({total_records / max(elapsed, 1e-9):.0f} rows/s)")
+
+    if derived:
+        for user_id in user_ids:
+            rebuild_streaks(user_id)
+            rebuild_rollups(user_id)
+            db.session.commit()
+        print(f"Rebuilt streaks and rollups for {len(user_ids)} users")
+    dashboard_cache.clear()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic activity dataset for load testing')
+    parser.add_argument('--users', type=int, default=1000, help='number of generated users')
+    parser.add_argument('--days', type=int, default=365, help='days of history ending today')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for a reproducible dataset')
+    parser.add_argument('--classes', type=int, default=10, help='number of classes to spread users over')
+    parser.add_argument('--prefix', default='loadtest', help='username prefix of generated users')
+    parser.add_argument('--password', default='loadtest123', help='password of generated users')
+    parser.add_argument('--chunk-size', type=int, default=200, help='users generated and written per batch')
+    parser.add_argument('--skip-derived', action='store_true',
+                        help='do not rebuild streaks and rollups (run rebuild_streaks.py and rebuild_rollups.py later)')
+    args = parser.parse_args()
+
+    # Load configuration based on environment
+    env = os.environ.get('FLASK_ENV', 'development')
+    app.config.from_object(get_config(env))
+
+    with app.app_context():
+        db.create_all()
+        seed_activity_catalog()
+        db.session.commit()
+        generate(args.users, args.days, args.seed, args.classes, args.prefix,
+                 args.password, args.chunk_size, not args.skip_derived)
@@ -0,0 +1,53 @@
+from app import app, db, import_users, user_count_cache
+import argparse
+import csv
+import os
+import sys
+import time
+from config import get_config
+
+def run_import(path, dry_run, workers, report_path):
+    with app.app_context():
+        started = time.perf_counter()
+        # utf-8-sig drops the byte order mark spreadsheet programs write
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as stream:
+                created, report = import_users(stream, dry_run=dry_run,
+                                               hash_workers=workers or app.config.get('IMPORT_HASH_WORKERS') or None)
+        except ValueError as e:
+            print(f"Could not read {path}: {str(e)}")
+            return False
+        db.session.commit()
+        user_count_cache.clear()
+
+        failed = [entry for entry in report if entry['errors']]
+        for entry in failed:
+            print(f"Line {entry['line']} ({entry['username'] or 'no username'}): {'; '.join(entry['errors'])}")
+        if report_path:
+            with open(report_path, 'w', encoding='utf-8', newline='') as output:
+                writer = csv.writer(output)
+                writer.writerow(('line', 'username', 'status', 'errors'))
+                for entry in report:
+                    writer.writerow((entry['line'], entry['username'], entry['status'], '; '.join(entry['errors'])))
+            print(f"Wrote report to {report_path}")
+
+        elapsed = time.perf_counter() - started
+        if dry_run:
+            print(f"Checked {len(report)} lines in {elapsed:.1f}s: {len(report) - len(failed)} valid, {len(failed)} with errors")
+        else:
+            print(f"Imported {created} users in {elapsed:.1f}s, skipped {len(failed)} lines with errors")
+        return not failed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create students in bulk from a CSV file')
+    parser.add_argument('path', help='CSV with username, email, password, full_name, student_number, class_name')
+    parser.add_argument('--dry-run', action='store_true', help='only check the file')
+    parser.add_argument('--workers', type=int, default=0, help='password hashing threads (default: every core)')
+    parser.add_argument('--report', help='write the per-line report to this CSV file')
+    args = parser.parse_args()
+
+    # Load configuration based on environment
+    env = os.environ.get('FLASK_ENV', 'development')
+    app.config.from_object(get_config(env))
+
+    sys.exit(0 if run_import(args.path, args.dry_run, args.workers, args.report) else 1)
@@ -0,0 +1,265 @@
+"""Per-request timing and SQL instrumentation, exported as Prometheus text.
+
+``instrument()`` hooks the Flask request signals and the SQLAlchemy cursor
+events. For every request it records, labelled by route:
+
+* request duration and status,
+* number of SQL statements and total time spent in them,
+* rows reported by the DB-API cursor (psycopg2 reports the rows of a
+  SELECT, sqlite3 only those of INSERT/UPDATE/DELETE),
+* duration of the slowest statement.
+
+Two backends hold the aggregated samples:
+
+* ``Metrics``: in the worker process, only right with a single worker.
+* ``SQLiteMetrics``: each worker adds its samples to a SQLite file shared by
+  all gunicorn workers, e.g. ``sqlite:////dev/shm/tracker_muslim_metrics.db``,
+  so counters survive worker restarts (``--max-requests``) and any worker
+  can answer ``/metrics`` for all of them.
+
+``create_metrics()`` picks one from the ``METRICS`` setting.
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from flask import g, has_request_context, request, request_finished, request_started
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS = {
+    'tracker_requests_total': ('counter', 'Requests served'),
+    'tracker_request_duration_seconds': ('histogram', 'Request duration'),
+    'tracker_request_sql_statements': ('histogram', 'SQL statements executed per request'),
+    'tracker_request_db_seconds': ('histogram', 'Time spent in SQL statements per request'),
+    'tracker_request_slowest_statement_seconds': ('histogram', 'Duration of the slowest SQL statement per request'),
+    'tracker_request_db_rows_total': ('counter', 'Rows reported by the database cursor'),
+    'tracker_slow_requests_total': ('counter', 'Requests slower than SLOW_REQUEST_MS'),
+    'tracker_password_hash_seconds': ('histogram', 'bcrypt hash or check latency, queue wait included'),
+    'tracker_password_in_progress': ('histogram', 'Password operations already in progress when one starts'),
+    'tracker_password_rejected_total': ('counter', 'Password operations rejected because the queue was full')
+}
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample_order(item):
+    # Histogram buckets in increasing 'le' order, the rest by name and labels
+    (sample, labels), _ = item
+    other, _, le = labels.partition('le="')
+    return sample, other, float(le.split('"', 1)[0]) if le else 0.0
+
+
+def _format(value):
+    # Every digit: rate() needs a large counter to change with each increment.
+    # SQLite stores REAL, so whole floats are counts as well
+    if isinstance(value, int) or value.is_integer():
+        return f'{int(value):d}'
+    return repr(value)
+
+
+class Metrics:
+    """Counters and cumulative histograms kept in the worker process."""
+    backend = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}  # (sample name, labels) -> value
+
+    def inc(self, name, amount=1, **labels):
+        self._add({(name, _labels(**labels)): amount})
+
+    def observe(self, name, value, buckets, **labels):
+        series = _labels(**labels)
+        prefix = series + ',' if series else ''
+        samples = {
+            (f'{name}_sum', series): value,
+            (f'{name}_count', series): 1,
+            (f'{name}_bucket', f'{prefix}le="+Inf"'): 1
+        }
+        for bound in buckets:
+            samples[(f'{name}_bucket', f'{prefix}le="{bound}"')] = int(value <= bound)
+        self._add(samples)
+
+    def collect(self):
+        """Every sample as {(sample name, labels): value}."""
+        with self._lock:
+            return dict(self._samples)
+
+    def render(self):
+        """Samples in the Prometheus text exposition format."""
+        samples = self.collect()
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            family = sorted((
+                (key, value) for key, value in samples.items()
+                if key[0] == name or (kind == 'histogram' and key[0].rsplit('_', 1)[0] == name)
+            ), key=_sample_order)
+            if not family:
+                continue
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (sample, labels), value in family:
+                lines.append(f'{sample}{{{labels}}} {_format(value)}' if labels else f'{sample} {_format(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def _add(self, samples):
+        with self._lock:
+            for key, amount in samples.items():
+                self._samples[key] = self._samples.get(key, 0) + amount
+
+
+class SQLiteMetrics(Metrics):
+    """Samples summed in a SQLite file shared by every worker on the host.
+
+    Workers buffer their samples and add them to the file at most once per
+    ``flush_interval`` seconds, and before answering ``collect()``.
+    """
+    backend = 'sqlite'
+
+    def __init__(self, path, flush_interval=1.0):
+        super().__init__()
+        self.path = path
+        self.flush_interval = flush_interval
+        self._flushed = time.monotonic()
+        self._local = threading.local()
+        atexit.register(self.flush)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS samples ('
+                'name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, '
+                'PRIMARY KEY (name, labels))'
+            )
+
+    def collect(self):
+        self.flush()
+        conn = self._connect()
+        return {(name, labels): value for name, labels, value in conn.execute('SELECT name, labels, value FROM samples')}
+
+    def flush(self):
+        with self._lock:
+            pending, self._samples = self._samples, {}
+            self._flushed = time.monotonic()
+        if not pending:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) '
+                'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                [(name, labels, value) for (name, labels), value in pending.items()]
+            )
+
+    def _add(self, samples):
+        super()._add(samples)
+        if time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def _connect(self):
+        # sqlite3 connections must stay on the thread (and process) that opened them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+def create_metrics(url):
+    """Build the backend named by ``url``: 'memory' or 'sqlite:///<path>'."""
+    if not url or url == 'memory':
+        return Metrics()
+    if url.startswith('sqlite:///'):
+        path = url[len('sqlite:///'):]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return SQLiteMetrics(path)
+    raise ValueError(f'Unknown metrics backend: {url}')
+
+
+def instrument(app, metrics, slow_request_ms=0, slow_statements=5, run=None):
+    """Record every request of ``app`` in ``metrics``.
+
+    With ``slow_request_ms`` set, requests slower than that are logged with
+    their ``slow_statements`` slowest SQL statements. ``run``, if given, is
+    called with the function adding a request's samples to ``metrics``, e.g.
+    to do that on another thread.
+    """
+
+    def started(sender, **extra):
+        g.request_metrics = {
+            'started': time.perf_counter(),
+            'statements': 0,
+            'db_seconds': 0.0,
+            'rows': 0,
+            'slowest': []  # (seconds, statement), longest first
+        }
+
+    def finished(sender, response, **extra):
+        stats = g.pop('request_metrics', None)
+        if stats is None:
+            return
+        duration = time.perf_counter() - stats['started']
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = {'route': route, 'method': request.method}
+        slowest = stats['slowest'][0][0] if stats['slowest'] else 0.0
+        slow = slow_request_ms and duration * 1000 >= slow_request_ms
+        status = response.status_code
+
+        def record():
+            metrics.inc('tracker_requests_total', status=status, **labels)
+            metrics.observe('tracker_request_duration_seconds', duration, DURATION_BUCKETS, **labels)
+            metrics.observe('tracker_request_sql_statements', stats['statements'], STATEMENT_BUCKETS, **labels)
+            metrics.observe('tracker_request_db_seconds', stats['db_seconds'], DURATION_BUCKETS, **labels)
+            metrics.observe('tracker_request_slowest_statement_seconds', slowest, DURATION_BUCKETS, **labels)
+            if stats['rows']:
+                metrics.inc('tracker_request_db_rows_total', stats['rows'], **labels)
+            if slow:
+                metrics.inc('tracker_slow_requests_total', **labels)
+
+        if run is None:
+            record()
+        else:
+            run(record)
+
+        if slow:
+            print(f"Slow request: {request.method} {request.full_path.rstrip('?')} took {duration * 1000:.1f}ms, "
+                  f"{stats['statements']} statements in {stats['db_seconds'] * 1000:.1f}ms")
+            for seconds, statement in stats['slowest']:
+                print(f"  {seconds * 1000:.1f}ms: {' '.join(statement.split())}")
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and has_request_context() and 'request_metrics' in g:
+            context.metrics_started = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'metrics_started', None)
+        if started is None or not (has_request_context() and 'request_metrics' in g):
+            return
+        seconds = time.perf_counter() - started
+        stats = g.request_metrics
+        stats['statements'] += 1
+        stats['db_seconds'] += seconds
+        if cursor.rowcount > 0:
+            stats['rows'] += cursor.rowcount
+        slowest = stats['slowest']
+        if len(slowest) < max(slow_statements, 1) or seconds > slowest[-1][0]:
+            slowest.append((seconds, statement))
+            slowest.sort(key=lambda item: item[0], reverse=True)
+            del slowest[max(slow_statements, 1):]
+
+    request_started.connect(started, app, weak=False)
+    request_finished.connect(finished, app, weak=False)
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
@@ -0,0 +1,46 @@
+from app import app, db
+import os
+from config import get_config
+from sqlalchemy import inspect, text
+
+def dedupe_activities():
+    # Keep only the newest row for each (user_id, name, date)
+    result = db.session.execute(text(
+        'DELETE FROM activities WHERE id NOT IN ('
+        'SELECT MAX(id) FROM activities GROUP BY user_id, name, date)'
+    ))
+    print(f"Removed {result.rowcount} duplicate activities")
+    
+    # Replace the old non-unique index with a unique one, migrate_db.py
+    # later moves the key to activity_id
+    db.session.execute(text('DROP INDEX IF EXISTS idx_user_name_date'))
+    db.session.execute(text('CREATE UNIQUE INDEX idx_user_name_date ON activities (user_id, name, date)'))
+    print("Created unique index idx_user_name_date")
+    return result.rowcount
+
+def migrate_activity_unique_key():
+    # Load configuration based on environment
+    env = os.environ.get('FLASK_ENV', 'development')
+    app.config.from_object(get_config(env))
+    
+    with app.app_context():
+        try:
+            columns = {column['name'] for column in inspect(db.engine).get_columns('activities')}
+            if 'name' not in columns:
+                # migrate_db.py already keyed activities by (user_id, activity_id, date)
+                print("Activities are keyed by activity_id, nothing to migrate")
+                return
+            
+            removed = dedupe_activities()
+            db.session.commit()
+            
+            if removed:
+                print("Run rebuild_streaks.py to refresh the streak store")
+            
+        except Exception as e:
+            print(f"Error migrating activities: {str(e)}")
+            db.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    migrate_activity_unique_key()
@@ -0,0 +1,132 @@
+from app import (app, db, User, ActivityDefinition, ActivityMonth, ActivityStats, activity_catalog,
+                 seed_activity_catalog, rebuild_streaks, rebuild_rollups)
+import os
+from config import get_config
+from migrate_activity_unique_key import dedupe_activities
+from sqlalchemy import bindparam, func, inspect, text
+from sqlalchemy.schema import CreateIndex
+
+def register_unknown_names():
+    # Names outside the catalog get a definition of their own, nothing is dropped
+    seed_activity_catalog()
+    activity_catalog.load()
+    next_id = (db.session.query(func.max(ActivityDefinition.id)).scalar() or 0) + 1
+    next_order = (db.session.query(func.max(ActivityDefinition.display_order)).scalar() or 0) + 1
+    names = [name for (name,) in db.session.execute(text('SELECT DISTINCT name FROM activities ORDER BY name'))]
+    for name in names:
+        if activity_catalog.get(name) is None:
+            db.session.add(ActivityDefinition(id=next_id, name=name, aliases=[], is_numeric=False,
+                                              display_order=next_order))
+            print(f"Added {name} to the activity catalog")
+            next_id += 1
+            next_order += 1
+    db.session.flush()
+    activity_catalog.load()
+
+def normalize_activity_names():
+    """Replace activities.name with activity_id, merging aliases into their activity."""
+    register_unknown_names()
+    is_postgresql = db.engine.dialect.name == 'postgresql'
+    
+    # Aliases take the name of their activity first, so the same dedupe as
+    # migrate_activity_unique_key.py also merges an alias stored next to its
+    # activity on one day
+    db.session.execute(text('DROP INDEX IF EXISTS idx_user_name_date'))
+    rename = text('UPDATE activities SET name = :name WHERE name IN :aliases').bindparams(
+        bindparam('aliases', expanding=True))
+    for definition in activity_catalog.definitions():
+        if definition['aliases']:
+            db.session.execute(rename, {'name': definition['name'], 'aliases': definition['aliases']})
+    dedupe_activities()
+    
+    db.session.execute(text('ALTER TABLE activities ADD COLUMN activity_id SMALLINT REFERENCES activity_catalog (id)'))
+    db.session.execute(text(
+        'UPDATE activities SET activity_id = '
+        '(SELECT id FROM activity_catalog WHERE activity_catalog.name = activities.name)'
+    ))
+    
+    db.session.execute(text('DROP INDEX IF EXISTS idx_user_name_date'))
+    db.session.execute(text('DROP INDEX IF EXISTS ix_activities_name'))
+    db.session.execute(text('ALTER TABLE activities DROP COLUMN name'))
+    if is_postgresql:
+        # SQLite cannot add NOT NULL to an existing column, the model enforces it there
+        db.session.execute(text('ALTER TABLE activities ALTER COLUMN activity_id SET NOT NULL'))
+    print("Moved activities to activity_id")
+
+def merge_month_aliases():
+    # Monthly storage rows written under an alias join the row of their activity
+    merged = 0
+    for month in ActivityMonth.query.all():
+        definition = activity_catalog.get(month.activity_name)
+        if definition is None or definition['name'] == month.activity_name:
+            continue
+        name = definition['name']
+        target = ActivityMonth.query.filter_by(user_id=month.user_id, activity_name=name, month=month.month).first()
+        if target is None:
+            month.activity_name = name
+        else:
+            for entry in month.entries():
+                if not target.recorded & (1 << (entry.date.day - 1)):
+                    target.set_day(entry.date, entry.completed, entry.value)
+            db.session.delete(month)
+        db.session.flush()
+        merged += 1
+    print(f"Merged {merged} monthly rows stored under an alias")
+
+def rebuild_derived():
+    # Streaks and rollups are keyed by activity name and may still hold aliases.
+    # create_all() leaves an older activity_stats as it is, and the streak
+    # store only holds derived data, so recreate it like rebuild_streaks.py
+    connection = db.session.connection()
+    ActivityStats.__table__.drop(connection, checkfirst=True)
+    ActivityStats.__table__.create(connection)
+    users = User.query.order_by(User.id).all()
+    for user in users:
+        rebuild_streaks(user.id)
+        rebuild_rollups(user.id)
+        db.session.flush()
+    print(f"Rebuilt streaks and rollups for {len(users)} users")
+
+def create_missing_indexes():
+    # create_all() skips indexes of tables that already exist
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            db.session.execute(CreateIndex(index, if_not_exists=True))
+    print("Created missing indexes")
+
+def migrate_db():
+    # Load configuration based on environment
+    env = os.environ.get('FLASK_ENV', 'development')
+    app.config.from_object(get_config(env))
+    
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            columns = set()
+            if inspector.has_table('activities'):
+                columns = {column['name'] for column in inspector.get_columns('activities')}
+            
+            # One transaction: a failed step leaves the database as it was, so
+            # the migration can simply be run again. sqlite3 would commit the
+            # DDL before the first write on its own, so begin explicitly there
+            if db.engine.dialect.name == 'sqlite':
+                db.session.execute(text('BEGIN'))
+            
+            # New tables, then indexes added to existing ones
+            db.metadata.create_all(db.session.connection())
+            seed_activity_catalog()
+            if 'name' in columns:
+                normalize_activity_names()
+                merge_month_aliases()
+                rebuild_derived()
+            create_missing_indexes()
+            db.session.commit()
+            print("Database migrated successfully")
+            
+        except Exception as e:
+            print(f"Error migrating database: {str(e)}")
+            db.session.rollback()
+            raise
+
+if __name__ == '__main__':
+    migrate_db()
@@ -0,0 +1,83 @@
+from app import app, db, User, Activity, ActivityMonth, RowStorage, MonthlyStorage, activity_catalog
+import argparse
+import os
+from sqlalchemy import text
+from config import get_config
+
+def table_sizes():
+    """Rows (and on PostgreSQL bytes, indexes included) of both storage tables."""
+    sizes = {}
+    for model in (Activity, ActivityMonth):
+        table = model.__tablename__
+        rows = db.session.query(db.func.count()).select_from(model).scalar()
+        if db.engine.dialect.name == 'postgresql':
+            size = db.session.execute(text(f"SELECT pg_size_pretty(pg_total_relation_size('{table}'))")).scalar()
+            sizes[table] = f"{rows} rows, {size}"
+        else:
+            sizes[table] = f"{rows} rows"
+    return sizes
+
+def pack_user(user_id):
+    """Copy a user's activities rows into activity_months."""
+    ActivityMonth.query.filter_by(user_id=user_id).delete()
+    months = {}
+    for activity in RowStorage().entries(user_id):
+        key = (activity.name, activity.date.replace(day=1))
+        month = months.get(key)
+        if month is None:
+            month = months[key] = ActivityMonth(user_id=user_id, activity_name=key[0], month=key[1],
+                                                recorded=0, completed=0, updated_at=activity.updated_at)
+        value = int(activity.value) if activity.value not in (None, '') else None
+        month.set_day(activity.date, bool(activity.completed), value)
+        month.updated_at = max(month.updated_at, activity.updated_at)
+    db.session.add_all(months.values())
+    return len(months)
+
+def unpack_user(user_id):
+    """Copy a user's activity_months back into activities rows."""
+    Activity.query.filter_by(user_id=user_id).delete()
+    entries = MonthlyStorage().entries(user_id)
+    db.session.bulk_insert_mappings(Activity, [{
+        'user_id': user_id,
+        'activity_id': activity_catalog.id_of(entry.name),
+        'date': entry.date,
+        'completed': entry.completed,
+        'value': entry.value,
+        'created_at': entry.updated_at,
+        'updated_at': entry.updated_at
+    } for entry in entries])
+    return len(entries)
+
+def migrate(target, keep):
+    with app.app_context():
+        ActivityMonth.__table__.create(db.engine, checkfirst=True)
+        print(f"Before: {table_sizes()}")
+
+        users = User.query.order_by(User.id).all()
+        for user in users:
+            if target == 'monthly':
+                count = pack_user(user.id)
+                if not keep:
+                    Activity.query.filter_by(user_id=user.id).delete()
+                print(f"Packed user {user.username} (ID: {user.id}) into {count} months")
+            else:
+                count = unpack_user(user.id)
+                if not keep:
+                    ActivityMonth.query.filter_by(user_id=user.id).delete()
+                print(f"Unpacked user {user.username} (ID: {user.id}) into {count} rows")
+            db.session.commit()
+
+        print(f"After: {table_sizes()}")
+        print(f"Set ACTIVITY_STORAGE={target} and restart the application")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move activities between the rows and monthly storage')
+    parser.add_argument('--to', choices=['monthly', 'rows'], default='monthly', help='target storage')
+    parser.add_argument('--keep', action='store_true', help='keep the source rows after copying')
+    args = parser.parse_args()
+
+    # Load configuration based on environment
+    env = os.environ.get('FLASK_ENV', 'development')
+    app.config.from_object(get_config(env))
+
+    migrate(args.to, args.keep)
@@ -0,0 +1,101 @@
+"""Bounded password hashing.
+
+bcrypt is deliberately slow, and with 2 gunicorn workers x 2 threads a burst
+of logins used to occupy every thread. ``PasswordHasher`` lets at most
+``concurrency`` password operations run at once in a worker (by default one
+less than its threads, so a thread stays free for the other requests); a
+login arriving while they are all busy fails fast with
+``PasswordHasherBusy`` instead of queueing behind them.
+
+bcrypt releases the GIL, so an operation runs in the request thread without
+holding up the others, and ``hash_many()`` hashes a user import on a thread
+pool across all cores.
+
+Hashing latency, operations in progress and rejections are recorded in the
+request metrics.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+IN_PROGRESS_BUCKETS = (0, 1, 2, 4, 8, 16, 32)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password operations are already pending."""
+
+
+def hash_cost(password_hash):
+    """bcrypt cost of a stored '$2b$<cost>$...' hash."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password_hash, password):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+class PasswordHasher:
+    """bcrypt with at most ``concurrency`` operations in progress per process."""
+
+    def __init__(self, rounds=12, concurrency=1, metrics=None):
+        self.rounds = rounds
+        self.concurrency = concurrency
+        self.metrics = metrics
+        self._slots = threading.BoundedSemaphore(max(concurrency, 1))
+        self._lock = threading.Lock()
+        self._in_progress = 0
+
+    def hash(self, password):
+        return self._run('hash', _hash, password, self.rounds)
+
+    def check(self, password_hash, password):
+        return self._run('check', _check, password_hash, password)
+
+    def hash_many(self, passwords, workers=None):
+        """Hash a batch of passwords, e.g. a user import, on ``workers`` threads (one per core by default).
+
+        The batch does not take the slots of ``concurrency``, logins are not
+        refused while it runs.
+        """
+        passwords = list(passwords)
+        workers = min(workers or os.cpu_count() or 1, len(passwords))
+        if workers <= 1:
+            return [_hash(password, self.rounds) for password in passwords]
+        with ThreadPoolExecutor(workers, thread_name_prefix='hash') as pool:
+            return list(pool.map(lambda password: _hash(password, self.rounds), passwords))
+
+    def needs_rehash(self, password_hash):
+        return hash_cost(password_hash) != self.rounds
+
+    def _run(self, operation, function, *args):
+        if not self._slots.acquire(blocking=False):
+            if self.metrics:
+                self.metrics.inc('tracker_password_rejected_total', operation=operation)
+            raise PasswordHasherBusy('Too many password operations in progress')
+        with self._lock:
+            depth = self._in_progress
+            self._in_progress += 1
+        if self.metrics:
+            self.metrics.observe('tracker_password_in_progress', depth, IN_PROGRESS_BUCKETS)
+
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            with self._lock:
+                self._in_progress -= 1
+            self._slots.release()
+            if self.metrics:
+                self.metrics.observe('tracker_password_hash_seconds', time.perf_counter() - started,
+                                     LATENCY_BUCKETS, operation=operation)
@@ -0,0 +1,209 @@
+"""The hot query set as cached lambda statements.
+
+The same few queries run on nearly every request: user lookup at login,
+the range fetch of the activity grid, the per-activity and per-date
+group-bys of the dashboard, the range version behind the ETags and the
+existence check before a save. Built through ``Model.query`` they were
+constructed anew on every request, and so was the cache key SQLAlchemy
+derives from them to find the compiled SQL.
+
+``HotQueries`` builds them with ``lambda_stmt()`` instead: a statement is
+constructed and compiled once per code location, later calls only read the
+bound parameters from the lambda closures. The values a query depends on
+must therefore come in as closure variables (arguments or locals), never
+as globals or attributes read inside the lambda, and sets are passed as
+lists so they become expanding IN parameters.
+
+On PostgreSQL with psycopg 3 (``postgresql+psycopg://`` URLs)
+``prepared_statement_options()`` has statements run ``PREPARE_THRESHOLD``
+times on a connection prepared on the server, skipping the planning too.
+psycopg2 cannot prepare; asyncpg (asgi.py) prepares every statement.
+``benchmark_queries.py`` compares the hot queries with their
+``Model.query`` form.
+"""
+from sqlalchemy import Date, Integer, String, cast, func, lambda_stmt, literal_column, null, select, union_all
+from sqlalchemy.engine import make_url
+
+
+def prepared_statement_options(url, prepare_threshold=None):
+    """Engine options preparing statements on the server, for psycopg 3 URLs only."""
+    if prepare_threshold is None or make_url(url).drivername != 'postgresql+psycopg':
+        return {}
+    return {'connect_args': {'prepare_threshold': prepare_threshold}}
+
+
+class HotQueries:
+    """Statements of the hot query set, for ``db.session.execute()`` and ``scalars()``."""
+
+    def __init__(self, user, activity, activity_month, activity_stats, activity_rollup, activity_definition,
+                 all_activities):
+        self.User = user
+        self.Activity = activity
+        self.ActivityMonth = activity_month
+        self.ActivityStats = activity_stats
+        self.ActivityRollup = activity_rollup
+        self.ActivityDefinition = activity_definition
+        self.all_activities = all_activities
+
+    def user_by_username(self, username):
+        User = self.User
+        return lambda_stmt(lambda: select(User).where(User.username == username).limit(1))
+
+    def activities(self, user_id, start_date=None, end_date=None):
+        """Activity rows of a user, optionally limited to a date range, by date."""
+        Activity = self.Activity
+        stmt = lambda_stmt(lambda: select(Activity).where(Activity.user_id == user_id))
+        if start_date is not None:
+            stmt += lambda s: s.where(Activity.date >= start_date)
+        if end_date is not None:
+            stmt += lambda s: s.where(Activity.date <= end_date)
+        stmt += lambda s: s.order_by(Activity.date)
+        return stmt
+
+    def grid_rows(self, user_id, start_date, end_date):
+        """(activity_id, date, completed, value) of a user's range."""
+        Activity = self.Activity
+        return lambda_stmt(lambda: select(
+            Activity.activity_id, Activity.date, Activity.completed, Activity.value
+        ).where(
+            Activity.user_id == user_id,
+            Activity.date >= start_date,
+            Activity.date <= end_date
+        ))
+
+    def range_version(self, user_id, start_date, end_date):
+        """(row count, highest id, latest update) of a user's range."""
+        Activity = self.Activity
+        return lambda_stmt(lambda: select(
+            func.count(),
+            func.max(Activity.id),
+            func.max(Activity.updated_at)
+        ).where(
+            Activity.user_id == user_id,
+            Activity.date >= start_date,
+            Activity.date <= end_date
+        ))
+
+    def stored_completion(self, user_id, activity_ids, dates):
+        """(activity_id, date, completed) of the given activities that are already stored."""
+        Activity = self.Activity
+        activity_ids = list(activity_ids)
+        dates = list(dates)
+        return lambda_stmt(lambda: select(Activity.activity_id, Activity.date, Activity.completed).where(
+            Activity.user_id == user_id,
+            Activity.activity_id.in_(activity_ids),
+            Activity.date.in_(dates)
+        ))
+
+    def daily_completion(self, user_id, dates):
+        """(date, completed) per given day, a day being completed when all its activities are."""
+        Activity = self.Activity
+        dates = list(dates)
+        return lambda_stmt(lambda: select(
+            Activity.date,
+            (func.count() == func.sum(cast(Activity.completed, Integer))).label('completed')
+        ).where(
+            Activity.user_id == user_id,
+            Activity.date.in_(dates)
+        ).group_by(Activity.date))
+
+    def count_on(self, day):
+        Activity = self.Activity
+        return lambda_stmt(lambda: select(func.count()).select_from(Activity).where(Activity.date == day))
+
+    def streak(self, user_id, activity_name):
+        ActivityStats = self.ActivityStats
+        return lambda_stmt(lambda: select(ActivityStats).where(
+            ActivityStats.user_id == user_id,
+            ActivityStats.activity_name == activity_name
+        ).limit(1))
+
+    def months(self, user_id, start_month=None, end_date=None, names=None):
+        """activity_months rows of a user, optionally limited to months and activity names."""
+        ActivityMonth = self.ActivityMonth
+        stmt = lambda_stmt(lambda: select(ActivityMonth).where(ActivityMonth.user_id == user_id))
+        if start_month is not None:
+            stmt += lambda s: s.where(ActivityMonth.month >= start_month)
+        if end_date is not None:
+            stmt += lambda s: s.where(ActivityMonth.month <= end_date)
+        if names is not None:
+            names = list(names)
+            stmt += lambda s: s.where(ActivityMonth.activity_name.in_(names))
+        stmt += lambda s: s.order_by(ActivityMonth.month, ActivityMonth.activity_name)
+        return stmt
+
+    def dashboard_analytics(self, user_id, start_date, end_date, period):
+        """Rows of (kind, name, date, total, completed), see app.dashboard_analytics()."""
+        Activity = self.Activity
+        ActivityRollup = self.ActivityRollup
+        ActivityDefinition = self.ActivityDefinition
+        all_activities = self.all_activities
+        return lambda_stmt(lambda: dashboard_analytics_statement(
+            Activity, ActivityRollup, ActivityDefinition, all_activities, user_id, start_date, end_date, period))
+
+
+def dashboard_analytics_statement(Activity, ActivityRollup, ActivityDefinition, all_activities,
+                                  user_id, start_date, end_date, period):
+    """The statement of ``HotQueries.dashboard_analytics()``, built anew on every call."""
+    scoped = select(
+        Activity.activity_id,
+        Activity.date,
+        cast(Activity.completed, Integer).label('done')
+    ).where(
+        Activity.user_id == user_id,
+        Activity.date >= start_date,
+        Activity.date <= end_date
+    ).cte('scoped')
+
+    # Rows of one island share the same difference of row numbers
+    islands = select(
+        scoped.c.activity_id,
+        scoped.c.done,
+        (func.row_number().over(partition_by=scoped.c.activity_id, order_by=scoped.c.date) -
+         func.row_number().over(partition_by=(scoped.c.activity_id, scoped.c.done), order_by=scoped.c.date)).label('island')
+    ).cte('islands')
+    runs = select(
+        islands.c.activity_id,
+        func.count().label('length')
+    ).where(
+        islands.c.done == 1
+    ).group_by(islands.c.activity_id, islands.c.island).cte('runs')
+
+    return union_all(
+        select(
+            literal_column("'activity'").label('kind'),
+            ActivityRollup.activity_name.label('name'),
+            cast(null(), Date).label('date'),
+            func.sum(ActivityRollup.total).label('total'),
+            func.sum(ActivityRollup.completed).label('completed')
+        ).where(
+            ActivityRollup.user_id == user_id,
+            ActivityRollup.period == period,
+            ActivityRollup.bucket >= start_date,
+            ActivityRollup.bucket <= end_date,
+            ActivityRollup.activity_name != all_activities
+        ).group_by(ActivityRollup.activity_name).having(func.sum(ActivityRollup.total) > 0),
+        select(
+            literal_column("'streak'"),
+            ActivityDefinition.name,
+            cast(null(), Date),
+            func.max(runs.c.length),
+            cast(null(), Integer)
+        ).select_from(runs).join(
+            ActivityDefinition, ActivityDefinition.id == runs.c.activity_id
+        ).group_by(ActivityDefinition.name),
+        select(
+            literal_column("'day'"),
+            cast(null(), String),
+            ActivityRollup.bucket,
+            ActivityRollup.total,
+            ActivityRollup.completed
+        ).where(
+            ActivityRollup.user_id == user_id,
+            ActivityRollup.period == 'day',
+            ActivityRollup.bucket >= start_date,
+            ActivityRollup.bucket <= end_date,
+            ActivityRollup.activity_name == all_activities,
+            ActivityRollup.total > 0
+        )
+    )
@@ -0,0 +1,50 @@
+from app import app, db, User, ActivityRollup, expected_rollups, rebuild_rollups
+import argparse
+import os
+import sys
+from config import get_config
+
+def backfill_rollups():
+    with app.app_context():
+        ActivityRollup.__table__.create(db.engine, checkfirst=True)
+
+        users = User.query.filter_by(is_admin=False).all()
+        for user in users:
+            rebuild_rollups(user.id)
+            db.session.commit()
+            print(f"Rebuilt rollups for user: {user.username} (ID: {user.id})")
+
+        print(f"Rollups rebuilt for {len(users)} users")
+
+def verify_rollups():
+    with app.app_context():
+        mismatches = 0
+        users = User.query.filter_by(is_admin=False).all()
+        for user in users:
+            expected = expected_rollups(user.id)
+            stored = {
+                (row.period, row.bucket, row.activity_name): [row.total, row.completed]
+                for row in ActivityRollup.query.filter_by(user_id=user.id)
+                if row.total or row.completed
+            }
+            for key in sorted(set(expected) | set(stored), key=str):
+                if expected.get(key) != stored.get(key):
+                    mismatches += 1
+                    print(f"Mismatch for user {user.username} {key}: "
+                          f"expected {expected.get(key)}, stored {stored.get(key)}")
+
+        print(f"Checked rollups for {len(users)} users, {mismatches} mismatches")
+        return mismatches == 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill or verify the activity rollup tables')
+    parser.add_argument('--verify', action='store_true', help='compare rollups with activities instead of rebuilding')
+    args = parser.parse_args()
+
+    # Load configuration based on environment
+    env = os.environ.get('FLASK_ENV', 'development')
+    app.config.from_object(get_config(env))
+
+    if args.verify:
+        sys.exit(0 if verify_rollups() else 1)
+    backfill_rollups()
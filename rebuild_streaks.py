@@ -0,0 +1,25 @@
+from app import app, db, User, ActivityStats, rebuild_streaks
+import os
+from config import get_config
+
+def rebuild_streak_store():
+    # Load configuration based on environment
+    env = os.environ.get('FLASK_ENV', 'development')
+    app.config.from_object(get_config(env))
+    
+    with app.app_context():
+        # The store only holds derived data, so recreate it from scratch
+        ActivityStats.__table__.drop(db.engine, checkfirst=True)
+        ActivityStats.__table__.create(db.engine)
+        print("Recreated activity_stats table")
+
+        users = User.query.filter_by(is_admin=False).all()
+        for user in users:
+            rebuild_streaks(user.id)
+            db.session.commit()
+            print(f"Rebuilt streaks for user: {user.username} (ID: {user.id})")
+
+        print(f"Streak store rebuilt for {len(users)} users")
+
+if __name__ == '__main__':
+    rebuild_streak_store()
@@ -0,0 +1,112 @@
+"""Read replica routing.
+
+Dashboard analytics, range reads, admin listings and exports used to share
+the one database with every save. With ``REPLICA_DATABASE_URLS`` set, the
+views marked as read-only in app.py send their queries to a replica:
+
+* ``ReplicaRouter`` picks the replicas round-robin and skips one that
+  failed its health check (``SELECT 1``, repeated at most every
+  ``check_interval`` seconds) or lost its connection, until it passes
+  again. With no healthy replica the reads go to the primary.
+* ``RoutingSession`` is the ``db.session`` class: reads of a request
+  marked with ``g.use_replica`` go to the router's replica; flushes and
+  INSERT/UPDATE/DELETE always go to the primary. The replica is chosen once
+  per request, so all its reads see the same point of the replica's lag
+  (an ETag and the rows it stands for come from the same replica).
+
+Replicas lag behind the primary, so app.py keeps a user on the primary for
+``REPLICA_STICKY_SECONDS`` after their own write.
+"""
+import threading
+import time
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+
+
+class ReplicaRouter:
+    """Round-robin over the healthy engines of the read replicas."""
+
+    def __init__(self, engines, check_interval=5.0):
+        self.engines = list(engines)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next = 0
+        self._health = {}  # engine index -> (healthy, monotonic time of the check)
+        for index, engine in enumerate(self.engines):
+            event.listen(engine, 'handle_error', self._error_handler(index))
+
+    def init_app(self, app):
+        app.extensions['replica_router'] = self
+
+    def choose(self):
+        """Engine of the next healthy replica, None if none is healthy."""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.engines)
+        for offset in range(len(self.engines)):
+            index = (start + offset) % len(self.engines)
+            if self._healthy(index):
+                return self.engines[index]
+        return None
+
+    def stats(self):
+        with self._lock:
+            return [{
+                'url': engine.url.render_as_string(hide_password=True),
+                'healthy': self._health.get(index, (None, 0))[0]
+            } for index, engine in enumerate(self.engines)]
+
+    def _healthy(self, index):
+        with self._lock:
+            healthy, checked = self._health.get(index, (None, 0.0))
+            if healthy is not None and time.monotonic() - checked < self.check_interval:
+                return healthy
+            # Other threads keep the last result while this one checks
+            self._health[index] = (bool(healthy), time.monotonic())
+        healthy = self._check(self.engines[index])
+        with self._lock:
+            self._health[index] = (healthy, time.monotonic())
+        return healthy
+
+    def _check(self, engine):
+        try:
+            with engine.connect() as conn:
+                conn.exec_driver_sql('SELECT 1')
+            return True
+        except Exception as e:
+            print(f"Replica {engine.url.render_as_string(hide_password=True)} failed its health check: {str(e)}")
+            return False
+
+    def _error_handler(self, index):
+        def handle_error(context):
+            # A lost connection takes the replica out until its next check passes
+            if context.is_disconnect:
+                with self._lock:
+                    self._health[index] = (False, time.monotonic())
+        return handle_error
+
+
+def create_replica_router(urls, engine_options=None, check_interval=5.0):
+    """Router over an engine per URL, None without URLs."""
+    if not urls:
+        return None
+    return ReplicaRouter([create_engine(url, **(engine_options or {})) for url in urls], check_interval)
+
+
+class RoutingSession(Session):
+    """``db.session`` sending the reads of requests marked ``g.use_replica`` to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get('use_replica'):
+            if self._flushing or getattr(clause, 'is_dml', False):
+                # The request writes, its later reads must see the write
+                g.use_replica = False
+            else:
+                if 'replica_engine' not in g:
+                    router = current_app.extensions.get('replica_router')
+                    g.replica_engine = router.choose() if router is not None else None
+                if g.replica_engine is not None:
+                    return g.replica_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -1,4 +1,4 @@
-from app import app, db, User, bcrypt
+from app import app, db, User, bcrypt, seed_activity_catalog
 import os
 from config import get_config
 
@@ -15,6 +15,8 @@ def reset_database():
         # Create all tables
         db.create_all()
         print("Created all tables")
+        seed_activity_catalog()
+        print("Created activity catalog")
 
         # Create admin user
         admin = User(
@@ -32,9 +32,11 @@ function markAsChecked(activity, date, isChecked) {
     localStorage.setItem('checkedActivities', JSON.stringify(checkedActivities));
 }
 
-// Helper function to check if activity needs numeric input
+// Helper function to check if activity needs numeric input, from the
+// activity catalog rendered into base.html
 function isNumericActivity(activity) {
-    return activity === 'Rowatib' || activity === 'Tilawah Qur\'an';
+    const numeric = window.numericActivities || ['Rowatib', 'Tilawah Qur\'an'];
+    return numeric.includes(activity);
 }
 
 // Helper function to convert month name to number
@@ -59,6 +61,18 @@ function getMonthNumber(monthName) {
 // Track modified cells
 let modifiedCells = new Set();
 
+// Last successful /api/stats response per range URL, revalidated with its ETag
+const activityRangeCache = {};
+
+// Saves waiting for /api/sync, kept across reloads so they survive being offline
+const pendingChanges = JSON.parse(localStorage.getItem('pendingChanges') || '[]');
+const SYNC_BATCH_SIZE = 500;
+
+// Range shown in the grid and the sync cursor of its last load
+let syncRange = null;
+let syncCursor = null;
+let syncInFlight = null;
+
 // Add CSS for clickable cells
 const style = document.createElement('style');
 style.textContent = `
@@ -137,38 +151,13 @@ async function handleCellClick(event) {
         const fullDate = new Date(tahun, month - 1, parseInt(date));
         const formattedDate = fullDate.toISOString().split('T')[0];
         
-        // Prepare the activity data
-        const activityData = {
-            activities: [{
-                name: activity,
-                date: formattedDate,
-                completed: isChecked,
-                value: value
-            }]
-        };
-        
-        console.log('Saving activity:', activityData);
-        
-        // Save to server
-        const response = await fetch('/api/stats', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-Requested-With': 'XMLHttpRequest'
-            },
-            body: JSON.stringify(activityData)
-        });
-
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-        }
-
-        const data = await response.json();
-        console.log('Save response:', data);
-        
-        if (!data.success) {
-            throw new Error(data.message || 'Failed to save activity');
-        }
+        queueChanges([{
+            name: activity,
+            date: formattedDate,
+            completed: isChecked,
+            value: value
+        }]);
+        await syncActivities();
     } catch (error) {
         console.error('Error saving activity:', error);
         showError('Error saving activity: ' + error.message);
@@ -261,67 +250,153 @@ document.addEventListener('DOMContentLoaded', function() {
     document.getElementById('bulan').addEventListener('change', loadActivities);
     document.getElementById('tahun').addEventListener('change', loadActivities);
 
-    // Load initial data
-    loadActivities();
+    // Load initial data, then send saves queued while offline
+    loadActivities().then(syncActivities);
+    window.addEventListener('online', syncActivities);
 });
 
-// Load activities for current month
-async function loadActivities() {
+// Show one saved activity in its grid cell
+function applyActivityToCell(name, day, completed, value) {
+    const cell = document.querySelector(`.clickable-cell[data-activity="${name}"][data-date="${day}"]`);
+    if (!cell) {
+        return;
+    }
+    
+    if (isNumericActivity(name)) {
+        const input = cell.querySelector('input[type="number"]');
+        if (input && value !== null) {
+            input.value = value;
+        }
+    } else if (completed) {
+        cell.classList.add('table-success');
+        cell.textContent = '✓';
+    }
+}
+
+// Show the synced state of one cell, clearing it when no longer completed
+function setActivityCell(name, day, completed, value) {
+    const cell = document.querySelector(`.clickable-cell[data-activity="${name}"][data-date="${day}"]`);
+    if (!cell) {
+        return;
+    }
+    
+    if (isNumericActivity(name)) {
+        const input = cell.querySelector('input[type="number"]');
+        if (input) {
+            input.value = value !== null ? value : '0';
+        }
+    } else if (completed) {
+        cell.classList.add('table-success');
+        cell.textContent = '✓';
+    } else {
+        cell.classList.remove('table-success');
+        cell.textContent = '';
+    }
+}
+
+// Empty every cell before a full load
+function resetActivityCells() {
+    document.querySelectorAll('.clickable-cell').forEach(cell => {
+        const isNumeric = isNumericActivity(cell.dataset.activity);
+        if (isNumeric) {
+            const input = cell.querySelector('input[type="number"]');
+            if (input) {
+                input.value = '0';
+            }
+        } else {
+            cell.classList.remove('table-success');
+            cell.textContent = '';
+        }
+    });
+}
+
+// First and last day (YYYY-MM-DD) of the selected month
+function getSelectedRange() {
     const bulan = document.getElementById('bulan').value;
     const tahun = document.getElementById('tahun').value;
     const month = getMonthNumber(bulan);
     
     if (!bulan || !tahun || !month) {
+        return null;
+    }
+    
+    const startDate = new Date(tahun, month - 1, 1);
+    const endDate = new Date(tahun, month, 0);
+    return {
+        start: startDate.toISOString().split('T')[0],
+        end: endDate.toISOString().split('T')[0]
+    };
+}
+
+// Decode a /api/stats?format=grid response: one completed bitmask per
+// activity (bit i = start date + i days) and packed numeric values
+function applyActivityGrid(grid) {
+    const [year, month, day] = grid.start.split('-').map(Number);
+    grid.names.forEach((name, index) => {
+        const mask = grid.completed[index];
+        const values = grid.values[name];
+        for (let i = 0; i < grid.days; i++) {
+            const completed = ((mask >>> i) & 1) === 1;
+            const value = values ? values[i] : null;
+            // Cells were reset to empty/0 already
+            if (completed || value) {
+                applyActivityToCell(name, new Date(year, month - 1, day + i).getDate(), completed, value);
+            }
+        }
+    });
+}
+
+// Load activities for current month
+async function loadActivities() {
+    const range = getSelectedRange();
+    
+    if (!range) {
         console.error('Missing month or year');
         return;
     }
     
     try {
-        const startDate = new Date(tahun, month - 1, 1);
-        const endDate = new Date(tahun, month, 0);
-        
-        const response = await fetch(`/api/stats?start=${startDate.toISOString().split('T')[0]}&end=${endDate.toISOString().split('T')[0]}`);
+        const url = `/api/stats?start=${range.start}&end=${range.end}&format=grid`;
+        const cachedRange = activityRangeCache[url];
+        const response = await fetch(url, {
+            cache: 'no-store',
+            headers: cachedRange ? { 'If-None-Match': cachedRange.etag } : {}
+        });
         
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
+        let data;
+        if (response.status === 304 && cachedRange) {
+            // Nothing changed on the server since the last load
+            data = cachedRange.data;
+        } else {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            
+            data = await response.json();
+            const etag = response.headers.get('ETag');
+            if (etag && data.success) {
+                activityRangeCache[url] = { etag, data };
+            }
         }
-        
-        const data = await response.json();
         console.log('Loaded activities:', data);
         
         if (data.success) {
             // Reset all cells first
-            document.querySelectorAll('.clickable-cell').forEach(cell => {
-                const isNumeric = isNumericActivity(cell.dataset.activity);
-                if (isNumeric) {
-                    const input = cell.querySelector('input[type="number"]');
-                    if (input) {
-                        input.value = '0';
-                    }
-                } else {
-                    cell.classList.remove('table-success');
-                    cell.textContent = '';
-                }
-            });
+            resetActivityCells();
             
             // Update cells with activity data
-            data.activities.forEach(activity => {
-                const date = new Date(activity.date);
-                const cell = document.querySelector(`.clickable-cell[data-activity="${activity.name}"][data-date="${date.getDate()}"]`);
-                
-                if (cell) {
-                    const isNumeric = isNumericActivity(activity.name);
-                    if (isNumeric) {
-                        const input = cell.querySelector('input[type="number"]');
-                        if (input && activity.value !== null) {
-                            input.value = activity.value;
-                        }
-                    } else if (activity.completed) {
-                        cell.classList.add('table-success');
-                        cell.textContent = '✓';
-                    }
-                }
-            });
+            if (data.format === 'grid') {
+                applyActivityGrid(data);
+            } else {
+                data.activities.forEach(activity => {
+                    const date = new Date(activity.date);
+                    applyActivityToCell(activity.name, date.getDate(), activity.completed, activity.value);
+                });
+            }
+            
+            // Later changes of this range come from /api/sync
+            syncRange = `${range.start}:${range.end}`;
+            syncCursor = data.cursor || null;
         } else {
             throw new Error(data.message || 'Failed to load activities');
         }
@@ -331,6 +406,105 @@ async function loadActivities() {
     }
 }
 
+// Queue saves for /api/sync, each with an id the server deduplicates retries by
+function queueChanges(activities) {
+    activities.forEach(activity => {
+        const id = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+        // client_time lets the server keep the latest of merged writes
+        pendingChanges.push({ id, client_time: Date.now(), ...activity });
+    });
+    localStorage.setItem('pendingChanges', JSON.stringify(pendingChanges));
+}
+
+function forgetChanges(ids) {
+    const done = new Set(ids);
+    for (let i = pendingChanges.length - 1; i >= 0; i--) {
+        if (done.has(pendingChanges[i].id)) {
+            pendingChanges.splice(i, 1);
+        }
+    }
+    localStorage.setItem('pendingChanges', JSON.stringify(pendingChanges));
+}
+
+// Send queued saves and apply what changed on the server since the last sync
+function syncActivities() {
+    if (!syncInFlight) {
+        syncInFlight = runSync().finally(() => {
+            syncInFlight = null;
+        });
+    }
+    return syncInFlight;
+}
+
+async function runSync() {
+    const range = getSelectedRange();
+    if (!range) {
+        return;
+    }
+    const rangeKey = `${range.start}:${range.end}`;
+    
+    while (true) {
+        const changes = pendingChanges.slice(0, SYNC_BATCH_SIZE);
+        let response;
+        try {
+            response = await fetch('/api/sync', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-Requested-With': 'XMLHttpRequest'
+                },
+                body: JSON.stringify({
+                    start: range.start,
+                    end: range.end,
+                    cursor: syncRange === rangeKey ? syncCursor : null,
+                    changes
+                })
+            });
+        } catch (error) {
+            // Offline: the queue is sent again once the browser is back online
+            console.warn(`Sync failed, ${pendingChanges.length} changes queued:`, error);
+            return;
+        }
+        
+        const data = await response.json();
+        if (!response.ok || !data.success) {
+            if (response.status === 400 && syncCursor) {
+                // Cursor no longer accepted, fall back to a full sync
+                syncCursor = null;
+                continue;
+            }
+            throw new Error(data.message || `HTTP error! status: ${response.status}`);
+        }
+        console.log('Sync response:', data);
+        
+        Object.entries(data.rejected).forEach(([id, message]) => {
+            console.error('Change rejected by the server:', id, message);
+        });
+        const queued = pendingChanges.length;
+        forgetChanges([...data.applied, ...data.duplicates, ...Object.keys(data.rejected)]);
+        
+        if (data.full) {
+            resetActivityCells();
+        }
+        // Cells with saves still queued keep what the user entered
+        const pending = new Set(pendingChanges.map(change => `${change.name}_${change.date}`));
+        data.activities.forEach(activity => {
+            if (!pending.has(`${activity.name}_${activity.date}`)) {
+                setActivityCell(activity.name, parseInt(activity.date.split('-')[2]), activity.completed, activity.value);
+            }
+        });
+        syncRange = rangeKey;
+        syncCursor = data.cursor;
+        
+        // Stop once everything is sent, or if the server took none of the batch
+        if (!data.has_more && (pendingChanges.length === 0 || pendingChanges.length === queued)) {
+            return;
+        }
+    }
+}
+
 // Save progress to server
 async function saveProgress() {
     const bulan = document.getElementById('bulan').value;
@@ -379,34 +553,10 @@ async function saveProgress() {
     console.log('Activities to save:', activities);
 
     try {
-        console.log('Sending save request...');
-        const response = await fetch('/api/stats', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-Requested-With': 'XMLHttpRequest'
-            },
-            body: JSON.stringify({ activities })
-        });
-
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-        }
-
-        const data = await response.json();
-        console.log('Save response:', data);
-        
-        if (data.success) {
-            console.log('Activities saved successfully:', data.saved_activities);
-            // Clear modified cells after successful save
-            modifiedCells.clear();
-            
-            // Reload activities to show updated state
-            await loadActivities();
-        } else {
-            console.error('Failed to save activities:', data.message);
-            showError('Failed to save activities: ' + data.message);
-        }
+        // Queued before clearing, a failed sync is retried with the queue
+        queueChanges(activities);
+        modifiedCells.clear();
+        await syncActivities();
     } catch (error) {
         console.error('Error saving activities:', error);
         showError('Error saving activities: ' + error.message);
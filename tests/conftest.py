@@ -0,0 +1,102 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+# Configure the app before it is imported: SQLite test database, no cache
+_database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+_database.close()
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('TEST_DATABASE_URL', f'sqlite:///{_database.name}')
+
+from sqlalchemy import event, insert
+
+from app import (app as flask_app, db, User, Activity, DUMMY_ACTIVITY_PROFILES,
+                 activity_catalog, seed_activity_catalog, rebuild_streaks, rebuild_rollups)
+
+# History sizes every user route is measured at
+SHORT_HISTORY_DAYS = 1
+LONG_HISTORY_DAYS = 365
+PASSWORD = 'secret123'
+
+
+def create_user(username, class_name='CLASS-A', is_admin=False, history_days=0):
+    """User with ``history_days`` days of fully completed activities up to today."""
+    user = User(
+        username=username,
+        email=f'{username}@example.com',
+        full_name=username.title(),
+        student_number=username.upper()[:20],
+        class_name=class_name,
+        is_admin=is_admin,
+        is_active=True
+    )
+    user.set_password(PASSWORD)
+    db.session.add(user)
+    db.session.flush()
+
+    today = datetime.now().date()
+    now = datetime.now()
+    rows = [{
+        'user_id': user.id,
+        'activity_id': activity_catalog.id_of(name),
+        'date': today - timedelta(days=offset),
+        'completed': True,
+        'created_at': now,
+        'updated_at': now
+    } for offset in range(history_days) for name in DUMMY_ACTIVITY_PROFILES]
+    if rows:
+        db.session.execute(insert(Activity), rows)
+    rebuild_streaks(user.id)
+    rebuild_rollups(user.id)
+    db.session.commit()
+    return user.id
+
+
+@pytest.fixture(scope='session')
+def app():
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed_activity_catalog()
+        create_user('admin', class_name='ADMIN', is_admin=True)
+        create_user('short', history_days=SHORT_HISTORY_DAYS)
+        create_user('long', history_days=LONG_HISTORY_DAYS)
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    os.unlink(_database.name)
+
+
+@pytest.fixture
+def login(app):
+    """Test client logged in as the given user."""
+    def login(username):
+        client = app.test_client()
+        response = client.post('/login', data={'username': username, 'password': PASSWORD})
+        assert response.status_code == 302, f'login as {username} failed'
+        return client
+    return login
+
+
+@pytest.fixture
+def count_queries(app):
+    """Context manager collecting the SQL statements executed inside it."""
+    @contextmanager
+    def count_queries():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+    return count_queries
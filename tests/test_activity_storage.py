@@ -0,0 +1,89 @@
+"""The monthly storage answers every read exactly like the rows storage."""
+from datetime import datetime, timedelta
+
+import pytest
+
+import generate_data
+from app import db, User, ActivityMonth, RowStorage, MonthlyStorage, rebuild_rollups
+from migrate_storage import pack_user
+
+TODAY = datetime.now().date()
+RANGES = [
+    (TODAY, TODAY),
+    (TODAY - timedelta(days=6), TODAY),
+    (TODAY.replace(day=1), TODAY),
+    (TODAY - timedelta(days=45), TODAY - timedelta(days=20)),
+    (TODAY - timedelta(days=400), TODAY)
+]
+SAVES = [
+    {'name': 'Subuh', 'date': TODAY - timedelta(days=3), 'completed': False, 'value': None},
+    {'name': 'Dhuha', 'date': TODAY - timedelta(days=40), 'completed': False, 'value': None},
+    {'name': "Tilawah Qur'an", 'date': TODAY, 'completed': True, 'value': 12},
+    {'name': 'Olahraga', 'date': TODAY + timedelta(days=1), 'completed': True, 'value': None}
+]
+
+
+def entries(storage, user_id, start_date):
+    return sorted((entry.name, entry.date, bool(entry.completed), entry.value)
+                  for entry in storage.entries(user_id, start_date, TODAY))
+
+
+def snapshot(storage, user_id):
+    reads = {
+        'histories': {name: list(history) for name, history in storage.streak_histories(user_id).items()},
+        'today': storage.count_on(TODAY)
+    }
+    for start, end in RANGES:
+        reads[('analytics', start, end)] = storage.analytics(user_id, start, end)
+        reads[('entries', start, end)] = [
+            (entry.name, entry.date, bool(entry.completed), entry.value)
+            for entry in storage.entries(user_id, start, end)
+        ]
+        if (end - start).days < 31:
+            reads[('grid', start, end)] = storage.grid(user_id, start, end)
+    return reads
+
+
+@pytest.fixture
+def packed(app):
+    with app.app_context():
+        for user in User.query.all():
+            pack_user(user.id)
+        db.session.commit()
+        yield User.query.filter_by(username='long').one().id
+        db.session.rollback()
+        ActivityMonth.query.delete()
+        db.session.commit()
+
+
+def test_monthly_storage_matches_rows(packed):
+    rows, monthly = RowStorage(), MonthlyStorage()
+    assert snapshot(monthly, packed) == snapshot(rows, packed)
+
+    for storage in (rows, monthly):
+        storage.save(packed, SAVES)
+        storage.delete_range(packed, TODAY - timedelta(days=12), TODAY - timedelta(days=10))
+    # Analytics of whole months come from the rollups of the rows storage
+    rebuild_rollups(packed)
+    assert snapshot(monthly, packed) == snapshot(rows, packed)
+
+
+
+def test_generated_data_is_packed_with_monthly_storage(app, monkeypatch):
+    with app.app_context():
+        generate_data.generate(2, 40, 7, 1, 'genrows', 'secret123', 1, False)
+        monkeypatch.setattr(generate_data, 'activity_storage', MonthlyStorage())
+        generate_data.generate(2, 40, 7, 1, 'genmonths', 'secret123', 1, False)
+        # A day before the range, kept when the range is generated again
+        saved_user = User.query.filter_by(username='genmonths000000').one().id
+        before = {'name': "Tilawah Qur'an", 'date': TODAY - timedelta(days=40), 'completed': True, 'value': 5}
+        MonthlyStorage().save(saved_user, [before])
+        db.session.commit()
+        generate_data.generate(2, 40, 7, 1, 'genmonths', 'secret123', 1, False)
+
+        for index in range(2):
+            rows_user = User.query.filter_by(username=f'genrows{index:06d}').one().id
+            months_user = User.query.filter_by(username=f'genmonths{index:06d}').one().id
+            assert entries(MonthlyStorage(), months_user, TODAY - timedelta(days=39)) == \
+                entries(RowStorage(), rows_user, TODAY - timedelta(days=39))
+        assert ("Tilawah Qur'an", before['date'], True, 5) in entries(MonthlyStorage(), saved_user, before['date'])
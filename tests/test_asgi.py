@@ -0,0 +1,152 @@
+"""Async read path of asgi.py, on aiosqlite."""
+import asyncio
+import json
+import threading
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('aiosqlite')
+
+from sqlalchemy import event
+
+import app as app_module
+import asgi
+from cache import MemoryCache
+from write_buffer import WriteBuffer
+
+TODAY = datetime.now().date()
+MONTH_START = TODAY.replace(day=1)
+GRID = f'start={MONTH_START}&end={TODAY}&format=grid'
+
+
+def scope(method, path, query, cookie):
+    headers = [(b'host', b'localhost')]
+    if cookie:
+        headers.append((b'cookie', f'session={cookie}'.encode()))
+    if method == 'POST':
+        headers.append((b'content-type', b'application/json'))
+    return {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query.encode(),
+        'headers': headers,
+        'server': ('localhost', 80),
+        'client': ('127.0.0.1', 50000)
+    }
+
+
+async def call(method, path, query='', cookie=None, body=b''):
+    messages = []
+    received = []
+
+    async def receive():
+        if received:
+            return {'type': 'http.disconnect'}
+        received.append(True)
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi.application(scope(method, path, query, cookie), receive, send)
+    return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+
+@pytest.fixture(scope='module')
+def run():
+    """Serve call() arguments concurrently on one event loop, like a worker."""
+    loop = asyncio.new_event_loop()
+
+    async def gather(requests):
+        return await asyncio.gather(*(call(*request) for request in requests))
+
+    def run(*requests):
+        return loop.run_until_complete(gather(requests))
+    yield run
+    loop.run_until_complete(asgi.async_engine.dispose())
+    loop.close()
+
+
+@pytest.fixture
+def async_statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = asgi.async_engine.sync_engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def session_cookie(client):
+    return client.get_cookie('session').value
+
+
+def test_stats_read_through_the_async_engine(run, login, async_statements):
+    client = login('long')
+    expected = client.get(f'/api/stats?{GRID}').get_json()
+
+    [(status, body)] = run(('GET', '/api/stats', GRID, session_cookie(client)))
+
+    assert status == 200
+    data = json.loads(body)
+    assert {key: value for key, value in data.items() if key != 'cursor'} == \
+        {key: value for key, value in expected.items() if key != 'cursor'}
+    assert async_statements
+
+
+def test_concurrent_dashboard_reads(run, login):
+    cookie = session_cookie(login('long'))
+    responses = run(*[('GET', '/api/dashboard/stats', 'view_type=yearly', cookie)] * 20)
+
+    assert {status for status, _ in responses} == {200}
+    assert len({body for _, body in responses}) == 1
+
+
+def test_writes_and_other_routes_use_the_wsgi_app(run, login, async_statements):
+    cookie = session_cookie(login('short'))
+    save = json.dumps({'activities': [{'name': 'Subuh', 'date': TODAY.isoformat(), 'completed': True}]}).encode()
+
+    (saved, body), (anonymous, _) = run(
+        ('POST', '/api/stats', '', cookie, save),
+        ('GET', '/api/stats', GRID, None)
+    )
+
+    assert saved == 200
+    assert json.loads(body)['success'] is True
+    assert anonymous == 302
+    assert not [statement for statement in async_statements if statement.startswith('INSERT')]
+
+
+def test_blocking_calls_run_off_the_event_loop(run, login, monkeypatch):
+    threads = {}
+
+    def on_thread(name, function):
+        def call(*args, **kwargs):
+            threads.setdefault(name, set()).add(threading.current_thread())
+            return function(*args, **kwargs)
+        return call
+
+    dashboard_cache = MemoryCache(1024 * 1024)
+    buffer = WriteBuffer(app_module.flush_activity_writes, max_items=100, max_delay=60)
+    monkeypatch.setattr(dashboard_cache, 'get', on_thread('cache', dashboard_cache.get))
+    monkeypatch.setattr(dashboard_cache, 'set', on_thread('cache', dashboard_cache.set))
+    monkeypatch.setattr(buffer, 'flush', on_thread('buffer', buffer.flush))
+    monkeypatch.setattr(app_module.metrics, 'inc', on_thread('metrics', app_module.metrics.inc))
+    monkeypatch.setattr(app_module, 'dashboard_cache', dashboard_cache)
+    monkeypatch.setattr(app_module, 'write_buffer', buffer)
+    cookie = session_cookie(login('long'))
+    threads.clear()
+
+    responses = run(('GET', '/api/dashboard/stats', 'view_type=monthly', cookie), ('GET', '/api/stats', GRID, cookie))
+
+    assert {status for status, _ in responses} == {200}
+    assert set(threads) == {'cache', 'buffer', 'metrics'}
+    assert threading.main_thread() not in set().union(*threads.values())
@@ -0,0 +1,73 @@
+"""Expiry of dashboard cache entries."""
+import sqlite3
+from datetime import date
+
+import pytest
+
+import cache
+from cache import MemoryCache, SQLiteCache
+
+DAY = date(2024, 1, 1)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_cache(request, tmp_path):
+    def make_cache(ttl):
+        if request.param == 'memory':
+            return MemoryCache(1024, ttl)
+        return SQLiteCache(str(tmp_path / 'cache.db'), 1024, ttl)
+    return make_cache
+
+
+def test_entries_expire_after_ttl(make_cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    dashboard_cache = make_cache(60)
+    dashboard_cache.set('1:daily', 1, DAY, DAY, '{}')
+
+    now[0] += 59
+    assert dashboard_cache.get('1:daily') == '{}'
+    now[0] += 2
+    assert dashboard_cache.get('1:daily') is None
+
+
+def test_entries_without_ttl_stay_until_invalidated(make_cache):
+    dashboard_cache = make_cache(0)
+    dashboard_cache.set('1:daily', 1, DAY, DAY, '{}')
+    assert dashboard_cache.get('1:daily') == '{}'
+
+    dashboard_cache.invalidate(1, [DAY])
+    assert dashboard_cache.get('1:daily') is None
+
+
+def test_cache_file_without_expiry_is_recreated(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE entries (key TEXT PRIMARY KEY, user_id INTEGER NOT NULL, '
+                     'start_date TEXT NOT NULL, end_date TEXT NOT NULL, '
+                     'value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)')
+        conn.execute("INSERT INTO entries VALUES ('1:daily', 1, '2024-01-01', '2024-01-01', '{}', 2, 0)")
+
+    dashboard_cache = SQLiteCache(path, 1024, 60)
+    assert dashboard_cache.get('1:daily') is None
+    dashboard_cache.set('1:daily', 1, DAY, DAY, '{}')
+    assert dashboard_cache.get('1:daily') == '{}'
+
+
+def test_stale_payload_is_refused_after_invalidation(make_cache):
+    dashboard_cache = make_cache(0)
+    generation = dashboard_cache.generation(1)
+    # A write commits and invalidates while the reader computes its payload
+    dashboard_cache.invalidate(1, [DAY])
+    dashboard_cache.set('1:daily', 1, DAY, DAY, '{"stale": true}', generation)
+    assert dashboard_cache.get('1:daily') is None
+    assert dashboard_cache.stats()['refused'] == 1
+
+    generation = dashboard_cache.generation(1)
+    dashboard_cache.invalidate(2)
+    dashboard_cache.set('1:daily', 1, DAY, DAY, '{}', generation)
+    assert dashboard_cache.get('1:daily') == '{}'
+
+    dashboard_cache.clear()
+    dashboard_cache.set('1:daily', 1, DAY, DAY, '{"stale": true}', generation)
+    assert dashboard_cache.get('1:daily') is None
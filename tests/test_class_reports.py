@@ -0,0 +1,38 @@
+"""GET /admin/reports."""
+from datetime import datetime
+
+TODAY = datetime.now().date()
+REPORT = f'/admin/reports?class_name=CLASS-A&month={TODAY:%Y-%m}'
+
+
+def test_class_report_has_a_page_per_student(login):
+    response = login('admin').get(REPORT)
+
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert page.count('class="report"') >= 2
+    assert 'Short' in page and 'Long' in page
+
+
+def test_class_report_is_cached_until_the_data_changes(login, count_queries):
+    client = login('admin')
+    first = client.get(REPORT).get_data(as_text=True)
+    with count_queries() as statements:
+        second = client.get(REPORT).get_data(as_text=True)
+    # Students and data version only, the activities are not read again
+    assert second == first
+    assert len(statements) <= 2
+
+    response = login('short').post('/api/stats', json={'activities': [
+        {'name': 'Rowatib', 'date': TODAY.isoformat(), 'completed': True, 'value': 11}
+    ]})
+    assert response.status_code == 200
+    assert '<td>11</td>' in client.get(REPORT).get_data(as_text=True)
+
+
+def test_class_report_rejects_bad_requests(login):
+    assert login('short').get(REPORT).status_code == 302
+    client = login('admin')
+    assert client.get('/admin/reports').status_code == 200
+    assert client.get('/admin/reports?class_name=CLASS-A&month=june').status_code == 302
+    assert client.get(f'/admin/reports?class_name=EMPTY&month={TODAY:%Y-%m}').status_code == 302
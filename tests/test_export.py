@@ -0,0 +1,49 @@
+"""GET /api/admin/export."""
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from app import DUMMY_ACTIVITY_PROFILES, EXPORT_FIELDS, User
+
+TODAY = datetime.now().date()
+
+
+def export(client, **params):
+    params.setdefault('start', (TODAY - timedelta(days=400)).isoformat())
+    params.setdefault('end', TODAY.isoformat())
+    response = client.get('/api/admin/export', query_string=params)
+    return response, response.get_data(as_text=True)
+
+
+def test_export_csv_of_one_user(app, login):
+    with app.app_context():
+        short = User.query.filter_by(username='short').one()
+    response, body = export(login('admin'), user_id=short.id)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.reader(io.StringIO(body)))
+    assert tuple(rows[0]) == EXPORT_FIELDS
+    assert sorted(row[3] for row in rows[1:]) == sorted(DUMMY_ACTIVITY_PROFILES)
+    assert {(row[0], row[4], row[5]) for row in rows[1:]} == {('short', TODAY.isoformat(), '1')}
+
+
+def test_export_ndjson_of_a_class_streams_in_one_query(login, count_queries):
+    client = login('admin')
+    with count_queries() as statements:
+        response, body = export(client, format='ndjson', class_name='CLASS-A')
+
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert {'short', 'long'} <= {row['username'] for row in rows}
+    assert {row['class_name'] for row in rows} == {'CLASS-A'}
+    assert len(statements) <= 1
+
+
+def test_export_rejects_bad_requests(login):
+    assert export(login('short'))[0].status_code == 403
+    client = login('admin')
+    assert export(client, format='xml')[0].status_code == 400
+    assert export(client, start='yesterday')[0].status_code == 400
+    assert export(client, start=TODAY.isoformat(), end=(TODAY - timedelta(days=1)).isoformat())[0].status_code == 400
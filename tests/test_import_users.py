@@ -0,0 +1,58 @@
+"""POST /admin/users/import."""
+import io
+
+from app import Activity, User, DEFAULT_USER_ACTIVITIES
+
+HEADER = 'username,email,password,full_name,student_number,class_name\n'
+
+
+def students(prefix, count):
+    return ''.join(f'{prefix}{i},{prefix}{i}@example.com,secret123,Student {i},{prefix.upper()}{i},CLASS-C\n'
+                   for i in range(count))
+
+
+def upload(client, body, **form):
+    data = dict(form, file=(io.BytesIO(body.encode('utf-8')), 'students.csv'))
+    return client.post('/admin/users/import', data=data, content_type='multipart/form-data')
+
+
+def test_import_creates_valid_lines_and_reports_the_rest(app, login):
+    body = HEADER + students('imp', 3) + 'imp0,other@example.com,secret123,Again,X,CLASS-C\n' \
+        + 'short,new@example.com,secret123,Taken,X,CLASS-C\n' + 'broken,not-an-email,,Broken,X,CLASS-C\n'
+    response = upload(login('admin'), body)
+
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'username appears more than once in the file' in page
+    assert 'username already exists' in page
+    assert 'password is required' in page
+    with app.app_context():
+        created = User.query.filter(User.username.like('imp%')).all()
+        assert sorted(user.username for user in created) == ['imp0', 'imp1', 'imp2']
+        assert not any(user.is_admin for user in created)
+        assert Activity.query.filter_by(user_id=created[0].id).count() == len(DEFAULT_USER_ACTIVITIES)
+    login('imp1')
+
+
+def test_import_dry_run_creates_nothing(app, login):
+    response = upload(login('admin'), HEADER + students('dry', 2), dry_run='on')
+
+    assert response.status_code == 200
+    with app.app_context():
+        assert User.query.filter(User.username.like('dry%')).count() == 0
+
+
+def test_import_statements_do_not_grow_with_the_file(login, count_queries):
+    client = login('admin')
+    with count_queries() as few:
+        upload(client, HEADER + students('few', 2))
+    with count_queries() as many:
+        upload(client, HEADER + students('many', 20))
+    assert len(many) <= len(few)
+
+
+def test_import_needs_every_column(login):
+    response = upload(login('admin'), 'username,email\nx,x@example.com\n')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/admin/users/import')
+    assert upload(login('short'), HEADER).headers['Location'].endswith('/')
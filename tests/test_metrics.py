@@ -0,0 +1,24 @@
+"""Prometheus text rendering of the request metrics."""
+import pytest
+
+from metrics import Metrics, SQLiteMetrics
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def metrics(request, tmp_path):
+    if request.param == 'memory':
+        return Metrics()
+    return SQLiteMetrics(str(tmp_path / 'metrics.db'))
+
+
+def test_large_counters_keep_every_digit(metrics):
+    metrics.inc('tracker_requests_total', 1234567, route='/', method='GET')
+    before = metrics.render()
+    metrics.inc('tracker_requests_total', route='/', method='GET')
+    metrics.observe('tracker_request_db_seconds', 0.0123456789, (0.01, 0.1), route='/', method='GET')
+    rendered = metrics.render()
+
+    assert 'tracker_requests_total{method="GET",route="/"} 1234567\n' in before
+    assert 'tracker_requests_total{method="GET",route="/"} 1234568\n' in rendered
+    assert '_sum{' in rendered and ' 0.0123456789\n' in rendered
+    assert 'le="0.01"} 0\n' in rendered and 'le="0.1"} 1\n' in rendered
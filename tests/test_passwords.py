@@ -0,0 +1,43 @@
+"""Bounded password hashing and the rehash at login."""
+import threading
+
+import pytest
+
+import app as app_module
+from app import User, db
+from passwords import PasswordHasher, PasswordHasherBusy, hash_cost
+
+
+def test_operations_beyond_the_concurrency_are_refused(monkeypatch):
+    hasher = PasswordHasher(rounds=4, concurrency=1)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_hash(password, rounds):
+        started.set()
+        release.wait(5)
+        return 'hash'
+
+    monkeypatch.setattr('passwords._hash', slow_hash)
+    thread = threading.Thread(target=hasher.hash, args=('secret123',))
+    thread.start()
+    started.wait(5)
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash('secret123')
+    release.set()
+    thread.join()
+
+    monkeypatch.undo()
+    assert hash_cost(hasher.hash('secret123')) == 4
+
+
+def test_login_upgrades_the_hash_cost(app, login):
+    with app.app_context():
+        user = User.query.filter_by(username='short').one()
+        user.password_hash = PasswordHasher(rounds=5).hash('secret123')
+        db.session.commit()
+
+    login('short')
+
+    with app.app_context():
+        password_hash = User.query.filter_by(username='short').one().password_hash
+        assert hash_cost(password_hash) == app_module.password_hasher.rounds
@@ -0,0 +1,60 @@
+"""Cached statements of the hot query set bind every value per call."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from app import db, hot_queries, Activity, ActivityStats, ALL_ACTIVITIES, User, activity_catalog
+
+TODAY = datetime.now().date()
+RANGES = [
+    (None, None),
+    (TODAY, TODAY),
+    (TODAY - timedelta(days=6), TODAY),
+    (TODAY - timedelta(days=400), TODAY - timedelta(days=30))
+]
+
+
+def legacy_activities(user_id, start_date, end_date):
+    query = Activity.query.filter(Activity.user_id == user_id)
+    if start_date is not None:
+        query = query.filter(Activity.date >= start_date)
+    if end_date is not None:
+        query = query.filter(Activity.date <= end_date)
+    return query.order_by(Activity.date, Activity.id).all()
+
+
+def test_statements_match_the_query_api(app):
+    with app.app_context():
+        for username in ('short', 'long', 'admin'):
+            user = db.session.scalars(hot_queries.user_by_username(username)).one()
+            assert user == User.query.filter_by(username=username).one()
+
+            for start, end in RANGES:
+                activities = db.session.scalars(hot_queries.activities(user.id, start, end)).all()
+                assert sorted(activities, key=lambda a: (a.date, a.id)) == legacy_activities(user.id, start, end)
+                if start is None:
+                    continue
+                assert tuple(db.session.execute(hot_queries.range_version(user.id, start, end)).one()) == tuple(
+                    db.session.query(func.count(), func.max(Activity.id), func.max(Activity.updated_at)).filter(
+                        Activity.user_id == user.id, Activity.date >= start, Activity.date <= end
+                    ).one())
+
+            streak = db.session.scalars(hot_queries.streak(user.id, ALL_ACTIVITIES)).first()
+            assert streak == ActivityStats.query.filter_by(user_id=user.id, activity_name=ALL_ACTIVITIES).first()
+
+
+def test_in_lists_expand_per_call(app):
+    with app.app_context():
+        user_id = db.session.scalars(hot_queries.user_by_username('long')).one().id
+        definitions = activity_catalog.definitions()
+        for count, days in ((1, 1), (3, 7), (len(definitions), 30)):
+            activity_ids = [definition['id'] for definition in definitions[:count]]
+            dates = [TODAY - timedelta(days=offset) for offset in range(days)]
+            rows = db.session.execute(hot_queries.stored_completion(user_id, activity_ids, dates)).all()
+            assert len(rows) == Activity.query.filter(
+                Activity.user_id == user_id, Activity.activity_id.in_(activity_ids), Activity.date.in_(dates)
+            ).count()
+            assert {row.date for row in db.session.execute(hot_queries.daily_completion(user_id, dates))} == {
+                day for (day,) in db.session.query(Activity.date).filter(
+                    Activity.user_id == user_id, Activity.date.in_(dates)).distinct()
+            }
@@ -0,0 +1,118 @@
+"""Query-count budgets per route.
+
+Each route declares the most SQL statements it may run. User routes run as a
+user with one day and one with a year of history, admin routes before and
+after more users with a year of history are added; in both cases the larger
+dataset must not need more statements. /generate-dummy-data and
+/reset-activities-table are left out, they rewrite the whole activities table.
+"""
+import itertools
+from datetime import datetime
+
+import pytest
+
+from app import User
+from conftest import create_user
+
+TODAY = datetime.now().date()
+MONTH_START = TODAY.replace(day=1)
+SAVE = {'activities': [
+    {'name': 'Subuh', 'date': TODAY.isoformat(), 'completed': False},
+    {'name': 'Dhuha', 'date': MONTH_START.isoformat(), 'completed': True, 'value': None}
+]}
+SYNC = {'start': MONTH_START.isoformat(), 'end': TODAY.isoformat(), 'changes': [
+    {'id': 'budget-1', 'name': 'Subuh', 'date': TODAY.isoformat(), 'completed': False},
+    {'id': 'budget-2', 'name': 'Dhuha', 'date': MONTH_START.isoformat(), 'completed': True, 'value': None}
+]}
+
+# (name, method, path, keyword arguments of the test client call, status, budget)
+USER_ROUTES = [
+    ('index', 'GET', '/', {}, 200, 2),
+    ('dashboard', 'GET', '/dashboard', {}, 200, 0),
+    ('dashboard stats daily', 'GET', '/api/dashboard/stats?view_type=daily', {}, 200, 1),
+    ('dashboard stats weekly', 'GET', '/api/dashboard/stats?view_type=weekly', {}, 200, 1),
+    ('dashboard stats monthly', 'GET', '/api/dashboard/stats?view_type=monthly', {}, 200, 1),
+    ('dashboard stats yearly', 'GET', '/api/dashboard/stats?view_type=yearly', {}, 200, 1),
+    ('month json', 'GET', f'/api/stats?start={MONTH_START}&end={TODAY}', {}, 200, 2),
+    ('month grid', 'GET', f'/api/stats?start={MONTH_START}&end={TODAY}&format=grid', {}, 200, 2),
+    ('save', 'POST', '/api/stats', {'json': SAVE}, 200, 13),
+    ('sync pull', 'GET', f'/api/sync?start={MONTH_START}&end={TODAY}', {}, 200, 1),
+    ('sync push', 'POST', '/api/sync', {'json': SYNC}, 200, 15),
+    ('logout', 'GET', '/logout', {}, 302, 0),
+    ('metrics', 'GET', '/metrics', {}, 200, 0),
+]
+
+# Admin routes; {user_id} is replaced with the id of the 'short' user
+ADMIN_ROUTES = [
+    ('admin index', 'GET', '/', {}, 200, 3),
+    ('admin users', 'GET', '/admin/users', {}, 200, 2),
+    ('admin users filtered', 'GET', '/admin/users?class_name=CLASS-A&active=true&q=lo', {}, 200, 2),
+    ('admin users api', 'GET', '/api/admin/users?sort=username', {}, 200, 2),
+    ('admin cohorts', 'GET', '/api/admin/cohorts', {}, 200, 2),
+    ('admin cache', 'GET', '/api/admin/cache', {}, 200, 0),
+    ('admin user', 'GET', '/admin/users/{user_id}', {}, 200, 1),
+    ('admin edit user', 'POST', '/admin/users/{user_id}/edit', {'json': {'full_name': 'Short'}}, 200, 2),
+    ('admin toggle user', 'POST', '/admin/users/{user_id}/toggle', {}, 200, 2),
+    ('admin create user form', 'GET', '/create_user', {}, 200, 0),
+]
+
+_new_users = itertools.count()
+
+
+def run(client, count_queries, method, path, kwargs, status=200):
+    with count_queries() as statements:
+        response = client.open(path, method=method, **kwargs)
+    assert response.status_code == status, f'{method} {path} returned {response.status_code}'
+    return statements
+
+
+def check_budget(name, statements, budget):
+    if len(statements) > budget:
+        listing = '\n'.join(f'  {index}. {statement}' for index, statement in enumerate(statements, 1))
+        pytest.fail(f'{name} ran {len(statements)} statements, budget is {budget}:\n{listing}')
+
+
+@pytest.mark.parametrize('name, method, path, kwargs, status, budget', USER_ROUTES, ids=[route[0] for route in USER_ROUTES])
+def test_user_route_budget(login, count_queries, name, method, path, kwargs, status, budget):
+    short = run(login('short'), count_queries, method, path, kwargs, status)
+    long = run(login('long'), count_queries, method, path, kwargs, status)
+
+    check_budget(f'{name} (1 day of history)', short, budget)
+    check_budget(f'{name} (1 year of history)', long, budget)
+    assert len(long) <= len(short), f'{name} runs {len(short)} statements for 1 day and {len(long)} for 1 year'
+
+
+@pytest.mark.parametrize('name, method, path, kwargs, status, budget', ADMIN_ROUTES, ids=[route[0] for route in ADMIN_ROUTES])
+def test_admin_route_budget(app, login, count_queries, name, method, path, kwargs, status, budget):
+    with app.app_context():
+        path = path.format(user_id=User.query.filter_by(username='short').one().id)
+    client = login('admin')
+    before = run(client, count_queries, method, path, kwargs, status)
+    with app.app_context():
+        create_user(f'extra{next(_new_users)}', class_name='CLASS-B', history_days=365)
+    after = run(client, count_queries, method, path, kwargs, status)
+
+    check_budget(name, before, budget)
+    check_budget(f'{name} (more users)', after, budget)
+    assert len(after) <= len(before), f'{name} runs {len(before)} statements, {len(after)} with more users'
+
+
+def test_create_user_budget(login, count_queries):
+    client = login('admin')
+    form = {
+        'username': 'created',
+        'email': 'created@example.com',
+        'password': 'secret123',
+        'full_name': 'Created',
+        'student_number': 'CREATED',
+        'class_name': 'CLASS-A'
+    }
+    statements = run(client, count_queries, 'POST', '/create_user', {'data': form}, 302)
+    # Default activities of the new user are saved with a single upsert
+    check_budget('create user', statements, 5)
+
+
+def test_login_budget(app, count_queries):
+    client = app.test_client()
+    statements = run(client, count_queries, 'POST', '/login', {'data': {'username': 'long', 'password': 'secret123'}}, 302)
+    check_budget('login', statements, 1)
@@ -0,0 +1,133 @@
+"""Routing of read-only views to read replicas."""
+import itertools
+import shutil
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+import app as app_module
+from app import db
+from conftest import create_user
+from replicas import ReplicaRouter
+
+TODAY = datetime.now().date()
+
+_new_users = itertools.count()
+
+
+@pytest.fixture
+def replica(app, monkeypatch, tmp_path):
+    """Copy of the test database serving as the only replica."""
+    with app.app_context():
+        db.session.remove()
+        primary = db.engine.url.database
+        db.engine.dispose()
+    path = tmp_path / 'replica.db'
+    shutil.copyfile(primary, path)
+
+    engine = create_engine(f'sqlite:///{path}')
+    router = ReplicaRouter([engine], check_interval=60)
+    monkeypatch.setattr(app_module, 'replica_router', router)
+    monkeypatch.setitem(app.extensions, 'replica_router', router)
+    yield engine
+    engine.dispose()
+
+
+def logged_in(login, username):
+    client = login(username)
+    # Logging in is a write, start outside its sticky window
+    with client.session_transaction() as session:
+        session.pop('primary_until', None)
+    return client
+
+
+def completed_today(client):
+    response = client.get('/api/stats', query_string={'start': TODAY.isoformat(), 'end': TODAY.isoformat()})
+    assert response.status_code == 200
+    return sorted(activity['name'] for activity in response.get_json()['activities'] if activity['completed'])
+
+
+def test_reads_go_to_the_replica_and_writes_to_the_primary(app, login, replica):
+    username = f'replicated{next(_new_users)}'
+    with app.app_context():
+        user_id = create_user(username, history_days=1)
+    client = logged_in(login, username)
+
+    # Created after the copy: only the primary has the user's activities
+    assert completed_today(client) == []
+
+    response = client.post('/api/stats', json={'activities': [
+        {'name': 'Subuh', 'date': TODAY.isoformat(), 'completed': True}
+    ]})
+    assert response.status_code == 200
+    with replica.connect() as conn:
+        assert conn.execute(text('SELECT count(*) FROM users WHERE id = :id'), {'id': user_id}).scalar() == 0
+
+    # Read-after-write: the user's own reads stay on the primary for a while
+    assert 'Subuh' in completed_today(client)
+    with client.session_transaction() as session:
+        session['primary_until'] = 0
+    assert completed_today(client) == []
+
+
+def test_unhealthy_replica_falls_back_to_the_primary(app, login, monkeypatch, tmp_path):
+    username = f'fallback{next(_new_users)}'
+    with app.app_context():
+        create_user(username, history_days=1)
+    client = logged_in(login, username)
+
+    # A directory cannot be opened as a database
+    router = ReplicaRouter([create_engine(f'sqlite:///{tmp_path}')], check_interval=60)
+    monkeypatch.setattr(app_module, 'replica_router', router)
+    monkeypatch.setitem(app.extensions, 'replica_router', router)
+
+    assert completed_today(client) != []
+    assert router.stats()[0]['healthy'] is False
+
+
+def test_round_robin_skips_unhealthy_replicas(tmp_path):
+    first = create_engine(f"sqlite:///{tmp_path / 'first.db'}")
+    second = create_engine(f"sqlite:///{tmp_path / 'second.db'}")
+    broken = create_engine(f'sqlite:///{tmp_path}')
+    router = ReplicaRouter([first, broken, second], check_interval=60)
+
+    assert [router.choose() for _ in range(4)] == [first, second, second, first]
+    assert [replica['healthy'] for replica in router.stats()] == [True, False, True]
+
+
+def test_reads_of_a_request_stay_on_one_replica(app, login, monkeypatch, tmp_path):
+    username = f'pinned{next(_new_users)}'
+    with app.app_context():
+        create_user(username, history_days=1)
+        db.session.remove()
+        primary = db.engine.url.database
+        db.engine.dispose()
+    engines = []
+    for name in ('first.db', 'second.db'):
+        shutil.copyfile(primary, tmp_path / name)
+        engines.append(create_engine(f'sqlite:///{tmp_path / name}'))
+    router = ReplicaRouter(engines, check_interval=60)
+    monkeypatch.setattr(app_module, 'replica_router', router)
+    monkeypatch.setitem(app.extensions, 'replica_router', router)
+    client = logged_in(login, username)
+
+    used = []
+
+    def recorder(engine):
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement != 'SELECT 1':
+                used.append(engine)
+        return record
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', recorder(engine))
+    # The ETag aggregate and the grid rows are separate statements
+    for _ in range(2):
+        used.clear()
+        response = client.get('/api/stats', query_string={'start': TODAY.isoformat(), 'end': TODAY.isoformat(),
+                                                          'format': 'grid'})
+        assert response.status_code == 200
+        assert len(used) > 1 and len(set(used)) == 1
+    for engine in engines:
+        engine.dispose()
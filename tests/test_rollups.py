@@ -0,0 +1,45 @@
+"""Rollups moved by concurrent saves."""
+import itertools
+import threading
+import time
+from datetime import datetime
+
+from app import db, ActivityRollup, expected_rollups, parse_activity_item, write_activities
+from conftest import create_user
+
+TODAY = datetime.now().date()
+
+_new_users = itertools.count()
+
+
+def test_concurrent_saves_of_a_cell_count_it_once(app):
+    with app.app_context():
+        user_id = create_user(f'racer{next(_new_users)}')
+    written, release = threading.Event(), threading.Event()
+
+    def save(first):
+        with app.app_context():
+            if not first:
+                written.wait(5)
+            write_activities(user_id, [parse_activity_item({'name': 'Subuh', 'date': TODAY.isoformat(), 'completed': True})])
+            if first:
+                written.set()
+                release.wait(5)
+            db.session.commit()
+
+    threads = [threading.Thread(target=save, args=(first,)) for first in (True, False)]
+    for thread in threads:
+        thread.start()
+    written.wait(5)
+    # The second save is under way while the first is not committed yet
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        stored = {
+            (rollup.period, rollup.bucket, rollup.activity_name): (rollup.total, rollup.completed)
+            for rollup in ActivityRollup.query.filter_by(user_id=user_id)
+        }
+        assert stored == {key: tuple(value) for key, value in expected_rollups(user_id).items()}
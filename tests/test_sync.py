@@ -0,0 +1,126 @@
+"""GET and POST /api/sync."""
+import itertools
+from datetime import datetime
+
+import pytest
+
+import app as app_module
+from app import DUMMY_ACTIVITY_PROFILES
+from conftest import create_user
+from write_buffer import WriteBuffer
+
+TODAY = datetime.now().date()
+MONTH_START = TODAY.replace(day=1)
+RANGE = {'start': MONTH_START.isoformat(), 'end': TODAY.isoformat()}
+
+_new_users = itertools.count()
+
+
+@pytest.fixture
+def client(app, login, monkeypatch):
+    # Cursors follow the newest write, so a test sees exactly its own changes
+    monkeypatch.setattr(app_module, 'SYNC_SETTLE_SECONDS', 0)
+    username = f'sync{next(_new_users)}'
+    with app.app_context():
+        create_user(username, history_days=1)
+    return login(username)
+
+
+def push(client, changes, cursor=None):
+    response = client.post('/api/sync', json={**RANGE, 'cursor': cursor, 'changes': changes})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def change(client_id, name='Subuh', completed=False, value=None, day=TODAY):
+    return {'id': client_id, 'name': name, 'date': day.isoformat(), 'completed': completed, 'value': value}
+
+
+def test_pull_without_cursor_is_full(client):
+    data = client.get('/api/sync', query_string=RANGE).get_json()
+
+    assert data['full'] is True
+    assert data['has_more'] is False
+    assert sorted(activity['name'] for activity in data['activities']) == sorted(DUMMY_ACTIVITY_PROFILES)
+
+
+def test_pull_returns_only_changes_since_cursor(client):
+    cursor = client.get('/api/sync', query_string=RANGE).get_json()['cursor']
+    assert client.get('/api/sync', query_string={**RANGE, 'cursor': cursor}).get_json()['activities'] == []
+
+    data = push(client, [change('a1'), change('a2', name='Dhuha', day=MONTH_START, completed=True)], cursor)
+
+    assert data['full'] is False
+    assert data['applied'] == ['a1', 'a2']
+    assert sorted((activity['name'], activity['date'], activity['completed']) for activity in data['activities']) == [
+        ('Dhuha', MONTH_START.isoformat(), True),
+        ('Subuh', TODAY.isoformat(), False)
+    ]
+    assert client.get('/api/sync', query_string={**RANGE, 'cursor': data['cursor']}).get_json()['activities'] == []
+
+
+def test_stats_cursor_continues_from_the_load(client):
+    cursor = client.get('/api/stats', query_string={**RANGE, 'format': 'grid'}).get_json()['cursor']
+    push(client, [change('b1', completed=True)])
+
+    data = client.get('/api/sync', query_string={**RANGE, 'cursor': cursor}).get_json()
+    assert [activity['name'] for activity in data['activities']] == ['Subuh']
+
+
+def test_replayed_batch_is_applied_once(client):
+    assert push(client, [change('c1', completed=True)])['applied'] == ['c1']
+
+    data = push(client, [change('c1', completed=False), change('c2', name='Isya', completed=False)])
+
+    assert data['applied'] == ['c2']
+    assert data['duplicates'] == ['c1']
+    stored = {activity['name']: activity['completed'] for activity in data['activities'] if activity['date'] == TODAY.isoformat()}
+    assert stored['Subuh'] is True
+    assert stored['Isya'] is False
+
+
+def test_invalid_changes_are_rejected(client):
+    data = push(client, [change('d1', name='Unknown'), change('d2', completed=True)])
+    assert data['applied'] == ['d2']
+    assert data['rejected'] == {'d1': 'Unknown activity: Unknown'}
+
+    assert client.post('/api/sync', json={**RANGE, 'changes': [{'name': 'Subuh'}]}).status_code == 400
+    assert client.get('/api/sync', query_string={**RANGE, 'cursor': 'not a cursor'}).status_code == 400
+    assert client.get('/api/sync', query_string={'start': RANGE['start']}).status_code == 400
+
+
+def test_push_goes_through_the_write_buffer(client, monkeypatch):
+    buffer = WriteBuffer(app_module.flush_activity_writes, max_items=100, max_delay=60)
+    monkeypatch.setattr(app_module, 'write_buffer', buffer)
+
+    data = push(client, [change('buffered-1', completed=True)])
+    assert data['applied'] == ['buffered-1']
+    assert buffer.stats()['pending'] == 1
+    assert [a['completed'] for a in data['activities'] if a['name'] == 'Subuh' and a['date'] == TODAY.isoformat()][-1] is True
+
+    # A retry still in the buffer, then a newer change of the same cell
+    assert push(client, [change('buffered-1', completed=True)])['duplicates'] == ['buffered-1']
+    assert push(client, [change('buffered-2', completed=False)])['applied'] == ['buffered-2']
+    assert buffer.flush() == 1
+
+    # Both ids were claimed with the one merged write
+    data = push(client, [change('buffered-1', completed=True), change('buffered-2', completed=True)])
+    assert data['duplicates'] == ['buffered-1', 'buffered-2']
+    assert buffer.stats()['pending'] == 0
+    stored = client.get('/api/sync', query_string=RANGE).get_json()
+    assert [a['completed'] for a in stored['activities'] if a['name'] == 'Subuh' and a['date'] == TODAY.isoformat()] == [False]
+
+
+def test_retry_buffered_by_two_workers_is_written_once(client, monkeypatch):
+    first = WriteBuffer(app_module.flush_activity_writes, max_items=100, max_delay=60)
+    second = WriteBuffer(app_module.flush_activity_writes, max_items=100, max_delay=60)
+    monkeypatch.setattr(app_module, 'write_buffer', second)
+    push(client, [change('worker-1', completed=True)])
+    monkeypatch.setattr(app_module, 'write_buffer', first)
+    push(client, [change('worker-1', completed=True), change('worker-2', completed=False)])
+    first.flush()
+    second.flush()
+
+    # The retry of worker-1 flushed by the second worker is skipped, not written over worker-2
+    stored = client.get('/api/sync', query_string=RANGE).get_json()
+    assert [a['completed'] for a in stored['activities'] if a['name'] == 'Subuh' and a['date'] == TODAY.isoformat()] == [False]
@@ -0,0 +1,49 @@
+"""Cached identities of logged-in users."""
+import itertools
+
+import app as app_module
+from app import User, db
+from cache import SQLiteTTLCache
+from conftest import create_user
+
+_new_users = itertools.count()
+
+
+def test_shared_cache_drops_entries_for_every_worker(tmp_path):
+    path = str(tmp_path / 'users.db')
+    first, second = SQLiteTTLCache(path, 10, 60), SQLiteTTLCache(path, 10, 60)
+    first.set(1, {'id': 1, 'is_active': True})
+    assert second.get(1) == {'id': 1, 'is_active': True}
+
+    assert second.pop(1) == {'id': 1, 'is_active': True}
+    assert first.get(1) is None
+
+
+def test_shared_cache_expires_and_stays_bounded(tmp_path):
+    cache = SQLiteTTLCache(str(tmp_path / 'users.db'), 2, 60)
+    for key in range(3):
+        cache.set(key, key)
+    assert [cache.get(key) for key in range(3)] == [None, 1, 2]
+
+    expired = SQLiteTTLCache(str(tmp_path / 'users.db'), 2, -1)
+    expired.set(5, 5)
+    assert expired.get(5) is None
+
+
+def test_deactivation_logs_out_in_other_workers(app, login, monkeypatch, tmp_path):
+    path = str(tmp_path / 'users.db')
+    admin_worker, student_worker = SQLiteTTLCache(path, 10, 60), SQLiteTTLCache(path, 10, 60)
+    monkeypatch.setattr(app_module, 'user_identity_cache', student_worker)
+    username = f'cached{next(_new_users)}'
+    with app.app_context():
+        user_id = create_user(username)
+    student = login(username)
+    assert student.get('/api/dashboard/stats').status_code == 200
+
+    monkeypatch.setattr(app_module, 'user_identity_cache', admin_worker)
+    assert login('admin').post(f'/admin/users/{user_id}/toggle').status_code == 200
+    with app.app_context():
+        assert db.session.get(User, user_id).is_active is False
+
+    monkeypatch.setattr(app_module, 'user_identity_cache', student_worker)
+    assert student.get('/api/dashboard/stats').status_code == 302
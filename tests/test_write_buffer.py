@@ -0,0 +1,125 @@
+"""Write-behind buffer of activity saves."""
+import itertools
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as app_module
+from app import Activity, activity_catalog
+from conftest import create_user
+from write_buffer import WriteBuffer
+
+TODAY = datetime.now().date()
+YESTERDAY = TODAY - timedelta(days=1)
+
+_new_users = itertools.count()
+
+
+def item(name='Subuh', day=TODAY, completed=True, client_time=1):
+    return {'name': name, 'date': day, 'completed': completed, 'value': None, 'client_time': client_time}
+
+
+def test_newest_client_time_wins():
+    flushed = []
+    buffer = WriteBuffer(flushed.append, max_items=10, max_delay=60)
+    buffer.add(1, [item(completed=True, client_time=2)])
+    buffer.add(1, [item(completed=False, client_time=1)])  # Arrived late, written earlier
+    buffer.add(2, [item(completed=False, client_time=1)])
+
+    assert [entry['completed'] for entry in buffer.pending(1)] == [True]
+    assert buffer.flush(1) == 1
+    assert flushed == [{1: [item(completed=True, client_time=2)]}]
+    assert buffer.stats()['pending'] == 1
+
+
+def test_flushes_at_max_items():
+    flushed = []
+    buffer = WriteBuffer(flushed.append, max_items=2, max_delay=60)
+    buffer.add(1, [item(client_time=1)])
+    buffer.add(1, [item(client_time=2)])  # Same key, still one pending write
+    assert flushed == []
+
+    buffer.add(1, [item(day=YESTERDAY)])
+    assert [sorted(entry['date'] for entry in writes[1]) for writes in flushed] == [[YESTERDAY, TODAY]]
+    assert buffer.pending(1) == []
+
+
+def test_failed_flush_keeps_writes_unless_replaced():
+    database_up = False
+
+    def flush(writes):
+        if not database_up:
+            # A newer write arrives while the batch and its retries fail
+            buffer.add(1, [item(day=YESTERDAY, completed=False, client_time=5)])
+            raise RuntimeError('database is down')
+
+    buffer = WriteBuffer(flush, max_items=10, max_delay=60)
+    buffer.add(1, [item(client_time=1), item(day=YESTERDAY, client_time=1)])
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+    database_up = True
+
+    kept = {entry['date']: entry['completed'] for entry in buffer.pending(1)}
+    assert kept == {TODAY: True, YESTERDAY: False}
+    assert buffer.flush() == 2
+
+
+def test_failing_item_is_dropped_when_others_are_written():
+    flushed = []
+
+    def flush(writes):
+        if any(entry['value'] == 'bad' for items in writes.values() for entry in items):
+            raise ValueError('Value out of range')
+        flushed.append(writes)
+
+    buffer = WriteBuffer(flush, max_items=10, max_delay=60)
+    buffer.add(1, [item(), dict(item(day=YESTERDAY), value='bad')])
+    buffer.add(2, [item()])
+
+    assert buffer.flush() == 2
+    assert sorted(user_id for writes in flushed for user_id in writes) == [1, 2]
+    assert buffer.stats()['pending'] == 0
+
+
+def test_saves_are_buffered_and_read_back(app, login, monkeypatch):
+    buffer = WriteBuffer(app_module.flush_activity_writes, max_items=100, max_delay=60)
+    monkeypatch.setattr(app_module, 'write_buffer', buffer)
+    username = f'buffered{next(_new_users)}'
+    with app.app_context():
+        user_id = create_user(username)
+    client = login(username)
+
+    for completed, client_time in ((True, 1), (False, 3), (True, 2)):
+        response = client.post('/api/stats', json={'activities': [
+            {'name': 'Subuh', 'date': TODAY.isoformat(), 'completed': completed, 'client_time': client_time}
+        ]})
+        assert response.status_code == 200
+    with app.app_context():
+        assert Activity.query.filter_by(user_id=user_id).count() == 0
+
+    # The sync answer includes writes still in the buffer
+    data = client.get('/api/sync', query_string={'start': TODAY.isoformat(), 'end': TODAY.isoformat()}).get_json()
+    assert [(activity['name'], activity['completed']) for activity in data['activities']] == [('Subuh', False)]
+
+    # A load flushes the user's writes first
+    activities = client.get('/api/stats', query_string={'start': TODAY.isoformat(), 'end': TODAY.isoformat()}).get_json()['activities']
+    assert [(activity['name'], activity['completed']) for activity in activities] == [('Subuh', False)]
+    assert buffer.pending(user_id) == []
+    with app.app_context():
+        stored = Activity.query.filter_by(user_id=user_id).one()
+        assert (stored.activity_id, stored.completed) == (activity_catalog.id_of('Subuh'), False)
+
+
+def test_out_of_range_value_is_refused_before_buffering(app, login, monkeypatch):
+    buffer = WriteBuffer(app_module.flush_activity_writes, max_items=100, max_delay=60)
+    monkeypatch.setattr(app_module, 'write_buffer', buffer)
+    username = f'buffered{next(_new_users)}'
+    with app.app_context():
+        user_id = create_user(username)
+    client = login(username)
+
+    response = client.post('/api/stats', json={'activities': [
+        {'name': "Tilawah Qur'an", 'date': TODAY.isoformat(), 'completed': True, 'value': 99999}
+    ]})
+    assert response.status_code == 400
+    assert buffer.pending(user_id) == []
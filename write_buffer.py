@@ -0,0 +1,187 @@
+"""Write-behind buffer for activity saves.
+
+At prayer times many students tick boxes at once and every autosave used to
+commit a transaction of its own. ``WriteBuffer`` keeps validated writes in
+the worker process instead: repeated writes to the same (user, activity,
+day) are merged, the one with the newest client timestamp wins, and the
+merged writes are handed to ``flush`` in one batch once ``max_items`` keys
+are pending, ``max_delay`` seconds after the oldest pending write, and when
+the process exits.
+
+Trade-offs of turning it on:
+
+* writes pending in a worker are lost if the worker is killed (SIGKILL,
+  out of memory); a normal shutdown or ``--max-requests`` restart flushes;
+* other workers see a write only after it is flushed. The worker holding
+  it can read it back with ``pending()`` or flush a user before reading;
+* last write wins by client timestamp within a worker; across workers the
+  later flush wins.
+* a write the database refuses while the rest of its batch is written is
+  dropped and logged, so it cannot hold back the writes of other users.
+
+Items may carry ``client_ids``, e.g. the ids ``POST /api/sync`` deduplicates
+retries by; a merged write keeps the ids of every write it replaced, so
+``flush`` can record all of them with the one write that is stored.
+"""
+import atexit
+import os
+import threading
+import time
+
+
+class WriteBuffer:
+    """Pending writes of one process, keyed by (user id, activity name, date).
+
+    ``flush`` is called with {user_id: [item, ...]} and must write all of it
+    in one transaction or raise. A failed batch is retried item by item:
+    when some items are written the database is up, so the items failing
+    on their own are dropped and logged instead of blocking every later
+    flush. When every item fails they are all kept for the next flush,
+    unless newer writes replaced them meanwhile.
+    """
+
+    def __init__(self, flush, max_items=500, max_delay=1.0):
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self._flush = flush
+        self._lock = threading.Lock()
+        # Flushes run one at a time, so an older batch never commits after a newer one
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # (user_id, name, date) -> item
+        self._oldest = None  # monotonic time of the oldest pending write
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        atexit.register(self._flush_at_exit)
+
+    def add(self, user_id, items):
+        """Buffer validated items; each needs name, date and client_time."""
+        with self._lock:
+            for item in items:
+                self._keep((user_id, item['name'], item['date']), item)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                self._wakeup.set()
+            full = len(self._pending) >= self.max_items
+            self._start()
+        if full:
+            self.flush()
+
+    def pending(self, user_id, start_date=None, end_date=None):
+        """Buffered items of a user, optionally limited to a date range."""
+        with self._lock:
+            return [
+                item for (pending_user, _, day), item in self._pending.items()
+                if pending_user == user_id
+                and (start_date is None or day >= start_date)
+                and (end_date is None or day <= end_date)
+            ]
+
+    def flush(self, user_id=None):
+        """Write the pending items (only those of ``user_id`` if given), returning their number."""
+        with self._flush_lock:
+            with self._lock:
+                if user_id is None:
+                    batch, self._pending = self._pending, {}
+                else:
+                    batch = {key: item for key, item in self._pending.items() if key[0] == user_id}
+                    for key in batch:
+                        del self._pending[key]
+                if not self._pending:
+                    self._oldest = None
+            if not batch:
+                return 0
+
+            writes = {}
+            for (pending_user, _, _), item in batch.items():
+                writes.setdefault(pending_user, []).append(item)
+            try:
+                self._flush(writes)
+                return len(batch)
+            except Exception:
+                if len(batch) == 1:
+                    self._requeue(batch)
+                    raise
+                failed = self._flush_singly(batch)
+                if len(failed) == len(batch):
+                    self._requeue(batch)
+                    raise
+            for (pending_user, name, day), error in failed.items():
+                print(f"Write buffer dropped {name} on {day} of user {pending_user}: {str(error)}")
+            return len(batch) - len(failed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'max_items': self.max_items,
+                'max_delay': self.max_delay
+            }
+
+    def _flush_singly(self, batch):
+        """Write each item in its own transaction, returning {key: error} of the failed ones."""
+        failed = {}
+        for key, item in batch.items():
+            try:
+                self._flush({key[0]: [item]})
+            except Exception as e:
+                failed[key] = e
+        return failed
+
+    def _requeue(self, batch):
+        with self._lock:
+            for key, item in batch.items():
+                current = self._pending.get(key)
+                if current is None or current['client_time'] < item['client_time']:
+                    self._pending[key] = _merged(item, current)
+                else:
+                    self._pending[key] = _merged(current, item)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _keep(self, key, item):
+        current = self._pending.get(key)
+        if current is None or item['client_time'] >= current['client_time']:
+            self._pending[key] = _merged(item, current)
+        else:
+            self._pending[key] = _merged(current, item)
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Write buffer lost {self.stats()['pending']} writes at exit: {str(e)}")
+
+    def _start(self):
+        # One flusher thread per process, gunicorn workers must not rely on the master's
+        if self._thread is None or self._thread_pid != os.getpid():
+            self._thread = threading.Thread(target=self._run, name='write-buffer', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                oldest = self._oldest
+            if oldest is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            wait = oldest + self.max_delay - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Write buffer flush failed, {self.stats()['pending']} writes kept: {str(e)}")
+                time.sleep(self.max_delay)
+
+
+def _merged(item, replaced):
+    """``item``, also carrying the ``client_ids`` of the write it replaces."""
+    if replaced is None or not replaced.get('client_ids'):
+        return item
+    client_ids = list(item.get('client_ids', []))
+    client_ids.extend(client_id for client_id in replaced['client_ids'] if client_id not in client_ids)
+    return dict(item, client_ids=client_ids)